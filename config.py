@@ -1,4 +1,5 @@
 import os
+import re
 
 from dotenv import load_dotenv
 
@@ -19,7 +20,12 @@ class Config:
     # Базовый URL для формирования ссылок
     RSS_BASE_URL = "https://archiveofourown.gay/tags/{tag_id}/feed.atom"
 
+    # tag_id в URL ленты
+    FEED_TAG_PATTERN = re.compile(r"/tags/([^/]+)/feed")
+
     # Словарь RSS лент: {ID: "Описание тега"}
+    # Начальный список: рабочий список хранится в реестре лент в Redis
+    # (rss_parser/feed_registry.py) и заполняется отсюда через tools.feeds import
     RSS_FEEDS = {
         "31415212": "Russian Actor RPF",
         "64246090": "Икар - Круглов/Макуни | Icarus - Kruglov/Makuni",
@@ -41,14 +47,209 @@ class Config:
 
     CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", "30"))
 
+    # Минимальный промежуток между запросами лент внутри одной проверки (секунды)
+    FEED_DELAY_SECONDS = float(os.getenv("FEED_DELAY_SECONDS", "15"))
+
+    # Разбор лент: ao3 (потоковый, с остановкой на уже виденных записях)
+    # или feedparser (весь документ)
+    FEED_PARSER = os.getenv("FEED_PARSER", "ao3")
+
+    # HTTP клиент лент: httpx (общий пул соединений, сжатие) или urllib
+    FEED_HTTP_CLIENT = os.getenv("FEED_HTTP_CLIENT", "httpx")
+    FEED_CONNECT_TIMEOUT = float(os.getenv("FEED_CONNECT_TIMEOUT", "10"))
+    FEED_READ_TIMEOUT = float(os.getenv("FEED_READ_TIMEOUT", "30"))
+    # Максимальный размер ответа ленты после распаковки (байты)
+    FEED_MAX_BYTES = int(os.getenv("FEED_MAX_BYTES", str(5 * 1024 * 1024)))
+    FEED_USER_AGENT = os.getenv("FEED_USER_AGENT", "RMT_AO3_RSS/1.0")
+    # HTTP/2 (нужен пакет h2: uv sync --extra http)
+    FEED_HTTP2 = os.getenv("FEED_HTTP2", "false").lower() in ("1", "true", "yes")
+    FEED_MAX_CONNECTIONS = int(os.getenv("FEED_MAX_CONNECTIONS", "10"))
+
+    # Circuit breaker лент и хостов: после серии ошибок лента (или весь хост)
+    # пропускается с экспоненциально растущим сроком, затем - пробный запрос
+    BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    BREAKER_FEED_FAILURES = int(os.getenv("BREAKER_FEED_FAILURES", "3"))
+    BREAKER_HOST_FAILURES = int(os.getenv("BREAKER_HOST_FAILURES", "5"))
+    BREAKER_BASE_SECONDS = float(os.getenv("BREAKER_BASE_SECONDS", "600"))
+    BREAKER_MAX_SECONDS = float(os.getenv("BREAKER_MAX_SECONDS", "21600"))
+    # Пауза после сбоя цикла проверки: растет от base вдвое до интервала проверки
+    PARSER_ERROR_BACKOFF_SECONDS = float(
+        os.getenv("PARSER_ERROR_BACKOFF_SECONDS", "30")
+    )
+
+    # Контрольная точка цикла: после перезапуска цикл продолжается
+    # с первой непроверенной ленты
+    CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # Сколько ждать завершения начатой работы (лента, отправка) по SIGTERM/SIGINT
+    SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "25"))
+
+    # Конвейер цикла проверки: число обработчиков каждой стадии и размер
+    # очередей между стадиями. Загрузка по умолчанию в один поток: AO3 не любит
+    # параллельные запросы, а FEED_DELAY_SECONDS выдерживается между запросами
+    PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", "1"))
+    PIPELINE_PARSE_WORKERS = int(os.getenv("PIPELINE_PARSE_WORKERS", "2"))
+    PIPELINE_DIFF_WORKERS = int(os.getenv("PIPELINE_DIFF_WORKERS", "4"))
+    PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", "2"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "50"))
+
+    # Каталог для записи сырых ответов RSS лент (для replay), пусто - не записывать
+    FEED_RECORD_DIR = os.getenv("FEED_RECORD_DIR", "")
+
+    # Распределение лент между репликами парсера: single, lease или hash
+    PARSER_WORKER_MODE = os.getenv("PARSER_WORKER_MODE", "single")
+    # Идентификатор реплики (по умолчанию хост и PID)
+    PARSER_WORKER_ID = os.getenv("PARSER_WORKER_ID", "")
+    # Время жизни аренды ленты (0 - 90% интервала проверки)
+    FEED_LEASE_SECONDS = float(os.getenv("FEED_LEASE_SECONDS", "0"))
+    PARSER_HEARTBEAT_SECONDS = float(os.getenv("PARSER_HEARTBEAT_SECONDS", "30"))
+    PARSER_WORKER_TTL_SECONDS = float(os.getenv("PARSER_WORKER_TTL_SECONDS", "90"))
+
+    # Фильтр Блума известных работ: для работ, которых точно нет в Redis,
+    # метаданные не запрашиваются
+    BLOOM_ENABLED = os.getenv("BLOOM_ENABLED", "false").lower() in ("1", "true", "yes")
+    # Ожидаемое число работ и доля ложноположительных ответов при нем
+    BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", "200000"))
+    BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", "0.01"))
+    # Снимок фильтра на диске (пусто - не сохранять)
+    BLOOM_FILE = os.getenv("BLOOM_FILE", "known_works.bloom")
+
     # Количество дней для проверки повторных отправок
     DAYS_TO_CHECK = int(os.getenv("DAYS_TO_CHECK", "3"))
 
+    # Причины обновления, по которым работа попадает в очередь отправки
+    # (new, chapter, author, title, words, tags, summary); по остальным
+    # метаданные обновляются без сообщения в канал
+    NOTIFY_REASONS = os.getenv("NOTIFY_REASONS", "new,chapter,author")
+    # Сколько последних изменений метаданных хранить для работы (0 - не вести журнал)
+    CHANGE_LOG_SIZE = int(os.getenv("CHANGE_LOG_SIZE", "20"))
+
+    # Статистика: сколько дней хранить дневные счетчики обновлений и отправок
+    STATS_RETENTION_DAYS = int(os.getenv("STATS_RETENTION_DAYS", "90"))
+    # Как часто парсер сохраняет снимок статистики в stats:snapshot (0 - никогда)
+    STATS_SNAPSHOT_INTERVAL_SECONDS = int(
+        os.getenv("STATS_SNAPSHOT_INTERVAL_SECONDS", "300")
+    )
+
     # Интервал отправки сообщений (минуты)
     SEND_INTERVAL_SECONDS = int(os.getenv("SEND_INTERVAL_SECONDS", "5"))
 
+    # Транспорт очереди отправки: list (список Redis) или stream (Redis Stream
+    # с группой потребителей, подтверждением и перезахватом зависших элементов)
+    QUEUE_TRANSPORT = os.getenv("QUEUE_TRANSPORT", "list")
+    # Примерный предел длины потока (XADD MAXLEN ~)
+    QUEUE_STREAM_MAXLEN = int(os.getenv("QUEUE_STREAM_MAXLEN", "100000"))
+    # Через сколько миллисекунд неподтвержденный элемент забирает другой потребитель
+    QUEUE_CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", "300000"))
+    # После скольких доставок без подтверждения элемент удаляется
+    QUEUE_MAX_DELIVERIES = int(os.getenv("QUEUE_MAX_DELIVERIES", "5"))
+    # Количество потребителей очереди в одном процессе бота (только stream)
+    BOT_CONSUMERS = int(os.getenv("BOT_CONSUMERS", "1"))
+    # Имя потребителя в группе (по умолчанию хост и PID)
+    BOT_CONSUMER_NAME = os.getenv("BOT_CONSUMER_NAME", "")
+
+    # Подписки пользователей на фандомы, пейринги и персонажей (личные сообщения)
+    SUBSCRIPTIONS_ENABLED = os.getenv("SUBSCRIPTIONS_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # Максимум подписок у одного пользователя
+    SUBSCRIPTIONS_MAX_PER_USER = int(os.getenv("SUBSCRIPTIONS_MAX_PER_USER", "50"))
+    # Пауза между личными сообщениями (Telegram: не больше ~30 сообщений в секунду)
+    SUBSCRIPTIONS_SEND_INTERVAL_SECONDS = float(
+        os.getenv("SUBSCRIPTIONS_SEND_INTERVAL_SECONDS", "0.2")
+    )
+    # Принимать команды бота (getUpdates). Включайте только в одном процессе
+    # отправки: Telegram не дает нескольким клиентам читать обновления
+    BOT_COMMANDS_ENABLED = os.getenv("BOT_COMMANDS_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # Поисковый индекс работ (search:*): обновляется парсером при записи
+    # метаданных, запросы - команда /search и tools.search. После включения на
+    # существующих данных индекс строится командой rebuild
+    SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # Сколько работ показывать в ответе на /search
+    SEARCH_RESULTS_LIMIT = int(os.getenv("SEARCH_RESULTS_LIMIT", "10"))
+
+    # Роль процесса main.py: all (парсер и бот), parser или sender
+    PROCESS_ROLE = os.getenv("PROCESS_ROLE", "all")
+
+    # Backpressure: при переполнении очереди парсер реже опрашивает ленты
+    # и откладывает постановку работ с низкоприоритетными причинами обновления
+    BACKPRESSURE_ENABLED = os.getenv("BACKPRESSURE_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    BACKPRESSURE_QUEUE_DEPTH = int(os.getenv("BACKPRESSURE_QUEUE_DEPTH", "500"))
+    BACKPRESSURE_QUEUE_AGE_SECONDS = int(
+        os.getenv("BACKPRESSURE_QUEUE_AGE_SECONDS", "3600")
+    )
+    BACKPRESSURE_INTERVAL_MULTIPLIER = float(
+        os.getenv("BACKPRESSURE_INTERVAL_MULTIPLIER", "2")
+    )
+    BACKPRESSURE_DEFER_REASONS = os.getenv("BACKPRESSURE_DEFER_REASONS", "author")
+    # Сколько отложенных работ возвращать в очередь за цикл после разгрузки
+    BACKPRESSURE_RELEASE_BATCH = int(os.getenv("BACKPRESSURE_RELEASE_BATCH", "100"))
+
     # Логирование
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Формат вывода: text или json
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    # Сэмплирование INFO/DEBUG по логгерам: "rss_parser=0.1,telegram_bot.bot=0.25"
+    LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+    # Метрики Prometheus (HTTP эндпоинт /metrics)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+    # Мониторинг задержки event loop (поиск блокирующих вызовов)
+    LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    LOOP_MONITOR_INTERVAL_MS = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "500"))
+    LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "200"))
+
+    # Профилирование циклов по SIGUSR1 (PROFILE_CYCLES циклов на сигнал)
+    # или сразу после запуска (PROFILE_ON_START_CYCLES > 0)
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_CYCLES = int(os.getenv("PROFILE_CYCLES", "1"))
+    PROFILE_ON_START_CYCLES = int(os.getenv("PROFILE_ON_START_CYCLES", "0"))
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+    # Трассировка по work_id: экспорт в JSONL файл (file) или OTLP/HTTP коллектор (otlp)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")
+    TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+    TRACING_OTLP_ENDPOINT = os.getenv(
+        "TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+    )
 
     # Файл для хранения последних обработанных записей
     STATE_FILE = "bot_state.json"
@@ -60,13 +261,16 @@ class Config:
             cls.RSS_BASE_URL.format(tag_id=tag_id) for tag_id in cls.RSS_FEEDS.keys()
         ]
 
+    @classmethod
+    def get_feed_tag(cls, feed_url: str) -> str:
+        """Извлекает tag_id из URL RSS ленты (пустая строка, если это не лента тега)"""
+        match = cls.FEED_TAG_PATTERN.search(feed_url)
+        return match.group(1) if match else ""
+
     @classmethod
     def get_feed_description(cls, feed_url: str) -> str:
         """Получает описание тега по URL RSS ленты"""
-        for tag_id, description in cls.RSS_FEEDS.items():
-            if tag_id in feed_url:
-                return description
-        return "Unknown Feed"
+        return cls.RSS_FEEDS.get(cls.get_feed_tag(feed_url), "Unknown Feed")
 
     @classmethod
     def get_feed_info(cls) -> dict:
@@ -78,13 +282,19 @@ class Config:
         }
 
     @classmethod
-    def validate(cls):
-        """Проверяет корректность конфигурации"""
-        if not cls.TELEGRAM_BOT_TOKEN:
-            raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
-        if not cls.TELEGRAM_CHANNEL_ID:
-            raise ValueError("TELEGRAM_CHANNEL_ID не установлен")
-        if not cls.RSS_FEEDS:
+    def validate(cls, role: str = "all"):
+        """
+        Проверяет корректность конфигурации
+
+        Args:
+            role: all, parser или sender - проверяются только настройки этой роли
+        """
+        if role in ("all", "sender"):
+            if not cls.TELEGRAM_BOT_TOKEN:
+                raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
+            if not cls.TELEGRAM_CHANNEL_ID:
+                raise ValueError("TELEGRAM_CHANNEL_ID не установлен")
+        if role in ("all", "parser") and not cls.RSS_FEEDS:
             raise ValueError("RSS_FEEDS не настроены")
         if not cls.REDIS_URL:
             raise ValueError("REDIS_URL не установлен")
@@ -3,8 +3,12 @@
 Главный файл для запуска полной системы:
 - RSS парсер: проверяет RSS ленты и добавляет новые записи в очередь Redis
 - Telegram бот: обрабатывает очередь и отправляет сообщения в канал
+
+Парсер и бот общаются только через Redis и могут работать в разных процессах:
+роль процесса задается PROCESS_ROLE или ключом --role (all, parser, sender).
 """
 
+import argparse
 import asyncio
 import logging
 import signal
@@ -12,38 +16,98 @@ import sys
 from datetime import datetime
 
 from config import Config
+from rss_parser.backpressure import create_backpressure
+from rss_parser.checkpoint import create_checkpoint
+from rss_parser.circuit_breaker import Backoff, create_circuit_breaker
+from rss_parser.feed_registry import FeedRegistry
+from rss_parser.fetcher import create_http_fetcher
+from rss_parser.known_works import create_known_works
 from rss_parser.rss_parser import RSSParser
-from telegram_bot.bot import RSSBot
+from rss_parser.sharding import create_sharding
+from telegram_bot.bot import create_bot
+from utils.logging_config import setup_logging
+from utils.loop_monitor import LoopLagMonitor
+from utils.metrics import MetricsServer, metrics
+from utils.profiler import cycle_profiler
+from utils.redis_connector import redis_connector
+from utils.subscriptions import create_subscriptions
+from utils.tracing import tracer
 
 # Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, Config.LOG_LEVEL.upper()),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
+setup_logging(Config.LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
+CYCLE_SECONDS = metrics.histogram(
+    "rss_check_cycle_duration_seconds",
+    "Длительность цикла проверки всех лент",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+QUEUE_DEPTH = metrics.gauge("queue_depth", "Количество работ в очереди отправки")
+QUEUE_OLDEST_AGE = metrics.gauge(
+    "queue_oldest_item_age_seconds", "Возраст самого старого элемента очереди"
+)
+QUEUE_DEFERRED = metrics.gauge(
+    "queue_deferred_items", "Работы, отложенные парсером из-за backpressure"
+)
+QUEUE_PENDING = metrics.gauge(
+    "queue_pending_items", "Выданные потребителям, но не подтвержденные элементы"
+)
+
+
+async def collect_queue_metrics():
+    """Обновляет метрики очереди перед выдачей /metrics"""
+    QUEUE_DEPTH.set(await redis_connector.get_queue_length())
+    QUEUE_OLDEST_AGE.set(await redis_connector.get_oldest_queue_age())
+    QUEUE_PENDING.set(await redis_connector.get_pending_count())
+    QUEUE_DEFERRED.set(await redis_connector.get_deferred_count())
+
 
 class RSSParserService:
     """Сервис для периодической проверки RSS лент"""
 
     def __init__(self):
         self.rss_parser = None
+        self.sharding = None
+        self.backpressure = None
+        self.registry = None
+        self.http_fetcher = None
+        self.consecutive_failures = 0
         self.running = False
         self.task = None
+        self.stats_task = None
+        # Прерывает ожидание следующего цикла при остановке
+        self._stop_event = asyncio.Event()
 
     async def initialize(self):
         """Инициализация сервиса"""
         try:
             logger.info("Инициализация RSS парсера...")
 
-            # Получаем URL лент из конфига
-            feed_urls = Config.get_rss_feed_urls()
-            logger.info(f"Настроено {len(feed_urls)} RSS лент")
-
-            # Создаем парсер
-            self.rss_parser = RSSParser(feed_urls)
+            # Список лент берется из реестра в Redis (или из конфига, пока он пуст)
+            self.registry = FeedRegistry(redis_connector)
+            await self.registry.refresh()
+            feed_urls = [feed.url for feed in self.registry.enabled_feeds()]
+            logger.info(
+                f"Настроено {len(feed_urls)} RSS лент (источник: {self.registry.source})"
+            )
+
+            # Создаем парсер (с координацией реплик, если она включена)
+            self.sharding = create_sharding(redis_connector)
+            self.backpressure = create_backpressure(redis_connector)
+            # Общий пул HTTP соединений на все ленты и циклы
+            self.http_fetcher = create_http_fetcher()
+            self.rss_parser = RSSParser(
+                feed_urls,
+                sharding=self.sharding,
+                backpressure=self.backpressure,
+                known_works=create_known_works(redis_connector),
+                registry=self.registry,
+                http_fetcher=self.http_fetcher,
+                breaker=create_circuit_breaker(redis_connector),
+                checkpoint=create_checkpoint(redis_connector, self.sharding),
+                subscriptions=create_subscriptions(redis_connector),
+            )
 
             logger.info("RSS парсер инициализирован успешно")
             return True
@@ -52,33 +116,44 @@ class RSSParserService:
             logger.error(f"Ошибка инициализации RSS парсера: {e}")
             return False
 
-    async def check_feeds(self):
-        """Проверка RSS лент на новые записи"""
+    async def check_feeds(self) -> bool:
+        """Проверка RSS лент на новые записи; False - цикл завершился ошибкой"""
         try:
             logger.info("Начинаем проверку RSS лент...")
             start_time = datetime.now()
 
-            # Получаем новые записи
-            new_entries = await self.rss_parser.get_new_entries()
+            # Записи приходят по мере обработки лент (уже в очереди отправки),
+            # список за весь цикл не накапливается
+            found = 0
+            async for entry in self.rss_parser.iter_new_entries():
+                found += 1
+                logger.info(
+                    f"  - {entry.get('title', 'Без названия')} (work_id: {entry.get('work_id')})"
+                )
 
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
+            CYCLE_SECONDS.observe(duration)
 
-            if new_entries:
+            if found:
                 logger.info(
-                    f"Найдено {len(new_entries)} новых/обновленных записей за {duration:.2f}с"
+                    f"Найдено {found} новых/обновленных записей за {duration:.2f}с"
                 )
-
-                # Логируем информацию о найденных записях
-                for entry in new_entries:
-                    logger.info(
-                        f"  - {entry.get('title', 'Без названия')} (work_id: {entry.get('work_id')})"
-                    )
             else:
                 logger.info(f"Новых записей не найдено за {duration:.2f}с")
+            return True
 
         except Exception as e:
             logger.error(f"Ошибка при проверке RSS лент: {e}")
+            return False
+
+    def _failure_delay(self) -> float:
+        """Пауза перед повтором после сбоя цикла: растет с каждым сбоем подряд"""
+        self.consecutive_failures += 1
+        backoff = Backoff(
+            Config.PARSER_ERROR_BACKOFF_SECONDS, Config.CHECK_INTERVAL_MINUTES * 60
+        )
+        return backoff.delay(self.consecutive_failures)
 
     async def run_periodic_check(self):
         """Запуск периодической проверки"""
@@ -88,34 +163,81 @@ class RSSParserService:
 
         while self.running:
             try:
-                await self.check_feeds()
-
-                # Ждем до следующей проверки
-                wait_seconds = Config.CHECK_INTERVAL_MINUTES * 60
-                logger.info(
-                    f"Ожидание {Config.CHECK_INTERVAL_MINUTES} минут до следующей проверки..."
-                )
+                async with cycle_profiler.profile("parser"):
+                    succeeded = await self.check_feeds()
+
+                if succeeded:
+                    self.consecutive_failures = 0
+                    # Ждем до следующей проверки (дольше, если бот не успевает)
+                    wait_seconds = self.registry.check_interval_minutes() * 60
+                    if self.backpressure:
+                        wait_seconds *= self.backpressure.interval_multiplier
+                    logger.info(
+                        f"Ожидание {wait_seconds / 60:.0f} минут до следующей проверки..."
+                    )
+                else:
+                    wait_seconds = self._failure_delay()
+                    logger.info(
+                        f"Повтор проверки через {wait_seconds:.0f} с "
+                        f"(сбоев подряд: {self.consecutive_failures})"
+                    )
 
-                await asyncio.sleep(wait_seconds)
+                await self._sleep(wait_seconds)
 
             except asyncio.CancelledError:
                 logger.info("Периодическая проверка отменена")
                 break
             except Exception as e:
                 logger.error(f"Ошибка в периодической проверке: {e}")
-                # При ошибке ждем 5 минут перед следующей попыткой
-                await asyncio.sleep(300)
+                await self._sleep(self._failure_delay())
+
+    async def run_stats_snapshots(self):
+        """Периодически сохраняет снимок статистики для дашбордов"""
+        interval = Config.STATS_SNAPSHOT_INTERVAL_SECONDS
+        while self.running:
+            try:
+                snapshot = await redis_connector.save_stats_snapshot()
+                if snapshot:
+                    logger.debug(
+                        f"Снимок статистики: работ {snapshot['fanfic_metadata_count']}, "
+                        f"отправлено {snapshot['sent_messages_count']}"
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка снимка статистики: {e}")
+            await self._sleep(interval)
+
+    async def _sleep(self, seconds: float):
+        """Пауза между циклами, прерываемая request_stop"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def request_stop(self):
+        """Просит завершить текущую ленту и не начинать новых"""
+        self.running = False
+        self._stop_event.set()
+        if self.rss_parser:
+            self.rss_parser.request_stop()
 
     async def start(self):
         """Запуск сервиса"""
-        if not await self.initialize():
+        # FullSystemService уже инициализирует сервис: повторная инициализация
+        # создала бы второй HTTP клиент, а первый остался бы незакрытым
+        if self.rss_parser is None and not await self.initialize():
             return False
 
         self.running = True
+        if self.sharding:
+            await self.sharding.start()
         logger.info("RSS парсер сервис запущен")
 
         # Запускаем периодическую проверку
         self.task = asyncio.create_task(self.run_periodic_check())
+        if Config.STATS_SNAPSHOT_INTERVAL_SECONDS > 0:
+            self.stats_task = asyncio.create_task(self.run_stats_snapshots())
 
         try:
             await self.task
@@ -129,12 +251,18 @@ class RSSParserService:
         logger.info("Остановка RSS парсер сервиса...")
         self.running = False
 
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.task, self.stats_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        if self.sharding:
+            await self.sharding.stop()
+        if self.http_fetcher:
+            await self.http_fetcher.close()
 
         logger.info("RSS парсер сервис остановлен")
 
@@ -151,7 +279,7 @@ class BotService:
         """Инициализация бота"""
         try:
             logger.info("Инициализация Telegram бота...")
-            self.bot = RSSBot()
+            self.bot = create_bot()
             logger.info("Telegram бот инициализирован успешно")
             return True
         except Exception as e:
@@ -175,6 +303,12 @@ class BotService:
         finally:
             self.running = False
 
+    def request_stop(self):
+        """Просит завершить текущую отправку и не брать новых"""
+        self.running = False
+        if self.bot:
+            self.bot.request_stop()
+
     async def stop(self):
         """Остановка бота"""
         logger.info("Остановка Telegram бота...")
@@ -194,46 +328,75 @@ class BotService:
 
 
 class FullSystemService:
-    """Полная система: RSS парсер + Telegram бот"""
-
-    def __init__(self):
-        self.parser_service = RSSParserService()
-        self.bot_service = BotService()
+    """
+    Полная система: RSS парсер + Telegram бот
+
+    В роли parser или sender запускается только соответствующий сервис.
+    """
+
+    def __init__(self, role: str = "all"):
+        self.role = role
+        self.parser_service = RSSParserService() if role in ("all", "parser") else None
+        self.bot_service = BotService() if role in ("all", "sender") else None
+        self.metrics_server = None
+        self.loop_monitor = None
         self.running = False
+        self.drain_task = None
+        # Остановка по повторному сигналу (ссылка держит задачу до завершения)
+        self.stop_task = None
+
+    def _services(self):
+        """Сервисы, запускаемые в этой роли, с названиями для логов"""
+        services = []
+        if self.parser_service:
+            services.append(("RSS парсер сервис", self.parser_service))
+        if self.bot_service:
+            services.append(("Telegram бот сервис", self.bot_service))
+        return services
 
     async def start(self):
         """Запуск полной системы"""
-        logger.info("Запуск полной системы: RSS парсер + Telegram бот")
+        logger.info(f"Запуск системы в роли {self.role}")
 
-        # Инициализируем оба сервиса
-        logger.info("Инициализация RSS парсер сервиса...")
-        if not await self.parser_service.initialize():
-            logger.error("Ошибка инициализации RSS парсер сервиса")
-            return False
-        logger.info("RSS парсер сервис инициализирован успешно")
+        # Инициализируем сервисы роли
+        for name, service in self._services():
+            logger.info(f"Инициализация: {name}...")
+            if not await service.initialize():
+                logger.error(f"Ошибка инициализации: {name}")
+                return False
+            logger.info(f"{name} инициализирован успешно")
 
-        logger.info("Инициализация Telegram бот сервиса...")
-        if not await self.bot_service.initialize():
-            logger.error("Ошибка инициализации Telegram бот сервиса")
-            return False
-        logger.info("Telegram бот сервис инициализирован успешно")
+        if Config.METRICS_ENABLED:
+            try:
+                metrics.add_collector(collect_queue_metrics)
+                self.metrics_server = MetricsServer(
+                    metrics, Config.METRICS_HOST, Config.METRICS_PORT
+                )
+                await self.metrics_server.start()
+            except Exception as e:
+                # Без метрик система продолжает работать
+                logger.error(f"Не удалось запустить сервер метрик: {e}")
+                self.metrics_server = None
 
-        self.running = True
+        if Config.LOOP_MONITOR_ENABLED:
+            self.loop_monitor = LoopLagMonitor(
+                interval=Config.LOOP_MONITOR_INTERVAL_MS / 1000,
+                threshold=Config.LOOP_LAG_THRESHOLD_MS / 1000,
+            )
+            await self.loop_monitor.start()
 
-        # Запускаем оба сервиса параллельно
-        logger.info("Запуск RSS парсер сервиса...")
-        parser_task = asyncio.create_task(self.parser_service.start())
+        self.running = True
 
-        logger.info("Запуск Telegram бот сервиса...")
-        bot_task = asyncio.create_task(self.bot_service.start())
+        # Запускаем сервисы параллельно
+        tasks = []
+        for name, service in self._services():
+            logger.info(f"Запуск: {name}...")
+            tasks.append(asyncio.create_task(service.start()))
 
         try:
-            # Ждем завершения обоих сервисов
+            # Ждем завершения сервисов
             logger.info("Ожидание завершения сервисов...")
 
-            # Создаем задачи для мониторинга
-            tasks = [parser_task, bot_task]
-
             while self.running:
                 try:
                     # Ждем завершения любого из сервисов
@@ -271,50 +434,121 @@ class FullSystemService:
         finally:
             await self.stop()
 
+    def request_drain(self, timeout: float):
+        """
+        Запускает плавную остановку по сигналу
+
+        Повторный сигнал во время плавной остановки останавливает систему сразу.
+        """
+        if self.drain_task is None:
+            self.drain_task = asyncio.create_task(self.drain(timeout))
+        elif self.stop_task is None:
+            logger.info("Повторный сигнал: останавливаем систему без ожидания")
+            self.stop_task = asyncio.create_task(self.stop())
+
+    async def drain(self, timeout: float):
+        """
+        Плавная остановка: сервисы дорабатывают начатую ленту или отправку
+
+        Проверенные ленты сохранены в контрольной точке цикла, поэтому после
+        перезапуска парсер продолжит с первой непроверенной. Что не успело
+        завершиться за timeout секунд, прерывается.
+        """
+        logger.info(
+            f"Плавная остановка: ждем завершения начатой работы до {timeout:.0f} с"
+        )
+        self.running = False
+        tasks = []
+        for _, service in self._services():
+            service.request_stop()
+            if service.task:
+                tasks.append(service.task)
+
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning(
+                    f"За {timeout:.0f} с не завершено задач: {len(pending)}, прерываем"
+                )
+        await self.stop()
+
     async def stop(self):
         """Остановка полной системы"""
         logger.info("Остановка полной системы...")
         self.running = False
 
-        await self.parser_service.stop()
-        await self.bot_service.stop()
+        for _, service in self._services():
+            await service.stop()
+
+        if self.metrics_server:
+            await self.metrics_server.stop()
+            self.metrics_server = None
+
+        if self.loop_monitor:
+            await self.loop_monitor.stop()
+            self.loop_monitor = None
+
+        # Досылаем оставшиеся спаны трассировки
+        await asyncio.to_thread(tracer.shutdown)
 
         logger.info("Полная система остановлена")
 
 
-async def main():
-    """Главная функция"""
-    logger.info("Запуск полной системы: RSS парсер + Telegram бот")
+async def main(role: str = "all"):
+    """
+    Главная функция
+
+    Args:
+        role: all - парсер и бот в одном процессе, parser - только парсер,
+            sender - только отправка из очереди
+    """
+    logger.info(f"Запуск системы в роли {role}")
 
     # Проверяем конфигурацию
     try:
-        Config.validate()
+        Config.validate(role)
         logger.info("Конфигурация валидна")
     except Exception as e:
         logger.error(f"Ошибка конфигурации: {e}")
         return 1
 
-    logger.info(f"Интервал проверки RSS: {Config.CHECK_INTERVAL_MINUTES} минут")
-    logger.info(f"Интервал отправки сообщений: {Config.SEND_INTERVAL_SECONDS} секунд")
-    logger.info(f"Дней для проверки повторных отправок: {Config.DAYS_TO_CHECK}")
+    if role in ("all", "parser"):
+        logger.info(f"Интервал проверки RSS: {Config.CHECK_INTERVAL_MINUTES} минут")
+        logger.info(f"Дней для проверки повторных отправок: {Config.DAYS_TO_CHECK}")
 
-    # Проверяем количество RSS лент
-    feed_urls = Config.get_rss_feed_urls()
-    logger.info(f"Настроено RSS лент: {len(feed_urls)}")
-    if not feed_urls:
-        logger.error("Не настроено ни одной RSS ленты!")
-        return 1
+        # Проверяем количество RSS лент
+        feed_urls = Config.get_rss_feed_urls()
+        logger.info(f"Настроено RSS лент: {len(feed_urls)}")
+        if not feed_urls:
+            logger.error("Не настроено ни одной RSS ленты!")
+            return 1
 
-    # Создаем полную систему
-    system = FullSystemService()
+    if role in ("all", "sender"):
+        logger.info(
+            f"Интервал отправки сообщений: {Config.SEND_INTERVAL_SECONDS} секунд"
+        )
+
+    # Создаем систему
+    system = FullSystemService(role)
+
+    # Настройка обработки сигналов для graceful shutdown: обработчики event
+    # loop выполняются в самом loop, поэтому могут создавать задачи
+    loop = asyncio.get_running_loop()
 
-    # Настройка обработки сигналов для graceful shutdown
-    def signal_handler(signum, frame):
+    def signal_handler(signum):
         logger.info(f"Получен сигнал {signum}, останавливаем систему...")
-        asyncio.create_task(system.stop())
+        system.request_drain(Config.SHUTDOWN_TIMEOUT_SECONDS)
 
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, signal_handler, signum)
+
+    # Профилирование следующих циклов по SIGUSR1 или сразу после запуска
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(
+            signal.SIGUSR1, cycle_profiler.arm, Config.PROFILE_CYCLES
+        )
+    if Config.PROFILE_ON_START_CYCLES > 0:
+        cycle_profiler.arm(Config.PROFILE_ON_START_CYCLES)
 
     try:
         logger.info("Начинаем запуск системы...")
@@ -336,10 +570,10 @@ async def main():
     return 0
 
 
-def cli_main():
-    """Точка входа для CLI"""
+def run(role: str) -> int:
+    """Запускает систему в указанной роли"""
     try:
-        exit_code = asyncio.run(main())
+        exit_code = asyncio.run(main(role))
         return exit_code
     except KeyboardInterrupt:
         logger.info("Программа прервана пользователем")
@@ -349,5 +583,28 @@ def cli_main():
         return 1
 
 
+def cli_main():
+    """Точка входа для CLI"""
+    parser = argparse.ArgumentParser(description="RSS парсер AO3 и Telegram бот")
+    parser.add_argument(
+        "--role",
+        choices=("all", "parser", "sender"),
+        default=Config.PROCESS_ROLE,
+        help="Что запускать в этом процессе (по умолчанию PROCESS_ROLE)",
+    )
+    args = parser.parse_args()
+    return run(args.role)
+
+
+def parser_main():
+    """Точка входа процесса парсера"""
+    return run("parser")
+
+
+def sender_main():
+    """Точка входа процесса отправки"""
+    return run("sender")
+
+
 if __name__ == "__main__":
     sys.exit(cli_main())
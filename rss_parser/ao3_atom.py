@@ -0,0 +1,214 @@
+"""
+Потоковый разбор Atom лент AO3
+
+Ленты тегов AO3 отсортированы от новых к старым, поэтому из каждой ленты нужны
+только записи новее отметки прошлой проверки. Разбор идет по мере чтения ответа
+(XMLPullParser), записи выдаются по одной, а чтение прекращается на первой
+записи старше отметки - остаток документа даже не загружается.
+Для документов, которые не удалось разобрать, используется feedparser.
+"""
+
+import logging
+import xml.etree.ElementTree as ET
+from typing import Collection, Iterable, Iterator, List, Optional
+
+import feedparser
+
+logger = logging.getLogger(__name__)
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+
+class AtomEntry(dict):
+    """Запись ленты с доступом к полям как у FeedParserDict: get, [] и атрибуты"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class ParsedFeed:
+    """Результат разбора ленты"""
+
+    def __init__(
+        self,
+        entries: List,
+        parser: str = "ao3",
+        bozo: bool = False,
+        bozo_exception: Optional[Exception] = None,
+        stopped_early: bool = False,
+        bytes_read: int = 0,
+        skipped: int = 0,
+    ):
+        self.entries = entries
+        self.parser = parser
+        self.bozo = bozo
+        self.bozo_exception = bozo_exception
+        # Чтение остановлено на записи старше отметки прошлой проверки
+        self.stopped_early = stopped_early
+        self.bytes_read = bytes_read
+        # Записи, отброшенные по отметке (уже виденные и запись остановки)
+        self.skipped = skipped
+
+
+def _text(element: ET.Element, tag: str) -> str:
+    child = element.find(ATOM_NS + tag)
+    return (child.text or "").strip() if child is not None else ""
+
+
+def _entry_from_element(element: ET.Element) -> AtomEntry:
+    """Собирает запись с теми же ключами, что отдает feedparser"""
+    link = ""
+    for link_element in element.iter(ATOM_NS + "link"):
+        if link_element.get("rel", "alternate") == "alternate":
+            link = link_element.get("href", "")
+            break
+
+    # Как feedparser: у работы соавторов author - последний из них, а имя
+    # автора без <name> берется у предыдущего
+    author = name = ""
+    for author_element in element.findall(ATOM_NS + "author"):
+        name = _text(author_element, "name") or name
+        email = _text(author_element, "email")
+        author = f"{name} ({email})" if name and email else name or email
+
+    # Как и feedparser, при отсутствии summary берем content
+    summary = _text(element, "summary") or _text(element, "content")
+
+    entry = AtomEntry(
+        id=_text(element, "id"),
+        title=_text(element, "title"),
+        link=link,
+        summary=summary,
+        updated=_text(element, "updated"),
+        published=_text(element, "published"),
+    )
+    if author:
+        entry["author"] = author
+    return entry
+
+
+def iter_atom_entries(chunks: Iterable[bytes], consumed: List[bytes]) -> Iterator:
+    """
+    Лениво выдает записи Atom по мере поступления частей документа
+
+    Args:
+        chunks: Части тела ответа
+        consumed: Список, в который складываются прочитанные части (для фолбэка)
+
+    Raises:
+        ET.ParseError: Документ некорректен или оборван
+    """
+    parser = ET.XMLPullParser(events=("end",))
+    for chunk in chunks:
+        consumed.append(chunk)
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            if element.tag == ATOM_NS + "entry":
+                yield _entry_from_element(element)
+                # Разобранные записи не держим в памяти
+                element.clear()
+    parser.close()
+    for _, element in parser.read_events():
+        if element.tag == ATOM_NS + "entry":
+            yield _entry_from_element(element)
+
+
+def _is_older(entry, stop_before: Optional[str]) -> bool:
+    # Даты AO3 в одном формате YYYY-MM-DDTHH:MM:SSZ, строки сравнимы напрямую
+    updated = entry.get("updated", "")
+    return bool(stop_before and updated and updated < stop_before)
+
+
+def _is_seen(entry, stop_before: Optional[str], seen_ids) -> bool:
+    # Запись ровно на отметке уже обработана, если ее id есть среди виденных
+    return bool(
+        seen_ids
+        and entry.get("updated", "") == stop_before
+        and entry.get("id", "") in seen_ids
+    )
+
+
+def parse_feed_stream(
+    chunks: Iterable[bytes],
+    stop_before: Optional[str] = None,
+    seen_ids: Collection[str] = (),
+) -> ParsedFeed:
+    """
+    Разбирает ленту AO3, останавливаясь на первой записи старше stop_before
+
+    Args:
+        chunks: Части тела ответа (генератор загрузчика)
+        stop_before: Отметка updated прошлой проверки; записи старше нее
+            не возвращаются, а чтение ответа прекращается
+        seen_ids: id записей, уже обработанных ровно на отметке stop_before
+
+    Returns:
+        ParsedFeed; при ошибке разбора - результат feedparser с bozo=True
+    """
+    chunk_iter = iter(chunks)
+    consumed: List[bytes] = []
+    entries = []
+    stopped_early = False
+    skipped = 0
+
+    try:
+        for entry in iter_atom_entries(chunk_iter, consumed):
+            if _is_older(entry, stop_before):
+                stopped_early = True
+                skipped += 1
+                break
+            if _is_seen(entry, stop_before, seen_ids):
+                skipped += 1
+                continue
+            entries.append(entry)
+    except ET.ParseError as e:
+        logger.warning(f"Потоковый разбор ленты не удался ({e}), используем feedparser")
+        body = b"".join(consumed) + b"".join(chunk_iter)
+        return parse_with_feedparser(body, stop_before, seen_ids, error=e)
+    finally:
+        # Прекращаем загрузку остатка документа
+        close = getattr(chunk_iter, "close", None)
+        if close:
+            close()
+
+    return ParsedFeed(
+        entries,
+        parser="ao3",
+        stopped_early=stopped_early,
+        bytes_read=sum(len(chunk) for chunk in consumed),
+        skipped=skipped,
+    )
+
+
+def parse_with_feedparser(
+    body: bytes,
+    stop_before: Optional[str] = None,
+    seen_ids: Collection[str] = (),
+    error: Optional[Exception] = None,
+) -> ParsedFeed:
+    """Разбирает документ feedparser'ом с той же отсечкой по отметке"""
+    feed = feedparser.parse(body)
+    entries = []
+    stopped_early = False
+    skipped = 0
+    for entry in feed.entries:
+        if _is_older(entry, stop_before):
+            stopped_early = True
+            skipped += 1
+            break
+        if _is_seen(entry, stop_before, seen_ids):
+            skipped += 1
+            continue
+        entries.append(entry)
+    return ParsedFeed(
+        entries,
+        parser="feedparser",
+        bozo=bool(feed.bozo) or error is not None,
+        bozo_exception=error or feed.get("bozo_exception"),
+        stopped_early=stopped_early,
+        bytes_read=len(body),
+        skipped=skipped,
+    )
@@ -0,0 +1,134 @@
+"""
+Backpressure между парсером и отправителем
+
+Парсер и бот могут работать в разных процессах и общаются только через Redis.
+Если бот не успевает (очередь слишком длинная или самый старый элемент слишком
+старый), парсер реже опрашивает ленты и откладывает постановку в очередь работ
+с низкоприоритетными причинами обновления. Отложенные работы возвращаются в
+очередь порциями, когда очередь разгрузится.
+"""
+
+import logging
+from typing import Iterable, Optional
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+from utils.schemas import UpdateReason
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_ACTIVE = metrics.gauge(
+    "parser_backpressure_active", "Включен ли backpressure парсера (0/1)"
+)
+DEFERRED_TOTAL = metrics.counter(
+    "parser_deferred_enqueues_total", "Работы, отложенные из-за backpressure"
+)
+RELEASED_TOTAL = metrics.counter(
+    "parser_deferred_released_total", "Отложенные работы, возвращенные в очередь"
+)
+
+
+class BackpressureController:
+    """
+    Следит за очередью отправки и решает, насколько агрессивно работать парсеру
+
+    Включается при превышении порога длины очереди или возраста самого старого
+    элемента, выключается только когда оба значения опустятся ниже половины
+    порога - чтобы не переключаться на каждом цикле.
+    """
+
+    def __init__(
+        self,
+        redis: RedisConnector,
+        max_depth: int = 500,
+        max_age_seconds: float = 3600,
+        interval_multiplier: float = 2.0,
+        defer_reasons: Iterable[str] = ("author",),
+        release_batch: int = 100,
+    ):
+        self.redis = redis
+        self.max_depth = max_depth
+        self.max_age_seconds = max_age_seconds
+        self.multiplier = interval_multiplier
+        self.defer_reasons = {reason.strip() for reason in defer_reasons if reason}
+        self.release_batch = release_batch
+        self.active = False
+
+    async def refresh(self) -> bool:
+        """Перечитывает состояние очереди и возвращает, включен ли backpressure"""
+        depth = await self.redis.get_queue_length()
+        age = await self.redis.get_oldest_queue_age()
+
+        if not self.active and (depth >= self.max_depth or age >= self.max_age_seconds):
+            self.active = True
+            logger.warning(
+                "Backpressure включен: в очереди %s элементов, старейшему %.0f с",
+                depth,
+                age,
+            )
+        elif (
+            self.active
+            and depth < self.max_depth / 2
+            and age < self.max_age_seconds / 2
+        ):
+            self.active = False
+            logger.info(
+                "Backpressure выключен: в очереди %s элементов, старейшему %.0f с",
+                depth,
+                age,
+            )
+
+        BACKPRESSURE_ACTIVE.set(1 if self.active else 0)
+        return self.active
+
+    @property
+    def interval_multiplier(self) -> float:
+        """Во сколько раз увеличить интервал проверки лент"""
+        return self.multiplier if self.active else 1.0
+
+    def should_defer(self, reason: UpdateReason) -> bool:
+        """Нужно ли отложить постановку работы с этой причиной обновления"""
+        return self.active and reason.value in self.defer_reasons
+
+    async def defer(self, work_id: str, meta: dict) -> bool:
+        """Откладывает работу до разгрузки очереди"""
+        DEFERRED_TOTAL.inc()
+        return await self.redis.defer_queue_item(work_id, meta)
+
+    async def release_deferred(self) -> int:
+        """Возвращает порцию отложенных работ в очередь, если очередь разгружена"""
+        if self.active:
+            return 0
+
+        released = 0
+        for work_id, meta in await self.redis.get_deferred(self.release_batch):
+            # За время ожидания работа могла уйти в канал по другой причине
+            if await self.redis.was_message_sent_recently(
+                work_id, Config.DAYS_TO_CHECK
+            ):
+                await self.redis.discard_deferred(work_id)
+                continue
+            # Не поставленная работа остается отложенной до следующей порции
+            if await self.redis.add_to_queue(work_id, meta):
+                await self.redis.discard_deferred(work_id)
+                released += 1
+
+        if released:
+            RELEASED_TOTAL.inc(released)
+            logger.info("Возвращено в очередь %s отложенных работ", released)
+        return released
+
+
+def create_backpressure(redis: RedisConnector) -> Optional[BackpressureController]:
+    """Создает контроллер по настройкам Config или None, если он выключен"""
+    if not Config.BACKPRESSURE_ENABLED:
+        return None
+    return BackpressureController(
+        redis,
+        max_depth=Config.BACKPRESSURE_QUEUE_DEPTH,
+        max_age_seconds=Config.BACKPRESSURE_QUEUE_AGE_SECONDS,
+        interval_multiplier=Config.BACKPRESSURE_INTERVAL_MULTIPLIER,
+        defer_reasons=Config.BACKPRESSURE_DEFER_REASONS.split(","),
+        release_batch=Config.BACKPRESSURE_RELEASE_BATCH,
+    )
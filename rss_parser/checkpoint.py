@@ -0,0 +1,148 @@
+"""
+Контрольная точка цикла проверки лент
+
+Цикл проверки всех лент длится минуты, и перезапуск посреди цикла (выкладка,
+падение) раньше начинал его с первой ленты. Теперь прогресс цикла лежит в
+хеше parser:checkpoint:{name}: время начала цикла и по каждой проверенной
+ленте - новая отметка и время проверки. Запущенный заново парсер продолжает
+незавершенный цикл с первой непроверенной ленты; успешный цикл удаляет
+контрольную точку.
+
+Контрольная точка старше интервала проверки не используется: к этому времени
+все ленты и так пора проверять заново.
+"""
+
+import json
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from config import Config
+from rss_parser.sharding import FeedSharding
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "parser:checkpoint:{name}"
+STARTED_FIELD = "started"
+FEED_FIELD_PREFIX = "feed:"
+
+CYCLE_RESUMES = metrics.counter(
+    "parser_cycle_resumes_total",
+    "Циклы проверки, продолженные с контрольной точки после перезапуска",
+)
+RESUMED_FEEDS = metrics.counter(
+    "parser_checkpoint_skipped_feeds_total",
+    "Ленты, пропущенные при продолжении цикла: проверены до перезапуска",
+)
+
+
+class CycleCheckpoint:
+    """Прогресс текущего цикла проверки в Redis"""
+
+    def __init__(self, redis: RedisConnector, name: str = "default"):
+        self.redis = redis
+        self.key = CHECKPOINT_KEY.format(name=name)
+        # Время начала текущего цикла (None - цикл не начат)
+        self.started: Optional[float] = None
+        # Проверенные в цикле ленты: метка -> {"watermark": ..., "checked_at": ...}
+        self.done: Dict[str, Dict] = {}
+
+    async def begin(
+        self, max_age_seconds: float, now: Optional[float] = None
+    ) -> Set[str]:
+        """
+        Начинает цикл или продолжает незавершенный
+
+        Args:
+            max_age_seconds: Контрольная точка старше этого срока отбрасывается
+                (обычно интервал проверки)
+
+        Returns:
+            Метки лент, уже проверенных в продолжаемом цикле
+        """
+        now = time.time() if now is None else now
+        try:
+            await self.redis._ensure_connected()
+            raw = await self.redis.redis.hgetall(self.key)
+        except Exception as e:
+            # Без контрольной точки цикл просто идет с начала
+            logger.error(f"Ошибка чтения контрольной точки цикла: {e}")
+            raw = {}
+
+        fields = {
+            (k.decode() if isinstance(k, bytes) else k): v for k, v in raw.items()
+        }
+        try:
+            started = float(fields.get(STARTED_FIELD) or 0)
+        except ValueError:
+            started = 0.0
+
+        done = {}
+        for field, value in fields.items():
+            if not field.startswith(FEED_FIELD_PREFIX):
+                continue
+            try:
+                done[field[len(FEED_FIELD_PREFIX) :]] = json.loads(value)
+            except ValueError:
+                continue
+
+        if started and now - started < max_age_seconds and done:
+            self.started, self.done = started, done
+            CYCLE_RESUMES.inc()
+            RESUMED_FEEDS.inc(len(done))
+            logger.info(
+                "Продолжаем цикл, начатый %.0f с назад: уже проверено лент %s",
+                now - started,
+                len(done),
+            )
+            return set(done)
+
+        self.started, self.done = now, {}
+        try:
+            async with self.redis.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.key)
+                pipe.hset(self.key, STARTED_FIELD, now)
+                # Брошенная контрольная точка (реплика больше не запускалась)
+                # удаляется сама
+                pipe.expire(self.key, int(max_age_seconds * 2) or 1)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки цикла: {e}")
+        return set()
+
+    async def feed_done(self, feed_label: str, watermark: Dict):
+        """Отмечает ленту проверенной в текущем цикле"""
+        state = {"watermark": watermark, "checked_at": time.time()}
+        self.done[feed_label] = state
+        try:
+            await self.redis._ensure_connected()
+            await self.redis.redis.hset(
+                self.key, FEED_FIELD_PREFIX + feed_label, json.dumps(state)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки ленты {feed_label}: {e}")
+
+    async def finish(self):
+        """Завершает цикл: следующий начнется с первой ленты"""
+        self.started, self.done = None, {}
+        try:
+            await self.redis._ensure_connected()
+            await self.redis.redis.delete(self.key)
+        except Exception as e:
+            logger.error(f"Ошибка удаления контрольной точки цикла: {e}")
+
+
+def create_checkpoint(
+    redis: RedisConnector, sharding: Optional[FeedSharding] = None
+) -> Optional[CycleCheckpoint]:
+    """
+    Создает контрольную точку по настройкам Config или None, если она выключена
+
+    У каждой реплики своя контрольная точка; чтобы реплика продолжала цикл
+    после перезапуска, ее PARSER_WORKER_ID должен быть постоянным.
+    """
+    if not Config.CHECKPOINT_ENABLED:
+        return None
+    return CycleCheckpoint(redis, sharding.worker_id if sharding else "default")
@@ -0,0 +1,266 @@
+"""
+Circuit breaker для лент и хостов
+
+Лента, которая раз за разом падает, и недоступный AO3 не должны съедать время
+каждого цикла на таймауты. Для каждой ленты (feed:{tag_id}) и каждого хоста
+(host:{hostname}) считается число ошибок подряд:
+
+- closed: запросы идут как обычно
+- open: после порога ошибок запросы не выполняются до open_until;
+  время блокировки растет экспоненциально с каждым повторным открытием
+- half_open: по истечении блокировки одна реплика делает пробный запрос;
+  успех закрывает breaker, ошибка снова открывает его на удвоенный срок
+
+Состояние хранится в Redis (feeds:breaker), поэтому переживает перезапуск и
+общее для всех реплик парсера.
+"""
+
+import json
+import logging
+import random
+import socket
+import time
+import urllib.error
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+BREAKER_KEY = "feeds:breaker"
+PROBE_KEY = "feeds:breaker:probe:{key}"
+
+BREAKER_SKIPS = metrics.counter(
+    "feed_breaker_skips_total", "Ленты, пропущенные открытым breaker", ["scope"]
+)
+BREAKER_TRANSITIONS = metrics.counter(
+    "feed_breaker_transitions_total", "Переходы breaker между состояниями", ["to"]
+)
+BREAKER_OPEN = metrics.gauge(
+    "feed_breaker_open", "Открытые breaker лент и хостов", ["scope"]
+)
+
+
+class Backoff:
+    """Экспоненциальная задержка с разбросом: base, 2*base, 4*base ... до maximum"""
+
+    def __init__(self, base: float, maximum: float, jitter: float = 0.1):
+        self.base = base
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед попыткой attempt (с 1)"""
+        delay = min(self.maximum, self.base * 2 ** max(0, attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def is_host_failure(error: Exception) -> bool:
+    """
+    Ошибка говорит о проблеме хоста, а не конкретной ленты
+
+    Сюда относятся ошибки соединения, таймауты, 5xx и 429. Остальные ошибки
+    (например 404 удаленного тега) считаются только для ленты.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+    return isinstance(
+        error,
+        (
+            httpx.TransportError,
+            urllib.error.URLError,
+            socket.timeout,
+            TimeoutError,
+            ConnectionError,
+        ),
+    )
+
+
+class CircuitBreaker:
+    """Breaker лент и хостов с общим состоянием в Redis"""
+
+    def __init__(
+        self,
+        redis: RedisConnector,
+        feed_failures: int = 3,
+        host_failures: int = 5,
+        base_seconds: float = 600,
+        max_seconds: float = 6 * 3600,
+        probe_seconds: float = 120,
+    ):
+        self.redis = redis
+        self.feed_failures = feed_failures
+        self.host_failures = host_failures
+        self.backoff = Backoff(base_seconds, max_seconds)
+        # Сколько держится право на пробный запрос, если проба зависла
+        self.probe_seconds = probe_seconds
+        # Состояния по ключу feed:{tag_id} / host:{hostname}
+        self.states: Dict[str, Dict] = {}
+
+    @staticmethod
+    def feed_key(feed_url: str) -> str:
+        return f"feed:{Config.get_feed_tag(feed_url) or feed_url}"
+
+    @staticmethod
+    def host_key(feed_url: str) -> str:
+        return f"host:{urlsplit(feed_url).hostname or ''}"
+
+    async def refresh(self):
+        """Перечитывает состояние из Redis (в начале цикла)"""
+        try:
+            await self.redis._ensure_connected()
+            raw = await self.redis.redis.hgetall(BREAKER_KEY)
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния breaker: {e}")
+            return
+        self.states = {}
+        for key, value in raw.items():
+            key = key.decode() if isinstance(key, bytes) else key
+            try:
+                self.states[key] = json.loads(value)
+            except ValueError:
+                continue
+        self._update_gauge()
+
+    def _update_gauge(self):
+        for scope in ("feed", "host"):
+            BREAKER_OPEN.set(
+                sum(
+                    1
+                    for key, state in self.states.items()
+                    if key.startswith(scope + ":") and state.get("state") != "closed"
+                ),
+                scope=scope,
+            )
+
+    async def _save(self, key: str, state: Optional[Dict]):
+        try:
+            await self.redis._ensure_connected()
+            if state is None or state.get("state") == "open":
+                # Проба завершена - следующую можно будет сделать сразу по сроку
+                await self.redis.redis.delete(PROBE_KEY.format(key=key))
+            if state is None:
+                self.states.pop(key, None)
+                await self.redis.redis.hdel(BREAKER_KEY, key)
+            else:
+                self.states[key] = state
+                await self.redis.redis.hset(BREAKER_KEY, key, json.dumps(state))
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния breaker {key}: {e}")
+        self._update_gauge()
+
+    async def _check(self, key: str, now: float) -> bool:
+        state = self.states.get(key)
+        if not state or state.get("state") == "closed":
+            return True
+        if now < state.get("open_until", 0):
+            return False
+
+        # Блокировка истекла: пробный запрос делает только одна реплика
+        try:
+            await self.redis._ensure_connected()
+            won = await self.redis.redis.set(
+                PROBE_KEY.format(key=key),
+                1,
+                nx=True,
+                px=int(self.probe_seconds * 1000),
+            )
+        except Exception as e:
+            logger.error(f"Ошибка захвата пробы breaker {key}: {e}")
+            won = True
+        if not won:
+            return False
+        if state.get("state") != "half_open":
+            BREAKER_TRANSITIONS.inc(to="half_open")
+            logger.info("Breaker %s: пробный запрос", key)
+        await self._save(key, {**state, "state": "half_open"})
+        return True
+
+    def _blocked(self, key: str, now: float) -> bool:
+        state = self.states.get(key)
+        return bool(
+            state and state.get("state") == "open" and now < state.get("open_until", 0)
+        )
+
+    async def allow(self, feed_url: str) -> bool:
+        """Можно ли загружать ленту сейчас"""
+        now = time.time()
+        feed_key = self.feed_key(feed_url)
+        # Заблокированная лента не должна забирать пробу хоста
+        if self._blocked(feed_key, now):
+            BREAKER_SKIPS.inc(scope="feed")
+            return False
+        if not await self._check(self.host_key(feed_url), now):
+            BREAKER_SKIPS.inc(scope="host")
+            return False
+        if not await self._check(feed_key, now):
+            BREAKER_SKIPS.inc(scope="feed")
+            return False
+        return True
+
+    async def record_success(self, feed_url: str):
+        """Закрывает breaker ленты и хоста после успешной загрузки"""
+        for key in (self.host_key(feed_url), self.feed_key(feed_url)):
+            state = self.states.get(key)
+            if state is None:
+                continue
+            if state.get("state") != "closed":
+                BREAKER_TRANSITIONS.inc(to="closed")
+                logger.info("Breaker %s закрыт", key)
+            await self._save(key, None)
+
+    async def record_failure(self, feed_url: str, error: Exception):
+        """Учитывает ошибку загрузки ленты (и хоста, если ошибка сетевая)"""
+        keys = [(self.feed_key(feed_url), self.feed_failures)]
+        host_key = self.host_key(feed_url)
+        if is_host_failure(error):
+            keys.append((host_key, self.host_failures))
+        elif host_key in self.states:
+            # Хост ответил (например, 404 удаленного тега) - с ним все в порядке
+            if self.states[host_key].get("state") != "closed":
+                BREAKER_TRANSITIONS.inc(to="closed")
+                logger.info("Breaker %s закрыт", host_key)
+            await self._save(host_key, None)
+
+        now = time.time()
+        for key, threshold in keys:
+            state = dict(self.states.get(key) or {"state": "closed", "opens": 0})
+            state["failures"] = state.get("failures", 0) + 1
+            state["last_error"] = str(error)[:200]
+            # Ошибка пробы открывает breaker сразу, иначе - после порога
+            if state["state"] == "half_open" or state["failures"] >= threshold:
+                state["opens"] = state.get("opens", 0) + 1
+                delay = self.backoff.delay(state["opens"])
+                state["state"] = "open"
+                state["open_until"] = now + delay
+                state["failures"] = 0
+                BREAKER_TRANSITIONS.inc(to="open")
+                logger.warning(
+                    "Breaker %s открыт на %.0f с (открытие %s подряд): %s",
+                    key,
+                    delay,
+                    state["opens"],
+                    error,
+                )
+            await self._save(key, state)
+
+
+def create_circuit_breaker(redis: RedisConnector) -> Optional[CircuitBreaker]:
+    """Создает breaker по настройкам Config или None, если он выключен"""
+    if not Config.BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        redis,
+        feed_failures=Config.BREAKER_FEED_FAILURES,
+        host_failures=Config.BREAKER_HOST_FAILURES,
+        base_seconds=Config.BREAKER_BASE_SECONDS,
+        max_seconds=Config.BREAKER_MAX_SECONDS,
+    )
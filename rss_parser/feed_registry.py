@@ -0,0 +1,286 @@
+"""
+Реестр RSS лент в Redis
+
+Ленты хранятся в хеше feeds:registry (tag_id -> JSON с описанием, флагом
+включения, собственным интервалом проверки и приоритетом). Любое изменение
+увеличивает feeds:version; парсер в начале цикла читает только версию и
+перечитывает реестр, когда она сменилась, - ленты добавляются и отключаются
+без перезапуска. Пока реестр пуст, используется Config.RSS_FEEDS.
+
+Управление: python -m tools.feeds (import, list, add, enable, disable, ...).
+"""
+
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+FEEDS_KEY = "feeds:registry"
+FEEDS_VERSION_KEY = "feeds:version"
+FEEDS_CHECKED_KEY = "feeds:last_checked"
+
+# Лента считается готовой к проверке чуть раньше срока: циклы не начинаются
+# ровно через интервал после прошлой проверки ленты
+DUE_SLACK = 0.9
+
+REGISTRY_FEEDS = metrics.gauge(
+    "feed_registry_feeds", "Ленты в реестре по состоянию", ["state"]
+)
+REGISTRY_RELOADS = metrics.counter(
+    "feed_registry_reloads_total", "Перечитывания реестра лент после изменений"
+)
+
+
+class FeedInfo:
+    """Настройки одной ленты тега"""
+
+    def __init__(
+        self,
+        tag_id: str,
+        description: str = "",
+        enabled: bool = True,
+        interval_minutes: int = 0,
+        priority: int = 0,
+    ):
+        self.tag_id = str(tag_id)
+        self.description = description
+        self.enabled = enabled
+        # 0 - общий интервал Config.CHECK_INTERVAL_MINUTES
+        self.interval_minutes = interval_minutes
+        # Ленты с большим приоритетом проверяются в цикле раньше
+        self.priority = priority
+
+    @property
+    def url(self) -> str:
+        return Config.RSS_BASE_URL.format(tag_id=self.tag_id)
+
+    def to_dict(self) -> Dict:
+        return {
+            "description": self.description,
+            "enabled": self.enabled,
+            "interval_minutes": self.interval_minutes,
+            "priority": self.priority,
+        }
+
+    @classmethod
+    def from_dict(cls, tag_id: str, data: Dict) -> "FeedInfo":
+        return cls(
+            tag_id,
+            description=data.get("description", ""),
+            enabled=bool(data.get("enabled", True)),
+            interval_minutes=int(data.get("interval_minutes", 0) or 0),
+            priority=int(data.get("priority", 0) or 0),
+        )
+
+
+class FeedRegistry:
+    """Список лент с горячей перезагрузкой из Redis и поиском ленты по URL за O(1)"""
+
+    def __init__(
+        self, redis: RedisConnector, defaults: Optional[Dict[str, str]] = None
+    ):
+        self.redis = redis
+        # Ленты на случай пустого реестра: {tag_id: описание}
+        self.defaults = Config.RSS_FEEDS if defaults is None else defaults
+        self.feeds: Dict[str, FeedInfo] = {}
+        self._by_url: Dict[str, FeedInfo] = {}
+        self.version: Optional[int] = None
+        # Откуда загружен список: redis или config
+        self.source = ""
+
+    def _set_feeds(self, feeds: Iterable[FeedInfo]):
+        self.feeds = {feed.tag_id: feed for feed in feeds}
+        self._by_url = {feed.url: feed for feed in self.feeds.values()}
+        enabled = sum(1 for feed in self.feeds.values() if feed.enabled)
+        REGISTRY_FEEDS.set(enabled, state="enabled")
+        REGISTRY_FEEDS.set(len(self.feeds) - enabled, state="disabled")
+
+    async def refresh(self) -> bool:
+        """
+        Перечитывает реестр, если он изменился с прошлой загрузки
+
+        Returns:
+            True, если список лент перезагружен
+        """
+        try:
+            await self.redis._ensure_connected()
+            raw_version = await self.redis.redis.get(FEEDS_VERSION_KEY)
+            version = int(raw_version) if raw_version else 0
+            if self.feeds and version == self.version:
+                return False
+
+            raw = await self.redis.redis.hgetall(FEEDS_KEY)
+        except Exception as e:
+            # Продолжаем с последним загруженным списком
+            logger.error(f"Ошибка чтения реестра лент: {e}")
+            if not self.feeds:
+                self._load_defaults()
+            return False
+
+        if raw:
+            feeds = []
+            for tag_id, data in raw.items():
+                tag_id = tag_id.decode() if isinstance(tag_id, bytes) else tag_id
+                try:
+                    feeds.append(FeedInfo.from_dict(tag_id, json.loads(data)))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Некорректная запись ленты {tag_id} в реестре: {e}")
+            self._set_feeds(feeds)
+            self.source = "redis"
+        else:
+            self._load_defaults()
+
+        if self.version is not None:
+            REGISTRY_RELOADS.inc()
+        self.version = version
+        logger.info(
+            "Реестр лент загружен из %s: %s лент, включено %s (версия %s)",
+            self.source,
+            len(self.feeds),
+            len(self.enabled_feeds()),
+            version,
+        )
+        return True
+
+    def _load_defaults(self):
+        self._set_feeds(
+            FeedInfo(tag_id, description)
+            for tag_id, description in self.defaults.items()
+        )
+        self.source = "config"
+
+    def get(self, tag_id: str) -> Optional[FeedInfo]:
+        """Лента по tag_id"""
+        return self.feeds.get(tag_id)
+
+    def by_url(self, feed_url: str) -> Optional[FeedInfo]:
+        """Лента по URL: точное совпадение или tag_id из URL"""
+        feed = self._by_url.get(feed_url)
+        if feed is None:
+            feed = self.feeds.get(Config.get_feed_tag(feed_url))
+        return feed
+
+    def description(self, feed_url: str) -> str:
+        """Описание тега по URL ленты"""
+        feed = self.by_url(feed_url)
+        return feed.description if feed else "Unknown Feed"
+
+    def priority_of(self, feed_url: str) -> int:
+        """Приоритет ленты по URL (0 для неизвестных)"""
+        feed = self.by_url(feed_url)
+        return feed.priority if feed else 0
+
+    def enabled_feeds(self) -> List[FeedInfo]:
+        """Включенные ленты: сначала с большим приоритетом"""
+        feeds = [feed for feed in self.feeds.values() if feed.enabled]
+        feeds.sort(key=lambda feed: (-feed.priority, feed.tag_id))
+        return feeds
+
+    def check_interval_minutes(self) -> float:
+        """Как часто запускать цикл: общий интервал или меньший интервал ленты"""
+        intervals = [
+            feed.interval_minutes
+            for feed in self.enabled_feeds()
+            if feed.interval_minutes > 0
+        ]
+        return min([Config.CHECK_INTERVAL_MINUTES, *intervals])
+
+    async def due_feed_urls(self, now: Optional[float] = None) -> List[str]:
+        """
+        URL включенных лент, которые пора проверить в этом цикле
+
+        Лента с собственным интервалом пропускается, пока с ее прошлой проверки
+        не прошел этот интервал.
+        """
+        now = time.time() if now is None else now
+        try:
+            await self.redis._ensure_connected()
+            raw = await self.redis.redis.hgetall(FEEDS_CHECKED_KEY)
+            checked = {
+                (k.decode() if isinstance(k, bytes) else k): float(v)
+                for k, v in raw.items()
+            }
+        except Exception as e:
+            logger.error(f"Ошибка чтения времени проверки лент: {e}")
+            checked = {}
+
+        urls = []
+        for feed in self.enabled_feeds():
+            interval = (feed.interval_minutes or Config.CHECK_INTERVAL_MINUTES) * 60
+            last = checked.get(feed.tag_id)
+            if last is None or now - last >= interval * DUE_SLACK:
+                urls.append(feed.url)
+        return urls
+
+    async def mark_checked(self, tag_id: str, checked_at: Optional[float] = None):
+        """Запоминает время проверки ленты (общее для всех реплик)"""
+        try:
+            await self.redis._ensure_connected()
+            await self.redis.redis.hset(
+                FEEDS_CHECKED_KEY, tag_id, checked_at or time.time()
+            )
+        except Exception as e:
+            logger.error(f"Ошибка сохранения времени проверки ленты {tag_id}: {e}")
+
+    # Изменение реестра (tools.feeds)
+    async def save(self, feeds: Iterable[FeedInfo]) -> int:
+        """Добавляет или заменяет ленты и увеличивает версию реестра"""
+        feeds = list(feeds)
+        if not feeds:
+            return 0
+        await self.redis._ensure_connected()
+        async with self.redis.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                FEEDS_KEY,
+                mapping={
+                    feed.tag_id: json.dumps(feed.to_dict(), ensure_ascii=False)
+                    for feed in feeds
+                },
+            )
+            pipe.incr(FEEDS_VERSION_KEY)
+            await pipe.execute()
+        return len(feeds)
+
+    async def remove(self, tag_ids: Iterable[str]) -> int:
+        """Удаляет ленты из реестра"""
+        tag_ids = list(tag_ids)
+        if not tag_ids:
+            return 0
+        await self.redis._ensure_connected()
+        async with self.redis.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(FEEDS_KEY, *tag_ids)
+            pipe.hdel(FEEDS_CHECKED_KEY, *tag_ids)
+            pipe.incr(FEEDS_VERSION_KEY)
+            removed, _, _ = await pipe.execute()
+        return removed
+
+    async def import_feeds(self, feeds: Dict[str, str], overwrite: bool = False) -> int:
+        """
+        Импортирует ленты из словаря {tag_id: описание} (формат Config.RSS_FEEDS)
+
+        Args:
+            overwrite: Перезаписать описание уже заведенных лент (остальные
+                поля сохраняются)
+
+        Returns:
+            Количество добавленных или измененных лент
+        """
+        await self.refresh()
+        existing = self.feeds if self.source == "redis" else {}
+        changed = []
+        for tag_id, description in feeds.items():
+            tag_id = str(tag_id).strip()
+            description = description.strip()
+            current = existing.get(tag_id)
+            if current is None:
+                changed.append(FeedInfo(tag_id, description))
+            elif overwrite and current.description != description:
+                current.description = description
+                changed.append(current)
+        return await self.save(changed)
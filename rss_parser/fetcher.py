@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import urllib.request
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+from config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FEED_HTTP_CONNECTIONS = metrics.counter(
+    "rss_feed_http_connections_total",
+    "Запросы лент по соединению: new (новое TCP/TLS) или reused (keep-alive)",
+    ["result"],
+)
+FEED_WIRE_BYTES = metrics.counter(
+    "rss_feed_wire_bytes_total", "Байты лент по сети (до распаковки)", ["encoding"]
+)
+FEED_DECODED_BYTES = metrics.counter(
+    "rss_feed_decoded_bytes_total", "Байты лент после распаковки", ["encoding"]
+)
+FEED_HTTP_SECONDS = metrics.histogram(
+    "rss_feed_http_duration_seconds", "Время HTTP запроса ленты", ["connection"]
+)
+
+
+class FeedTooLargeError(Exception):
+    """Ответ ленты больше допустимого размера"""
+
+
+def split_chunks(body: bytes, chunk_size: int = 16384) -> Iterator[bytes]:
+    """Режет тело ответа на части для потокового разбора"""
+    for start in range(0, len(body), chunk_size):
+        yield body[start : start + chunk_size]
+
+
+def iter_async_chunks(
+    chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop
+) -> Iterator[bytes]:
+    """
+    Отдает части асинхронного загрузчика разбору в отдельном потоке
+
+    Каждая часть запрашивается у event loop; закрытие генератора (разбор
+    остановился на отметке) закрывает и ответ.
+    """
+
+    async def next_chunk() -> bytes:
+        return await chunks.__anext__()
+
+    try:
+        while True:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
+
+
+def _accept_encoding() -> str:
+    """Сжатия, которые умеет распаковать httpx в этом окружении"""
+    try:
+        import brotli  # noqa: F401
+
+        return "br, gzip, deflate"
+    except ImportError:
+        pass
+    try:
+        import brotlicffi  # noqa: F401
+
+        return "br, gzip, deflate"
+    except ImportError:
+        return "gzip, deflate"
+
+
+class FeedFetcher:
+    """Загрузка RSS лент по HTTP с опциональной записью ответов на диск"""
+
+    USER_AGENT = Config.FEED_USER_AGENT
+
+    def __init__(self, record_dir: Optional[str] = None, timeout: float = 60.0):
+        self.record_dir = record_dir
+        self.timeout = timeout
+
+    def fetch(self, feed_url: str) -> bytes:
+        """Загружает ленту и возвращает тело ответа"""
+        request = urllib.request.Request(
+            feed_url, headers={"User-Agent": self.USER_AGENT}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = response.read()
+
+        if self.record_dir:
+            self._record(feed_url, body)
+
+        return body
+
+    def iter_chunks(self, feed_url: str, chunk_size: int = 16384) -> Iterator[bytes]:
+        """
+        Загружает ленту по частям
+
+        Если потребитель перестает читать (закрывает генератор), соединение
+        закрывается и остаток ответа не загружается. При записи на диск лента
+        загружается целиком.
+        """
+        if self.record_dir:
+            yield self.fetch(feed_url)
+            return
+
+        request = urllib.request.Request(
+            feed_url, headers={"User-Agent": self.USER_AGENT}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _record(self, feed_url: str, body: bytes):
+        """Сохраняет ответ в каталог записи"""
+        record_feed_response(self.record_dir, feed_url, body)
+
+
+def record_feed_response(record_dir: str, feed_url: str, body: bytes):
+    """Сохраняет сырой ответ ленты и строку манифеста для последующего replay"""
+    try:
+        os.makedirs(record_dir, exist_ok=True)
+        fetched_at = time.time()
+
+        # Имя файла: <время в мс>-<tag_id или безопасный вариант URL>.atom
+        match = re.search(r"/tags/([^/]+)/", feed_url)
+        slug = match.group(1) if match else re.sub(r"[^\w.-]+", "_", feed_url)
+        file_name = f"{int(fetched_at * 1000)}-{slug}.atom"
+
+        with open(os.path.join(record_dir, file_name), "wb") as f:
+            f.write(body)
+
+        manifest_line = {
+            "url": feed_url,
+            "file": file_name,
+            "fetched_at": fetched_at,
+            "bytes": len(body),
+        }
+        with open(
+            os.path.join(record_dir, "manifest.jsonl"), "a", encoding="utf-8"
+        ) as f:
+            f.write(json.dumps(manifest_line, ensure_ascii=False) + "\n")
+
+        logger.debug("Записан ответ ленты %s в %s", feed_url, file_name)
+    except Exception as e:
+        # Запись не должна ломать основной цикл проверки
+        logger.error(f"Ошибка записи ответа ленты {feed_url}: {e}")
+
+
+class AsyncFeedFetcher:
+    """
+    Загрузка лент общим асинхронным HTTP клиентом (httpx)
+
+    Соединения с AO3 переиспользуются между лентами и циклами (keep-alive), так
+    что TLS рукопожатие выполняется один раз на соединение, а не на каждую
+    ленту. Ответы запрашиваются сжатыми (gzip, br при установленном brotli),
+    размер ответа ограничен, загрузка прерывается при превышении лимита.
+    iter_chunks отдает ленту по частям, чтобы разбор мог остановиться на
+    отметке прошлой проверки, не разбирая остаток ответа.
+    """
+
+    def __init__(
+        self,
+        record_dir: Optional[str] = None,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 30.0,
+        max_bytes: int = 5 * 1024 * 1024,
+        user_agent: str = Config.FEED_USER_AGENT,
+        http2: bool = False,
+        max_connections: int = 10,
+    ):
+        self.record_dir = record_dir
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_bytes = max_bytes
+        self.user_agent = user_agent
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.client: Optional[httpx.AsyncClient] = None
+        # Накопленная статистика запросов с момента создания
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "connections_new": 0,
+            "connections_reused": 0,
+            "tls_handshakes": 0,
+            "wire_bytes": 0,
+            "decoded_bytes": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("Пакет h2 не установлен, HTTP/2 выключен")
+                    http2 = False
+            self.client = httpx.AsyncClient(
+                http2=http2,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=Config.CHECK_INTERVAL_MINUTES * 60 + 60,
+                ),
+                headers={
+                    "User-Agent": self.user_agent,
+                    "Accept-Encoding": _accept_encoding(),
+                },
+                follow_redirects=True,
+            )
+        return self.client
+
+    async def fetch(self, feed_url: str) -> bytes:
+        """
+        Загружает ленту и возвращает распакованное тело ответа
+
+        Raises:
+            httpx.HTTPError: Ошибка соединения, таймаут или HTTP статус >= 400
+            FeedTooLargeError: Ответ больше max_bytes
+        """
+        body = b"".join([chunk async for chunk in self._stream(feed_url)])
+        if self.record_dir:
+            await asyncio.to_thread(
+                record_feed_response, self.record_dir, feed_url, body
+            )
+        return body
+
+    async def iter_chunks(
+        self, feed_url: str, chunk_size: int = 16384
+    ) -> AsyncIterator[bytes]:
+        """
+        Загружает ленту по частям (распакованным)
+
+        Если потребитель перестает читать (закрывает генератор), остаток
+        ответа дочитывается без разбора, чтобы соединение вернулось в пул
+        keep-alive (ответ больше max_bytes закрывается). При записи на диск
+        лента загружается целиком.
+
+        Raises:
+            httpx.HTTPError: Ошибка соединения, таймаут или HTTP статус >= 400
+            FeedTooLargeError: Ответ больше max_bytes
+        """
+        if self.record_dir:
+            yield await self.fetch(feed_url)
+            return
+        async for chunk in self._stream(feed_url, chunk_size):
+            yield chunk
+
+    async def _stream(
+        self, feed_url: str, chunk_size: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Части ответа с проверкой размера; статистика - при закрытии ответа"""
+        client = self._get_client()
+        events = []
+
+        async def trace(event_name: str, info: Dict):
+            if event_name.endswith(".started"):
+                events.append(event_name)
+
+        start = time.perf_counter()
+        async with client.stream(
+            "GET", feed_url, extensions={"trace": trace}
+        ) as response:
+            response.raise_for_status()
+            declared = int(response.headers.get("Content-Length") or 0)
+            if declared > self.max_bytes:
+                raise FeedTooLargeError(
+                    f"{feed_url}: Content-Length {declared} > {self.max_bytes}"
+                )
+            size = 0
+            # Сжатый ответ распаковывается большими порциями; chunk_size
+            # режет их, чтобы разбор мог остановиться раньше
+            chunks = response.aiter_bytes(chunk_size)
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise FeedTooLargeError(
+                            f"{feed_url}: ответ больше {self.max_bytes} байт"
+                        )
+                    yield chunk
+            except GeneratorExit:
+                # Разбор остановился на отметке. Недочитанный ответ закрыл бы
+                # соединение, поэтому остаток (не больше max_bytes) читается
+                # впустую, и соединение возвращается в пул
+                try:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            break
+                except httpx.HTTPError as e:
+                    logger.debug("Остаток ответа %s не дочитан: %s", feed_url, e)
+                raise
+            finally:
+                self._count_response(events, start, response, size)
+
+    def _count_response(
+        self, events: list, start: float, response: httpx.Response, size: int
+    ):
+        """Метрики и статистика одного ответа (прочитанного целиком или нет)"""
+        wire_bytes = response.num_bytes_downloaded
+        encoding = response.headers.get("Content-Encoding", "identity")
+        new_connection = "connection.connect_tcp.started" in events
+        connection = "new" if new_connection else "reused"
+        FEED_HTTP_CONNECTIONS.inc(result=connection)
+        FEED_HTTP_SECONDS.observe(time.perf_counter() - start, connection=connection)
+        FEED_WIRE_BYTES.inc(wire_bytes, encoding=encoding)
+        FEED_DECODED_BYTES.inc(size, encoding=encoding)
+
+        self.stats["requests"] += 1
+        self.stats["connections_" + connection] += 1
+        self.stats["tls_handshakes"] += int("connection.start_tls.started" in events)
+        self.stats["wire_bytes"] += wire_bytes
+        self.stats["decoded_bytes"] += size
+
+    def stats_since(self, previous: Dict[str, int]) -> Dict[str, int]:
+        """Статистика запросов после снимка previous (копии stats)"""
+        return {key: value - previous.get(key, 0) for key, value in self.stats.items()}
+
+    async def close(self):
+        """Закрывает соединения клиента"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def create_http_fetcher() -> Optional[AsyncFeedFetcher]:
+    """Создает асинхронный загрузчик по настройкам Config или None для urllib"""
+    if Config.FEED_HTTP_CLIENT != "httpx":
+        return None
+    return AsyncFeedFetcher(
+        record_dir=Config.FEED_RECORD_DIR or None,
+        connect_timeout=Config.FEED_CONNECT_TIMEOUT,
+        read_timeout=Config.FEED_READ_TIMEOUT,
+        max_bytes=Config.FEED_MAX_BYTES,
+        user_agent=Config.FEED_USER_AGENT,
+        http2=Config.FEED_HTTP2,
+        max_connections=Config.FEED_MAX_CONNECTIONS,
+    )
@@ -0,0 +1,239 @@
+"""
+Фильтр Блума известных работ
+
+Большинство записей лент - уже известные работы, но для новых тегов и догрузок
+почти все записи новые, и каждая стоит запроса HGETALL впустую. Фильтр
+отвечает "работы точно нет" без обращения к Redis; при положительном ответе
+метаданные читаются как обычно.
+
+Фильтр общий для всех реплик парсера: биты лежат в битовой строке fanfic:bloom
+(биты новой работы выставляются SETBIT в том же pipeline, что сохраняет ее
+метаданные), локальная копия подтягивает биты других реплик в начале каждого
+цикла, а снимок на диске позволяет стартовать без перестроения, если ключ
+в Redis потерян. Удаленные работы из фильтра не
+исчезают (лишний HGETALL, а не ошибка) - их убирает перестроение по индексу
+fanfic:ids (python -m tools.bloom_rebuild).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Iterable, List, Optional
+
+from config import Config
+from utils.bloom import BloomFilter, optimal_size
+from utils.metrics import metrics
+from utils.redis_connector import KNOWN_WORKS_BLOOM_KEY, RedisConnector
+
+logger = logging.getLogger(__name__)
+
+BLOOM_KEY = KNOWN_WORKS_BLOOM_KEY
+BLOOM_PARAMS_KEY = "fanfic:bloom:params"
+BLOOM_TMP_KEY = "fanfic:bloom:tmp"
+
+BLOOM_LOOKUPS = metrics.counter(
+    "known_works_bloom_lookups_total",
+    "Проверки работ по фильтру Блума: absent (HGETALL пропущен) / maybe",
+    ["result"],
+)
+BLOOM_FILL_RATIO = metrics.gauge(
+    "known_works_bloom_fill_ratio", "Доля установленных бит фильтра известных работ"
+)
+
+
+class KnownWorks:
+    """Фильтр Блума id работ с метаданными, синхронизируемый через Redis"""
+
+    def __init__(
+        self,
+        redis: RedisConnector,
+        capacity: int = 200000,
+        error_rate: float = 0.01,
+        path: str = "",
+    ):
+        self.redis = redis
+        self.bits, self.hashes = optimal_size(capacity, error_rate)
+        self.path = path
+        # None - фильтр еще не загружен, все работы считаются возможно известными
+        self.filter: Optional[BloomFilter] = None
+
+    def _empty(self) -> BloomFilter:
+        return BloomFilter(self.bits, self.hashes)
+
+    def might_exist(self, work_id: str) -> bool:
+        """False - работы точно нет в Redis, True - нужно читать метаданные"""
+        if self.filter is None:
+            return True
+        if work_id in self.filter:
+            BLOOM_LOOKUPS.inc(result="maybe")
+            return True
+        BLOOM_LOOKUPS.inc(result="absent")
+        return False
+
+    async def _redis_params_match(self) -> bool:
+        params = await self.redis.redis.hgetall(BLOOM_PARAMS_KEY)
+        params = {k.decode(): v.decode() for k, v in params.items()}
+        return params.get("bits") == str(self.bits) and params.get("hashes") == str(
+            self.hashes
+        )
+
+    async def load(self) -> str:
+        """
+        Загружает фильтр: из Redis, иначе из файла, иначе перестраивает по индексу
+
+        Returns:
+            Источник фильтра: redis, file или rebuild
+        """
+        await self.redis._ensure_connected()
+        start = time.perf_counter()
+        source = "redis"
+        data = None
+        # Пока индекс не заполнен по ключам метаданных, сохраненный фильтр мог
+        # быть построен по его части и не знать старых работ
+        reindexed = await self.redis.ensure_fanfic_index()
+        if not reindexed and await self._redis_params_match():
+            data = await self.redis.redis.get(BLOOM_KEY)
+
+        if reindexed:
+            source = "rebuild"
+            await self.rebuild(replace=True)
+        elif data is not None:
+            self.filter = BloomFilter(self.bits, self.hashes, data)
+        else:
+            from_file = await asyncio.to_thread(self._load_file)
+            if from_file is not None:
+                source = "file"
+                self.filter = from_file
+                # Делимся снимком с другими репликами
+                await self._store(self.filter, replace=False)
+            else:
+                source = "rebuild"
+                await self.rebuild(replace=True)
+
+        BLOOM_FILL_RATIO.set(self.filter.fill_ratio())
+        logger.info(
+            "Фильтр известных работ загружен (%s, %s бит, %s хешей) за %.2f с",
+            source,
+            self.bits,
+            self.hashes,
+            time.perf_counter() - start,
+        )
+        return source
+
+    def _load_file(self) -> Optional[BloomFilter]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            loaded = BloomFilter.load(self.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать снимок фильтра {self.path}: {e}")
+            return None
+        if not loaded.compatible(self._empty()):
+            logger.info("Снимок фильтра %s с другими размерами, пропускаем", self.path)
+            return None
+        return loaded
+
+    async def refresh(self):
+        """Загружает фильтр при первом вызове, далее подтягивает биты других реплик"""
+        try:
+            if self.filter is None:
+                await self.load()
+                return
+            await self.redis._ensure_connected()
+            data = await self.redis.redis.get(BLOOM_KEY)
+            if data is None:
+                # Ключ потерян (например, после FLUSHDB) - восстанавливаем из памяти
+                await self._store(self.filter, replace=False)
+            else:
+                self.filter.merge(data)
+            BLOOM_FILL_RATIO.set(self.filter.fill_ratio())
+        except Exception as e:
+            # Без фильтра парсер работает как раньше, только медленнее
+            logger.error(f"Ошибка синхронизации фильтра известных работ: {e}")
+
+    def remember(self, work_id: str) -> Optional[List[int]]:
+        """
+        Отмечает работу известной в локальной копии
+
+        Returns:
+            Номера бит работы для записи в Redis вместе с метаданными
+            (RedisConnector.save_fanfic_metadata) или None, если фильтр не загружен
+        """
+        if self.filter is None:
+            return None
+        self.filter.add(work_id)
+        return self.filter.positions(work_id)
+
+    async def _store(self, bloom: BloomFilter, replace: bool):
+        """
+        Записывает фильтр в Redis
+
+        Args:
+            replace: Заменить фильтр целиком; иначе объединить с битами в Redis
+                (BITOP OR), чтобы не потерять работы, добавленные другими репликами
+        """
+        async with self.redis.redis.pipeline(transaction=True) as pipe:
+            if replace:
+                pipe.set(BLOOM_KEY, bloom.to_bytes())
+            else:
+                pipe.set(BLOOM_TMP_KEY, bloom.to_bytes())
+                pipe.bitop("OR", BLOOM_KEY, BLOOM_KEY, BLOOM_TMP_KEY)
+                pipe.delete(BLOOM_TMP_KEY)
+            pipe.hset(
+                BLOOM_PARAMS_KEY, mapping={"bits": self.bits, "hashes": self.hashes}
+            )
+            await pipe.execute()
+
+    async def rebuild(
+        self, replace: bool = True, work_ids: Optional[Iterable[str]] = None
+    ) -> int:
+        """
+        Строит фильтр заново по индексу fanfic:ids
+
+        Если индекс еще не заполнялся по ключам метаданных (данные сохранены
+        до его появления), сначала заполняется он.
+
+        Args:
+            replace: Заменить фильтр в Redis (убирает удаленные работы) или
+                объединить с ним
+            work_ids: Готовый список id вместо чтения индекса
+
+        Returns:
+            Количество работ в фильтре
+        """
+        await self.redis._ensure_connected()
+        if work_ids is None:
+            await self.redis.ensure_fanfic_index()
+            work_ids = await self.redis.get_indexed_fanfic_ids()
+        bloom = self._empty()
+        count = 0
+        for work_id in work_ids:
+            bloom.add(work_id)
+            count += 1
+        await self._store(bloom, replace=replace)
+        self.filter = bloom
+        BLOOM_FILL_RATIO.set(bloom.fill_ratio())
+        logger.info("Фильтр известных работ перестроен: %s работ", count)
+        return count
+
+    async def snapshot(self):
+        """Сохраняет фильтр в файл (если путь задан)"""
+        if not self.path or self.filter is None:
+            return
+        try:
+            await asyncio.to_thread(self.filter.save, self.path)
+        except OSError as e:
+            logger.error(f"Ошибка сохранения снимка фильтра {self.path}: {e}")
+
+
+def create_known_works(redis: RedisConnector) -> Optional[KnownWorks]:
+    """Создает фильтр по настройкам Config или None, если он выключен"""
+    if not Config.BLOOM_ENABLED:
+        return None
+    return KnownWorks(
+        redis,
+        capacity=Config.BLOOM_CAPACITY,
+        error_rate=Config.BLOOM_ERROR_RATE,
+        path=Config.BLOOM_FILE,
+    )
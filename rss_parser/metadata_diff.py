@@ -0,0 +1,132 @@
+"""
+Сравнение метаданных работы с сохраненными по полям
+
+Раньше изменение определялось только по автору и числу глав, а при любом
+изменении метаданные перезаписывались целиком (вместе с саммари). Теперь
+новая запись сравнивается с сохраненной по каждому полю: в Redis пишутся
+только изменившиеся поля, причина обновления определяется по тому, что
+изменилось (главы, автор, название, объем, теги, саммари), а изменения
+отслеживаемых полей коротко записываются в журнал работы.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.schemas import UpdateReason
+
+# Отслеживаемые поля и причина обновления при их изменении
+FIELD_REASONS: Dict[str, UpdateReason] = {
+    "chapters": UpdateReason.CHAPTER,
+    "author": UpdateReason.AUTHOR,
+    "title": UpdateReason.TITLE,
+    "words": UpdateReason.WORDS,
+    "fandom": UpdateReason.TAGS,
+    "rating": UpdateReason.TAGS,
+    "category": UpdateReason.TAGS,
+    "warnings": UpdateReason.TAGS,
+    "characters": UpdateReason.TAGS,
+    "relationships": UpdateReason.TAGS,
+    "additional_tags": UpdateReason.TAGS,
+    "summary": UpdateReason.SUMMARY,
+}
+
+# Какая причина главная, если изменилось несколько полей
+REASON_PRIORITY: List[UpdateReason] = [
+    UpdateReason.CHAPTER,
+    UpdateReason.AUTHOR,
+    UpdateReason.TITLE,
+    UpdateReason.WORDS,
+    UpdateReason.TAGS,
+    UpdateReason.SUMMARY,
+]
+
+# Служебные поля: не сравниваются (source_feed - лента первой встречи,
+# source_feeds и update_reason выставляет парсер, source - откуда работа
+# попала в базу). Остальные поля без причины (updated_at, link, published,
+# language) записываются при изменении, но уведомления не вызывают
+IGNORED_FIELDS = {
+    "work_id",
+    "source",
+    "source_feed",
+    "source_feeds",
+    "update_reason",
+}
+
+# Длина значения в журнале изменений
+CHANGE_LOG_VALUE_CHARS = 120
+
+
+class MetadataDiff:
+    """Результат сравнения: изменившиеся поля и причины обновления"""
+
+    def __init__(
+        self,
+        fields: Dict[str, str],
+        changes: Dict[str, Tuple[str, str]],
+        reasons: List[UpdateReason],
+    ):
+        # Поля для записи в Redis: {поле: новое значение}
+        self.fields = fields
+        # Изменения отслеживаемых полей: {поле: (было, стало)}
+        self.changes = changes
+        # Причины по убыванию важности (NEW для новой работы)
+        self.reasons = reasons
+
+    @property
+    def reason(self) -> Optional[UpdateReason]:
+        """Главная причина обновления (None - изменились только служебные поля)"""
+        return self.reasons[0] if self.reasons else None
+
+    def log_entry(self) -> Dict:
+        """Запись журнала изменений: время, причины и укороченные значения"""
+        return {
+            "at": int(time.time()),
+            "reasons": [reason.value for reason in self.reasons],
+            "fields": {
+                field: [_shorten(old), _shorten(new)]
+                for field, (old, new) in self.changes.items()
+            },
+        }
+
+
+def _shorten(value: str) -> str:
+    if len(value) <= CHANGE_LOG_VALUE_CHARS:
+        return value
+    return value[: CHANGE_LOG_VALUE_CHARS - 1] + "…"
+
+
+def diff_metadata(
+    new: Dict[str, str], stored: Optional[Dict[str, str]]
+) -> MetadataDiff:
+    """
+    Сравнивает разобранную запись ленты с сохраненными метаданными
+
+    Пустое значение в новой записи изменением не считается: лента могла не
+    отдать поле, а стирать сохраненное значение из-за этого нельзя.
+
+    Args:
+        new: Метаданные из ленты
+        stored: Метаданные из Redis (None - работы нет)
+    """
+    if not stored:
+        fields = {key: value for key, value in new.items() if value is not None}
+        return MetadataDiff(fields, {}, [UpdateReason.NEW])
+
+    fields = {}
+    changes = {}
+    reasons = set()
+    for key, value in new.items():
+        if key in IGNORED_FIELDS or value is None or value == "":
+            continue
+        value = str(value)
+        old = stored.get(key, "")
+        if value == old:
+            continue
+        fields[key] = value
+        reason = FIELD_REASONS.get(key)
+        if reason is not None:
+            changes[key] = (old, value)
+            reasons.add(reason)
+
+    ordered = [reason for reason in REASON_PRIORITY if reason in reasons]
+    return MetadataDiff(fields, changes, ordered)
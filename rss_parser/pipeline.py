@@ -0,0 +1,160 @@
+"""
+Конвейер стадий с ограниченными очередями
+
+Каждая стадия - несколько обработчиков, читающих свою asyncio.Queue
+ограниченного размера. Обработчик элемента возвращает элементы для следующей
+стадии; когда очередь следующей стадии заполнена, обработчик ждет, поэтому
+быстрая стадия не накапливает работу перед медленной, а пропускная способность
+конвейера определяется самой медленной стадией, а не суммой всех.
+
+Для каждой стадии есть метрики заполненности (ожидающие элементы и занятые
+обработчики) и времени обработки элемента, а stats() дает итоги за запуск:
+по ним видно, какая стадия ограничивает цикл.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGE_QUEUED = metrics.gauge(
+    "rss_pipeline_queued_items", "Элементы, ожидающие стадию конвейера", ["stage"]
+)
+STAGE_BUSY = metrics.gauge(
+    "rss_pipeline_busy_workers", "Занятые обработчики стадии конвейера", ["stage"]
+)
+STAGE_SECONDS = metrics.histogram(
+    "rss_pipeline_stage_seconds", "Время обработки элемента стадией", ["stage"]
+)
+STAGE_ERRORS = metrics.counter(
+    "rss_pipeline_errors_total", "Ошибки обработки элементов стадией", ["stage"]
+)
+
+Handler = Callable[[Any], Awaitable[Optional[Iterable[Any]]]]
+
+
+class Stage:
+    """Стадия конвейера: очередь и обработчики"""
+
+    def __init__(
+        self, name: str, handler: Handler, workers: int = 1, queue_size: int = 0
+    ):
+        """
+        Args:
+            handler: Обрабатывает элемент и возвращает элементы для следующей
+                стадии (или None). Ошибка обработчика логируется, элемент
+                считается обработанным
+            workers: Сколько элементов стадия обрабатывает одновременно
+            queue_size: Размер очереди стадии (0 - без ограничения)
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.next: Optional["Stage"] = None
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def put(self, item: Any):
+        """Отдает элемент стадии; ждет, пока в очереди есть место"""
+        start = time.perf_counter()
+        await self.queue.put(item)
+        STAGE_QUEUED.inc(stage=self.name)
+        return time.perf_counter() - start
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"pipeline-{self.name}-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            STAGE_QUEUED.dec(stage=self.name)
+            STAGE_BUSY.inc(stage=self.name)
+            start = time.perf_counter()
+            try:
+                results = await self.handler(item)
+                elapsed = time.perf_counter() - start
+                STAGE_SECONDS.observe(elapsed, stage=self.name)
+                self.busy_seconds += elapsed
+                self.processed += 1
+                if results and self.next is not None:
+                    for result in results:
+                        # Время ожидания места в очереди следующей стадии
+                        self.wait_seconds += await self.next.put(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                STAGE_ERRORS.inc(stage=self.name)
+                logger.exception(f"Ошибка стадии {self.name}: {e}")
+            finally:
+                STAGE_BUSY.dec(stage=self.name)
+                self.queue.task_done()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Брошенные элементы больше не числятся ожидающими
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            STAGE_QUEUED.dec(stage=self.name)
+
+
+class Pipeline:
+    """Цепочка стадий: выход каждой стадии - вход следующей"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        self.started = 0.0
+
+    async def __aenter__(self) -> "Pipeline":
+        self.started = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for stage in self.stages:
+            await stage.stop()
+        return False
+
+    async def put(self, item: Any):
+        """Отдает элемент первой стадии"""
+        await self.stages[0].put(item)
+
+    async def join(self):
+        """Ждет, пока все отданные элементы пройдут все стадии"""
+        # Стадия не получит новых элементов, когда предыдущая опустела
+        for stage in self.stages:
+            await stage.queue.join()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Итоги по стадиям: обработано элементов, среднее время, загрузка
+        обработчиков (доля времени работы) и ожидание места у следующей стадии
+        """
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            stage.name: {
+                "processed": stage.processed,
+                "avg_seconds": (
+                    stage.busy_seconds / stage.processed if stage.processed else 0.0
+                ),
+                "utilization": stage.busy_seconds / (elapsed * stage.workers),
+                "blocked_seconds": stage.wait_seconds,
+            }
+            for stage in self.stages
+        }
@@ -1,24 +1,191 @@
 import asyncio
 import logging
 import re
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
-
-import feedparser
+from typing import (
+    AsyncIterator,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
 
 from config import Config
-from utils.redis_connector import redis_connector
+from rss_parser.ao3_atom import ParsedFeed, parse_feed_stream, parse_with_feedparser
+from rss_parser.backpressure import BackpressureController
+from rss_parser.checkpoint import CycleCheckpoint
+from rss_parser.circuit_breaker import CircuitBreaker
+from rss_parser.feed_registry import FeedRegistry
+from rss_parser.fetcher import (
+    AsyncFeedFetcher,
+    FeedFetcher,
+    iter_async_chunks,
+    split_chunks,
+)
+from rss_parser.known_works import KnownWorks
+from rss_parser.metadata_diff import MetadataDiff, diff_metadata
+from rss_parser.pipeline import Pipeline, Stage
+from rss_parser.sharding import FeedSharding
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector, redis_connector
 from utils.schemas import Source, UpdateReason
+from utils.subscriptions import SubscriptionIndex
+from utils.tracing import SpanContext, tracer
 
 logger = logging.getLogger(__name__)
 
+FEED_FETCH_SECONDS = metrics.histogram(
+    "rss_feed_fetch_duration_seconds", "Время загрузки и разбора ленты", ["feed"]
+)
+FEED_FETCH_BYTES = metrics.counter(
+    "rss_feed_fetch_bytes_total", "Объем загруженных лент в байтах", ["feed"]
+)
+FEED_FETCH_ERRORS = metrics.counter(
+    "rss_feed_fetch_errors_total", "Ошибки загрузки лент", ["feed"]
+)
+FEED_EARLY_STOPS = metrics.counter(
+    "rss_feed_early_stops_total",
+    "Ленты, чтение которых остановлено на отметке прошлой проверки",
+    ["feed"],
+)
+ENTRY_PARSE_SECONDS = metrics.histogram(
+    "rss_entry_parse_duration_seconds",
+    "Время разбора одной записи",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+ENTRIES_TOTAL = metrics.counter(
+    "rss_entries_total",
+    "Обработанные записи: new/updated/skipped с причиной",
+    ["result", "reason"],
+)
+ENQUEUE_TOTAL = metrics.counter(
+    "rss_enqueue_total",
+    "Постановка обновленных работ в очередь: queued/sent_recently/deferred",
+    ["result"],
+)
+
+# Конец цикла в очереди выдачи записей
+_CYCLE_DONE = object()
+
+
+class PersistError(Exception):
+    """Запись работы в Redis не удалась - лента будет разобрана повторно"""
+
+
+class _FeedJob:
+    """Лента, проходящая стадии конвейера цикла"""
+
+    def __init__(self, url: str, label: str):
+        self.url = url
+        self.label = label
+        # Спан process_feed живет, пока записи ленты проходят все стадии
+        self.span = None
+        self.watermark: Dict = {}
+        self.body: Optional[bytes] = None
+        self.feed: Optional[ParsedFeed] = None
+        self.parsed = False
+        # Записи ленты, еще не прошедшие конвейер
+        self.pending = 0
+        self.new_entries: List[Dict] = []
+        # Ошибка обработки записи: отметка ленты не сдвигается
+        self.error: Optional[Exception] = None
+
+    @property
+    def trace(self) -> Optional[SpanContext]:
+        return self.span.context if self.span else None
+
+
+class _EntryJob:
+    """Запись ленты в конвейере: стадии дописывают свои результаты"""
+
+    def __init__(self, job: _FeedJob, entry, source_feeds: Set[str]):
+        self.job = job
+        self.entry = entry
+        # Теги, в которых работа встретилась за цикл (пополняется до конца цикла)
+        self.source_feeds = source_feeds
+        self.work_id = ""
+        # Разобранные поля записи и их отличия от сохраненных
+        self.data: Dict = {}
+        self.diff: Optional[MetadataDiff] = None
+        self.existing: Optional[Dict] = None
+        self.reason: Optional[UpdateReason] = None
+
 
 class RSSParser:
     """Парсер RSS лент для Archive of Our Own"""
 
-    def __init__(self, feed_urls: list):
+    def __init__(
+        self,
+        feed_urls: list,
+        redis: Optional[RedisConnector] = None,
+        fetcher: Optional[FeedFetcher] = None,
+        sharding: Optional[FeedSharding] = None,
+        backpressure: Optional[BackpressureController] = None,
+        known_works: Optional[KnownWorks] = None,
+        registry: Optional[FeedRegistry] = None,
+        http_fetcher: Optional[AsyncFeedFetcher] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        checkpoint: Optional[CycleCheckpoint] = None,
+        subscriptions: Optional[SubscriptionIndex] = None,
+    ):
         self.feed_urls = feed_urls if isinstance(feed_urls, list) else [feed_urls]
-        self.redis = redis_connector
+        self.redis = redis or redis_connector
+        self.fetcher = fetcher or FeedFetcher(record_dir=Config.FEED_RECORD_DIR)
+        # Общий асинхронный HTTP клиент (None - загрузка fetcher'ом в потоке)
+        self.http_fetcher = http_fetcher
+        self._http_stats_mark: Dict[str, int] = {}
+        # Пропуск лент и хостов, которые раз за разом падают (None - не следить)
+        self.breaker = breaker
+        self.feed_delay_seconds = Config.FEED_DELAY_SECONDS
+        self.feed_parser = Config.FEED_PARSER
+        # Статистика последнего цикла get_new_entries
+        self.last_cycle_stats: Dict[str, int] = {}
+        # Ленты, в которых встретилась каждая проверенная в цикле работа:
+        # work_id -> (ленты цикла, сохраненное значение source_feeds)
+        self._cycle_sources: Dict[str, tuple] = {}
+        # Координация с другими репликами парсера (None - одна реплика)
+        self.sharding = sharding
+        # Реакция на переполнение очереди отправки (None - не следить)
+        self.backpressure = backpressure
+        # Фильтр Блума известных работ (None - всегда читать метаданные)
+        self.known_works = known_works
+        # Реестр лент: список лент перечитывается в начале каждого цикла
+        # (None - проверять feed_urls)
+        self.registry = registry
+        # Прогресс цикла в Redis для продолжения после перезапуска
+        # (None - цикл всегда начинается с первой ленты)
+        self.checkpoint = checkpoint
+        # Подписки пользователей: работы ставятся и в их личные очереди
+        # (None - только канал)
+        self.subscriptions = subscriptions
+        # Запрошена остановка: текущая лента дорабатывается, следующие - нет
+        self._stop_event = asyncio.Event()
+        # Конвейер цикла: обработчики стадий и размер очередей между ними
+        self.stage_workers = {
+            "fetch": Config.PIPELINE_FETCH_WORKERS,
+            "parse": Config.PIPELINE_PARSE_WORKERS,
+            "diff": Config.PIPELINE_DIFF_WORKERS,
+            "persist": Config.PIPELINE_PERSIST_WORKERS,
+        }
+        self.stage_queue_size = Config.PIPELINE_QUEUE_SIZE
+        # Причины обновления, по которым работа ставится в очередь отправки
+        self.notify_reasons = {
+            reason.strip() for reason in Config.NOTIFY_REASONS.split(",") if reason
+        }
+        # Не раньше этого времени (monotonic) начинается следующий запрос ленты
+        self._next_fetch_at = 0.0
+        # Состояние текущего цикла: записи по id -> ленты, очередь выдачи
+        self._seen_in_cycle: Dict[str, Set[str]] = {}
+        self._output: Optional[asyncio.Queue] = None
+
+    @staticmethod
+    def _feed_label(feed_url: str) -> str:
+        """Короткая метка ленты для метрик (tag_id, если есть)"""
+        match = re.search(r"/tags/([^/]+)/", feed_url)
+        return match.group(1) if match else feed_url
 
     def _extract_work_id(self, entry) -> Optional[str]:
         """Извлекает work_id из записи RSS"""
@@ -141,157 +308,772 @@ class RSSParser:
             logger.error(f"Ошибка извлечения даты публикации: {e}")
             return ""
 
-    def fetch_feed(self, feed_url: str) -> Optional[feedparser.FeedParserDict]:
-        """Получает и парсит RSS ленту"""
+    def fetch_feed(
+        self,
+        feed_url: str,
+        stop_before: Optional[str] = None,
+        seen_ids: Collection[str] = (),
+        body: Optional[bytes] = None,
+        raise_errors: bool = False,
+        parent: Optional[SpanContext] = None,
+        chunks: Optional[Iterable[bytes]] = None,
+    ) -> Optional[ParsedFeed]:
+        """
+        Получает и парсит RSS ленту
+
+        Args:
+            feed_url: URL ленты
+            stop_before: Отметка updated прошлой проверки: записи старше нее
+                не разбираются, а остаток ленты не загружается
+            seen_ids: id записей, уже обработанных ровно на отметке
+            body: Уже загруженное тело ответа (тогда разбирается только оно)
+            raise_errors: Пробросить ошибку после логирования вместо возврата None
+            parent: Спан ленты (при разборе в потоке стадии конвейера)
+            chunks: Части ответа асинхронного загрузчика (вместо загрузки
+                через self.fetcher)
+        """
+        feed_label = self._feed_label(feed_url)
         try:
-            logger.info(f"Получение RSS ленты: {feed_url}")
-            feed = feedparser.parse(feed_url)
+            logger.info("Получение RSS ленты: %s", feed_url)
+            start = time.perf_counter()
+            with tracer.span("fetch_feed", parent=parent, feed=feed_label) as span:
+                if self.feed_parser == "feedparser":
+                    if body is None:
+                        body = self.fetcher.fetch(feed_url)
+                    feed = parse_with_feedparser(body, stop_before, seen_ids)
+                else:
+                    if body is not None:
+                        chunks = split_chunks(body)
+                    elif chunks is None:
+                        chunks = self.fetcher.iter_chunks(feed_url)
+                    feed = parse_feed_stream(chunks, stop_before, seen_ids)
+                span.set_attribute("bytes", feed.bytes_read)
+                span.set_attribute("entries", len(feed.entries))
+                span.set_attribute("parser", feed.parser)
+            FEED_FETCH_SECONDS.observe(time.perf_counter() - start, feed=feed_label)
+            FEED_FETCH_BYTES.inc(feed.bytes_read, feed=feed_label)
+            if feed.stopped_early:
+                FEED_EARLY_STOPS.inc(feed=feed_label)
 
             if feed.bozo:
-                logger.warning(f"RSS лента содержит ошибки: {feed.bozo_exception}")
+                logger.warning("RSS лента содержит ошибки: %s", feed.bozo_exception)
 
-            if not feed.entries:
-                logger.warning(f"RSS лента пуста: {feed_url}")
+            if not feed.entries and not feed.stopped_early and not feed.skipped:
+                logger.warning("RSS лента пуста: %s", feed_url)
                 return None
 
-            logger.info(f"Получено {len(feed.entries)} записей из {feed_url}")
+            logger.info(
+                "Получено %s записей из %s, пропущено по отметке %s (%s)",
+                len(feed.entries),
+                feed_url,
+                feed.skipped,
+                "остановлено на отметке" if feed.stopped_early else "до конца",
+            )
             return feed
 
         except Exception as e:
+            FEED_FETCH_ERRORS.inc(feed=feed_label)
             logger.error(f"Ошибка при получении RSS ленты {feed_url}: {e}")
+            if raise_errors:
+                raise
             return None
 
+    def _log_http_stats(self):
+        """Пишет в лог переиспользование соединений и экономию от сжатия за цикл"""
+        if self.http_fetcher is None:
+            return
+        stats = self.http_fetcher.stats_since(self._http_stats_mark)
+        self._http_stats_mark = dict(self.http_fetcher.stats)
+        if not stats["requests"]:
+            return
+        decoded = stats["decoded_bytes"]
+        saved = 1 - stats["wire_bytes"] / decoded if decoded else 0.0
+        logger.info(
+            "HTTP: запросов %s, новых соединений %s (TLS %s), переиспользовано %s; "
+            "по сети %.1f КБ из %.1f КБ (экономия %.0f%%)",
+            stats["requests"],
+            stats["connections_new"],
+            stats["tls_handshakes"],
+            stats["connections_reused"],
+            stats["wire_bytes"] / 1024,
+            decoded / 1024,
+            saved * 100,
+        )
+
     async def get_new_entries(self) -> List[Dict]:
         """Возвращает новые записи из всех RSS лент с проверкой через Redis"""
-        all_new_entries = []
+        return [entry async for entry in self.iter_new_entries()]
+
+    async def iter_new_entries(self) -> AsyncIterator[Dict]:
+        """
+        Проверяет все RSS ленты и отдает новые и обновленные записи по мере обработки
+
+        Ленты проходят конвейер стадий (загрузка, разбор, сравнение, сохранение
+        и постановка в очередь) с ограниченными очередями между ними: пока одна
+        лента загружается, предыдущие разбираются и сохраняются. Записи ленты
+        отдаются, когда все они сохранены, поставлены в очередь и отметка
+        ленты сдвинута; в памяти держатся только ленты, находящиеся в конвейере.
+        Если потребитель прекращает итерацию, цикл считается прерванным:
+        контрольная точка остается.
+        """
+        stats = {
+            "feeds": 0,
+            "entries": 0,
+            "watermark_skipped": 0,
+            "stopped_early": 0,
+            "duplicates": 0,
+            "resumed": 0,
+            "interrupted": 0,
+            "new": 0,
+        }
+        self.last_cycle_stats = stats
+        # Индекс записей, уже обработанных в этом цикле: id записи -> ленты
+        self._seen_in_cycle = {}
+        self._cycle_sources = {}
 
         # Подключаемся к Redis
         await self.redis.connect()
+        if self.known_works:
+            await self.known_works.refresh()
+        if self.breaker:
+            await self.breaker.refresh()
+
+        if self.registry:
+            await self.registry.refresh()
+            self.feed_urls = await self.registry.due_feed_urls()
+
+        feed_urls = [url.strip() for url in self.feed_urls if url.strip()]
+        if self.sharding:
+            feed_urls = await self.sharding.select_feeds(feed_urls, self._feed_label)
+        if self.registry:
+            # Порядок внутри одного приоритета задает select_feeds
+            feed_urls.sort(key=self.registry.priority_of, reverse=True)
+
+        done_feeds = set()
+        if self.checkpoint:
+            done_feeds = await self.checkpoint.begin(self._cycle_interval_seconds())
+
+        queue_size = self.stage_queue_size
+        pipeline = Pipeline(
+            [
+                Stage(
+                    "fetch", self._fetch_stage, self.stage_workers["fetch"], queue_size
+                ),
+                Stage(
+                    "parse", self._parse_stage, self.stage_workers["parse"], queue_size
+                ),
+                Stage("diff", self._diff_stage, self.stage_workers["diff"], queue_size),
+                Stage(
+                    "persist",
+                    self._persist_stage,
+                    self.stage_workers["persist"],
+                    queue_size,
+                ),
+            ]
+        )
+        self._output = asyncio.Queue(queue_size)
+        completed = False
+        try:
+            async with pipeline:
+                dispatcher = asyncio.create_task(
+                    self._dispatch_feeds(pipeline, feed_urls, done_feeds)
+                )
+                try:
+                    while True:
+                        item = await self._output.get()
+                        if item is _CYCLE_DONE:
+                            break
+                        if isinstance(item, Exception):
+                            raise item
+                        yield item
+                finally:
+                    dispatcher.cancel()
+                    await asyncio.gather(dispatcher, return_exceptions=True)
+            completed = not stats["interrupted"]
+        finally:
+            self._log_pipeline_stats(pipeline)
+            await self._finish_cycle(stats, completed)
+
+    async def _dispatch_feeds(
+        self, pipeline: Pipeline, feed_urls: List[str], done_feeds: Set[str]
+    ):
+        """Отдает ленты цикла в конвейер и ждет, пока он опустеет"""
+        stats = self.last_cycle_stats
+        try:
+            for feed_url in feed_urls:
+                if self._stop_event.is_set():
+                    # Непроверенные ленты достанутся циклу после перезапуска
+                    stats["interrupted"] = 1
+                    logger.info("Цикл прерван остановкой парсера")
+                    break
+
+                feed_label = self._feed_label(feed_url)
+                if feed_label in done_feeds:
+                    stats["resumed"] += 1
+                    continue
 
-        for feed_url in self.feed_urls:
-            feed_url = feed_url.strip()
-            if not feed_url:
-                continue
+                # Ждет, если стадия загрузки не успевает
+                await pipeline.put(_FeedJob(feed_url, feed_label))
 
-            logger.info(f"Проверка ленты: {feed_url}")
-            feed = self.fetch_feed(feed_url)
-            if not feed:
+            await pipeline.join()
+            await self._output.put(_CYCLE_DONE)
+        except Exception as e:
+            await self._output.put(e)
+
+    async def _throttle(self):
+        """Выдерживает FEED_DELAY_SECONDS между началами запросов к сайту"""
+        now = time.monotonic()
+        start_at = max(now, self._next_fetch_at)
+        self._next_fetch_at = start_at + self.feed_delay_seconds
+        if start_at > now:
+            logger.debug(
+                "Ожидание %.1f секунд перед загрузкой следующей ленты...",
+                start_at - now,
+            )
+            await self._sleep(start_at - now)
+
+    async def _parse_feed(self, job: _FeedJob) -> Optional[ParsedFeed]:
+        """Разбирает ленту (и загружает ее, если тела еще нет) в отдельном потоке"""
+        job.parsed = True
+        chunks = None
+        if self.http_fetcher is not None and job.body is None:
+            # Части ответа httpx читаются в event loop и передаются в поток разбора
+            chunks = iter_async_chunks(
+                self.http_fetcher.iter_chunks(job.url), asyncio.get_running_loop()
+            )
+        # Загрузка urllib и разбор блокируют, поэтому не держим event loop
+        return await asyncio.to_thread(
+            self.fetch_feed,
+            job.url,
+            job.watermark.get("updated"),
+            set(job.watermark.get("ids", [])),
+            job.body,
+            True,
+            job.trace,
+            chunks,
+        )
+
+    async def _fetch_stage(self, job: _FeedJob) -> List[_FeedJob]:
+        """
+        Стадия загрузки: аренда ленты, circuit breaker, отметка прошлой
+        проверки и тело ленты
+
+        Проверки делаются прямо перед запросом, а не при постановке ленты
+        в конвейер: так breaker учитывает ошибки предыдущих лент цикла,
+        а остановка не дает начать загрузку уже поставленных лент.
+        """
+        if self._stop_event.is_set():
+            # Непроверенные ленты достанутся циклу после перезапуска
+            self.last_cycle_stats["interrupted"] = 1
+            return []
+
+        # Ленту обрабатывает только реплика, захватившая ее аренду
+        if self.sharding and not await self.sharding.acquire(job.label):
+            return []
+
+        if self.breaker and not await self.breaker.allow(job.url):
+            logger.info("Лента %s пропущена: открыт circuit breaker", job.url)
+            if self.sharding:
+                await self.sharding.release(job.label)
+            return []
+
+        if self.backpressure:
+            await self.backpressure.refresh()
+
+        logger.info("Проверка ленты: %s", job.url)
+        job.span = tracer.span("process_feed", feed=job.label).start()
+        job.watermark = await self.redis.get_feed_watermark(job.label)
+        await self._throttle()
+        try:
+            if self.http_fetcher is not None and self.feed_parser == "feedparser":
+                # feedparser разбирает только документ целиком
+                try:
+                    with tracer.span("http_fetch", parent=job.trace, feed=job.label):
+                        job.body = await self.http_fetcher.fetch(job.url)
+                except Exception as e:
+                    FEED_FETCH_ERRORS.inc(feed=job.label)
+                    logger.error(f"Ошибка при получении RSS ленты {job.url}: {e}")
+                    raise
+            else:
+                # Загрузчик читает ленту потоково, а разбор прекращает загрузку
+                # на отметке, поэтому загрузка и разбор идут вместе в этой стадии
+                job.feed = await self._parse_feed(job)
+        except Exception as e:
+            await self._release_feed(job, e)
+            return []
+        # Сразу закрываем breaker: следующая лента не должна ждать разбора этой
+        if self.breaker:
+            await self.breaker.record_success(job.url)
+        return [job]
+
+    async def _parse_stage(self, job: _FeedJob) -> List[_EntryJob]:
+        """Стадия разбора: записи ленты без повторов из других лент цикла"""
+        try:
+            if not job.parsed:
+                job.feed = await self._parse_feed(job)
+        except Exception as e:
+            await self._release_feed(job, e)
+            return []
+
+        feed = job.feed
+        if not feed:
+            # Пустая лента: отметку не сдвигаем
+            await self._release_feed(job)
+            return []
+
+        stats = self.last_cycle_stats
+        stats["feeds"] += 1
+        stats["entries"] += len(feed.entries)
+        stats["watermark_skipped"] += feed.skipped
+        stats["stopped_early"] += int(feed.stopped_early)
+        ENTRIES_TOTAL.inc(feed.skipped, result="skipped", reason="watermark")
+
+        items = []
+        for entry in feed.entries:
+            # Работа из нескольких тегов обрабатывается один раз за цикл,
+            # из остальных лент только запоминаем тег
+            entry_key = entry.get("id") or entry.get("link", "")
+            source_feeds = self._seen_in_cycle.get(entry_key)
+            if source_feeds is not None:
+                source_feeds.add(job.label)
+                stats["duplicates"] += 1
+                ENTRIES_TOTAL.inc(result="skipped", reason="duplicate")
                 continue
+            source_feeds = {job.label}
+            if entry_key:
+                self._seen_in_cycle[entry_key] = source_feeds
 
-            new_entries = []
+            item = _EntryJob(job, entry, source_feeds)
+            if self._extract_entry(item):
+                items.append(item)
 
-            for entry in feed.entries:
-                # Извлекаем work_id и дату обновления
-                work_id = self._extract_work_id(entry)
-                if not work_id:
-                    logger.warning("Не удалось извлечь work_id из записи")
-                    continue
+        job.pending = len(items)
+        if not items:
+            await self._complete_feed(job)
+        return items
 
-                # Проверяем язык работы
-                description = entry.get("summary", "")
-                language = self._extract_language(description)
-                if language and language.lower() not in ["русский", "russian", "ru"]:
-                    logger.info(
-                        f"Пропускаем work {work_id} - язык не русский: {language}"
-                    )
-                    continue
+    async def _diff_stage(self, item: _EntryJob) -> List[_EntryJob]:
+        """Стадия сравнения с сохраненными метаданными"""
+        try:
+            if await self._diff_entry(item):
+                return [item]
+        except Exception as e:
+            await self._entry_done(item, error=e)
+            raise
+        await self._entry_done(item)
+        return []
 
-                # Извлекаем автора и количество глав для сравнения
-                current_author = self._extract_author(entry)
-                current_chapters = self._extract_chapters(description)
+    async def _persist_stage(self, item: _EntryJob) -> None:
+        """Стадия сохранения метаданных и постановки в очередь отправки"""
+        try:
+            entry_data = await self._persist_entry(item)
+        except Exception as e:
+            await self._entry_done(item, error=e)
+            raise
+        await self._entry_done(item, entry_data)
+
+    async def _entry_done(
+        self,
+        item: _EntryJob,
+        entry_data: Optional[Dict] = None,
+        error: Optional[Exception] = None,
+    ):
+        """Запись прошла конвейер; последняя запись ленты завершает ленту"""
+        job = item.job
+        if error is not None:
+            job.error = error
+        if entry_data:
+            job.new_entries.append(entry_data)
+        job.pending -= 1
+        if job.pending == 0:
+            await self._complete_feed(job)
+
+    async def _complete_feed(self, job: _FeedJob):
+        """
+        Все записи ленты обработаны: сдвигает отметку, отмечает ленту
+        в контрольной точке и отдает найденные записи
+        """
+        if job.error is None:
+            watermark = await self._advance_watermark(
+                job.label, job.watermark, job.feed
+            )
+            if self.registry:
+                await self.registry.mark_checked(job.label)
+            if self.checkpoint:
+                await self.checkpoint.feed_done(job.label, watermark)
+            job.span.set_attribute("updated", len(job.new_entries))
+            job.span.end()
+        else:
+            # Необработанные записи разберем в следующем цикле
+            logger.warning(
+                "Лента %s обработана с ошибками, отметка не сдвинута", job.url
+            )
+            if self.sharding:
+                await self.sharding.release(job.label)
+            job.span.end(job.error)
 
-                # Проверяем, есть ли данные в Redis
-                existing_metadata = await self.redis.get_fanfic_metadata(work_id)
+        if job.new_entries:
+            logger.info(
+                "Найдено %s новых/обновленных записей в %s",
+                len(job.new_entries),
+                job.url,
+            )
+            self.last_cycle_stats["new"] += len(job.new_entries)
+            for entry_data in job.new_entries:
+                await self._output.put(entry_data)
+
+    async def _release_feed(self, job: _FeedJob, error: Optional[Exception] = None):
+        """Лента не загружена или пуста: учитываем ошибку и отпускаем аренду"""
+        if error is not None and self.breaker:
+            await self.breaker.record_failure(job.url, error)
+        if self.sharding:
+            # Даем другой реплике попробовать ленту, не дожидаясь аренды
+            await self.sharding.release(job.label)
+        if job.span:
+            job.span.end(error)
+
+    def _log_pipeline_stats(self, pipeline: Pipeline):
+        """Пишет в лог загрузку стадий конвейера за цикл"""
+        parts = []
+        for name, stage in pipeline.stats().items():
+            if not stage["processed"]:
+                continue
+            parts.append(
+                f"{name} {stage['processed']:.0f} шт, "
+                f"{stage['avg_seconds'] * 1000:.1f} мс/шт, "
+                f"загрузка {stage['utilization'] * 100:.0f}%, "
+                f"ожидание следующей стадии {stage['blocked_seconds']:.1f} с"
+            )
+        if parts:
+            logger.info("Конвейер: %s", "; ".join(parts))
+
+    async def _finish_cycle(self, stats: Dict[str, int], completed: bool):
+        """
+        Завершает цикл: контрольная точка (только для полного цикла), отложенные
+        работы, теги работ, снимок фильтра и итоги в лог
+        """
+        if self.checkpoint and completed:
+            await self.checkpoint.finish()
+
+        if self.backpressure and not await self.backpressure.refresh():
+            await self.backpressure.release_deferred()
+
+        await self._save_source_feeds()
+        if self.known_works:
+            await self.known_works.snapshot()
+        self._log_http_stats()
+
+        logger.info(
+            "Цикл: лент %s, записей к проверке %s, пропущено по отметке %s, "
+            "лент остановлено на отметке %s, повторов из других лент %s, "
+            "лент проверено до перезапуска %s",
+            stats["feeds"],
+            stats["entries"],
+            stats["watermark_skipped"],
+            stats["stopped_early"],
+            stats["duplicates"],
+            stats["resumed"],
+        )
+        if stats["new"]:
+            logger.info(
+                "Всего найдено %s новых/обновленных записей из %s лент",
+                stats["new"],
+                len(self.feed_urls),
+            )
 
-                # Проверяем, нужно ли обновлять работу
-                needs_update = False
-                update_reason = None
+    def _cycle_interval_seconds(self) -> float:
+        """Интервал проверки: контрольная точка старше него не продолжается"""
+        if self.registry:
+            return self.registry.check_interval_minutes() * 60
+        return Config.CHECK_INTERVAL_MINUTES * 60
 
-                if not existing_metadata:
-                    # Новая работа
-                    needs_update = True
-                    update_reason = UpdateReason.NEW
-                    logger.info(f"Новая работа {work_id}")
-                else:
-                    # Сравниваем автора и количество глав
-                    existing_author = existing_metadata.get("author", "")
-                    existing_chapters = existing_metadata.get("chapters", "")
-
-                    if current_author != existing_author:
-                        needs_update = True
-                        update_reason = UpdateReason.AUTHOR
-                        logger.info(
-                            f"Work {work_id} - изменился автор: '{existing_author}' -> '{current_author}'"
-                        )
-
-                    if current_chapters and current_chapters != existing_chapters:
-                        needs_update = True
-                        update_reason = UpdateReason.CHAPTER
-                        logger.info(
-                            f"Work {work_id} - изменилось количество глав: '{existing_chapters}' -> '{current_chapters}'"
-                        )
-
-                if not needs_update:
-                    # Данные не изменились, пропускаем
-                    logger.debug(f"Work {work_id} не изменился, пропускаем")
-                    continue
+    def request_stop(self):
+        """
+        Просит остановиться после текущей ленты
 
-                # Нужно обновить данные
-                logger.info(f"Обновляем work {work_id} (причина: {update_reason})")
+        Отметка и контрольная точка уже проверенных лент сохранены, поэтому
+        следующий запуск продолжит цикл с первой непроверенной ленты.
+        """
+        self._stop_event.set()
 
-                # Парсим все поля записи
-                entry_data = await self._parse_entry(
-                    entry, work_id, feed_url, update_reason
+    async def _sleep(self, seconds: float):
+        """Пауза, прерываемая request_stop"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    @staticmethod
+    def _merge_source_feeds(stored: str, cycle_feeds: Set[str]) -> str:
+        """Объединяет сохраненные и найденные в цикле теги работы"""
+        feeds = {feed for feed in stored.split(",") if feed} | cycle_feeds
+        return ",".join(sorted(feeds))
+
+    async def _save_source_feeds(self):
+        """Дописывает работам теги, в которых они встретились за цикл"""
+        updates = {}
+        for work_id, (cycle_feeds, stored) in self._cycle_sources.items():
+            merged = self._merge_source_feeds(stored, cycle_feeds)
+            if merged != stored:
+                updates[work_id] = {"source_feeds": merged}
+        self._cycle_sources = {}
+
+        if updates:
+            await self.redis.update_fanfic_fields(updates)
+            logger.info("Обновлены теги %s работ", len(updates))
+
+    async def _advance_watermark(self, feed_label: str, watermark: Dict, feed) -> Dict:
+        """
+        Сдвигает отметку ленты на самую новую обработанную запись
+
+        Вместе с датой хранятся id записей ровно с этой датой: на следующем
+        цикле они пропускаются, а другие записи с той же датой - нет.
+
+        Returns:
+            Отметка ленты после сдвига
+        """
+        newest = max((entry.get("updated", "") for entry in feed.entries), default="")
+        current = watermark.get("updated", "")
+        if not newest or newest < current:
+            return watermark
+
+        ids = {
+            entry.get("id", "")
+            for entry in feed.entries
+            if entry.get("updated", "") == newest and entry.get("id")
+        }
+        if newest == current:
+            seen = set(watermark.get("ids", []))
+            if ids <= seen:
+                return watermark
+            ids |= seen
+
+        advanced = {"updated": newest, "ids": sorted(ids)}
+        await self.redis.save_feed_watermark(feed_label, advanced)
+        return advanced
+
+    def _extract_entry(self, item: _EntryJob) -> bool:
+        """
+        Извлекает из записи work_id и разбирает все поля для сравнения
+
+        Returns:
+            False, если запись пропущена (нет work_id, язык не русский
+            или запись не разобрана)
+        """
+        entry = item.entry
+        with tracer.span("extract_entry", parent=item.job.trace) as span:
+            # Извлекаем work_id и дату обновления
+            work_id = self._extract_work_id(entry)
+            if not work_id:
+                logger.warning("Не удалось извлечь work_id из записи")
+                ENTRIES_TOTAL.inc(result="skipped", reason="invalid")
+                return False
+            span.set_attribute("work_id", work_id)
+
+            # Проверяем язык работы
+            description = entry.get("summary", "")
+            language = self._extract_language(description)
+            if language and language.lower() not in ["русский", "russian", "ru"]:
+                logger.info(
+                    "Пропускаем work %s - язык не русский: %s", work_id, language
                 )
+                ENTRIES_TOTAL.inc(result="skipped", reason="language")
+                return False
+
+        # Все поля нужны для сравнения с сохраненными метаданными
+        with tracer.span("parse_entry", parent=item.job.trace, work_id=work_id):
+            parse_start = time.perf_counter()
+            entry_data = self._parse_entry(entry, work_id, item.job.url)
+            ENTRY_PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+
+        if not entry_data:
+            ENTRIES_TOTAL.inc(result="skipped", reason="invalid")
+            return False
+        item.work_id = work_id
+        item.data = entry_data
+        return True
+
+    async def _diff_entry(self, item: _EntryJob) -> bool:
+        """
+        Сравнивает запись с сохраненными метаданными работы по полям
+
+        Returns:
+            True, если работа новая или изменилось хотя бы одно поле
+        """
+        work_id = item.work_id
+        # Проверяем, есть ли данные в Redis
+        with tracer.span("redis_lookup", parent=item.job.trace, work_id=work_id):
+            if self.known_works and not self.known_works.might_exist(work_id):
+                # Фильтр точно знает, что работы нет - HGETALL не нужен
+                existing_metadata = None
+            else:
+                existing_metadata = await self.redis.get_fanfic_metadata(work_id)
+        item.existing = existing_metadata
+
+        stored_sources = (existing_metadata or {}).get("source_feeds", "")
+        self._cycle_sources[work_id] = (item.source_feeds, stored_sources)
+
+        diff = diff_metadata(item.data, existing_metadata)
+        item.diff = diff
+
+        if not diff.fields:
+            # Данные не изменились, пропускаем
+            logger.debug("Work %s не изменился, пропускаем", work_id)
+            ENTRIES_TOTAL.inc(result="skipped", reason="unchanged")
+            return False
+
+        if diff.reason is None:
+            # Изменились только неотслеживаемые поля (дата, ссылка):
+            # записываем их без уведомления
+            logger.debug(
+                "Work %s - обновлены поля без уведомления: %s",
+                work_id,
+                ", ".join(diff.fields),
+            )
+            ENTRIES_TOTAL.inc(result="skipped", reason="unchanged")
+            return True
 
-                if entry_data:
-                    # Сохраняем в Redis
-                    await self.redis.save_fanfic_metadata(work_id, entry_data)
+        if diff.reason == UpdateReason.NEW:
+            logger.info("Новая работа %s", work_id)
+            ENTRIES_TOTAL.inc(result="new", reason=diff.reason.value)
+        else:
+            logger.info(
+                "Work %s - изменились поля: %s (причины: %s)",
+                work_id,
+                ", ".join(diff.changes),
+                ", ".join(reason.value for reason in diff.reasons),
+            )
+            ENTRIES_TOTAL.inc(result="updated", reason=diff.reason.value)
+
+        # Нужно обновить данные
+        logger.info("Обновляем work %s (причина: %s)", work_id, diff.reason)
+        item.reason = diff.reason
+        return True
+
+    async def _persist_entry(self, item: _EntryJob) -> Optional[Dict]:
+        """
+        Сохраняет новую работу целиком, у известной - только изменившиеся
+        поля, и ставит работу в очередь, если причина требует уведомления
+
+        Returns:
+            Метаданные работы после обновления или None, если причины
+            обновления нет (изменились только неотслеживаемые поля)
+
+        Raises:
+            PersistError: Redis не принял метаданные или элемент очереди
+        """
+        entry = item.entry
+        work_id = item.work_id
+        existing_metadata = item.existing
+        update_reason = item.reason
+        diff = item.diff
+        parent = item.job.trace
+
+        stored_sources = (existing_metadata or {}).get("source_feeds", "")
+        source_feeds = self._merge_source_feeds(stored_sources, item.source_feeds)
+        # Сохраненное значение уже включает теги, известные на этот момент
+        self._cycle_sources[work_id] = (item.source_feeds, source_feeds)
+        change = diff.log_entry() if update_reason is not None else None
+
+        # Сохраняем в Redis
+        with tracer.span("persist", parent=parent, work_id=work_id):
+            if not existing_metadata:
+                entry_data = dict(item.data)
+                entry_data["source_feeds"] = source_feeds
+                entry_data["update_reason"] = update_reason.value
+                bloom_bits = None
+                if self.known_works:
+                    bloom_bits = self.known_works.remember(work_id)
+                saved = await self.redis.save_fanfic_metadata(
+                    work_id, entry_data, bloom_bits=bloom_bits, change=change
+                )
+            else:
+                fields = dict(diff.fields)
+                if source_feeds != stored_sources:
+                    fields["source_feeds"] = source_feeds
+                if (
+                    update_reason is not None
+                    and existing_metadata.get("update_reason") != update_reason.value
+                ):
+                    fields["update_reason"] = update_reason.value
+                saved = await self.redis.update_fanfic_metadata(
+                    work_id, fields, change=change, previous=existing_metadata
+                )
+                entry_data = {**existing_metadata, **fields}
+            # Ошибка записи оставляет job.error: отметка ленты не сдвигается,
+            # и следующий цикл снова найдет отличия
+            if not saved:
+                raise PersistError(f"Не сохранены метаданные work {work_id}")
 
-                    # Проверяем, не отправлялось ли сообщение недавно
-                    logger.info(f"Проверяем, отправлялся ли work {work_id} недавно...")
-                    was_sent_recently = await self.redis.was_message_sent_recently(
-                        work_id, Config.DAYS_TO_CHECK
-                    )
-                    logger.info(
-                        f"Work {work_id} отправлялся недавно: {was_sent_recently}"
-                    )
+        if update_reason is None:
+            return None
 
-                    if was_sent_recently:
-                        logger.info(
-                            f"Work {work_id} уже отправлялся за последние {Config.DAYS_TO_CHECK} дней, пропускаем"
-                        )
-                    else:
-                        # Добавляем в очередь только если не отправлялся недавно
-                        logger.info(f"Добавляем work {work_id} в очередь...")
-                        await self.redis.add_to_queue(work_id)
-                        logger.info(
-                            f"Добавлен work {work_id} в очередь и сохранены метаданные"
-                        )
+        if update_reason.value not in self.notify_reasons:
+            ENQUEUE_TOTAL.inc(result="silent")
+            logger.info(
+                "Work %s обновлен без уведомления (причина: %s)",
+                work_id,
+                update_reason.value,
+            )
+            return entry_data
 
-                    new_entries.append(entry_data)
+        if self.subscriptions:
+            # Личные очереди не должны мешать посту в канал: повтор после
+            # ошибки не найдет отличий, и пост бы потерялся
+            try:
+                with tracer.span("fan_out", parent=parent, work_id=work_id):
+                    await self.subscriptions.fan_out(work_id, entry_data)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки work {work_id} подписчикам: {e}")
+
+        with tracer.span("enqueue", parent=parent, work_id=work_id):
+            # Проверяем, не отправлялось ли сообщение недавно
+            logger.info("Проверяем, отправлялся ли work %s недавно...", work_id)
+            was_sent_recently = await self.redis.was_message_sent_recently(
+                work_id, Config.DAYS_TO_CHECK
+            )
+            logger.info("Work %s отправлялся недавно: %s", work_id, was_sent_recently)
 
-            if new_entries:
+            if was_sent_recently:
+                ENQUEUE_TOTAL.inc(result="sent_recently")
                 logger.info(
-                    f"Найдено {len(new_entries)} новых/обновленных записей в {feed_url}"
+                    "Work %s уже отправлялся за последние %s дней, пропускаем",
+                    work_id,
+                    Config.DAYS_TO_CHECK,
+                )
+            else:
+                # Контекст трассы и время обновления в AO3 едут вместе с элементом
+                queue_meta = {"feed_updated": entry.get("updated", "")}
+                traceparent = tracer.current_traceparent()
+                if traceparent:
+                    queue_meta["traceparent"] = traceparent
+
+                if self.backpressure and self.backpressure.should_defer(update_reason):
+                    # Отправитель не успевает - низкоприоритетное обновление ждет
+                    if not await self.backpressure.defer(work_id, queue_meta):
+                        raise PersistError(f"Не отложен work {work_id}")
+                    ENQUEUE_TOTAL.inc(result="deferred")
+                    logger.info(
+                        "Work %s отложен до разгрузки очереди (причина: %s)",
+                        work_id,
+                        update_reason.value,
+                    )
+                    return entry_data
+
+                # Добавляем в очередь только если не отправлялся недавно
+                logger.info("Добавляем work %s в очередь...", work_id)
+                if self.backpressure:
+                    await self.redis.discard_deferred(work_id)
+                if not await self.redis.add_to_queue(work_id, queue_meta):
+                    raise PersistError(f"Не добавлен в очередь work {work_id}")
+                ENQUEUE_TOTAL.inc(result="queued")
+                logger.info(
+                    "Добавлен work %s в очередь и сохранены метаданные", work_id
                 )
-                all_new_entries.extend(new_entries)
-
-            # Задержка между лентами, чтобы не создавать избыточную нагрузку на сайт
-            logger.debug("Ожидание 15 секунд перед обработкой следующей ленты...")
-            await asyncio.sleep(15)
-
-        if all_new_entries:
-            logger.info(
-                f"Всего найдено {len(all_new_entries)} новых/обновленных записей "
-                f"из {len(self.feed_urls)} лент"
-            )
 
-        return all_new_entries
+        return entry_data
 
-    async def _parse_entry(
-        self, entry, work_id: str, feed_url: str, update_reason: UpdateReason
-    ) -> Optional[Dict]:
+    def _parse_entry(self, entry, work_id: str, feed_url: str) -> Optional[Dict]:
         """Парсит все поля записи RSS"""
         try:
             import html
@@ -320,7 +1102,6 @@ class RSSParser:
                 "published": self._extract_published_date(entry),
                 "updated_at": updated_date,
                 "source_feed": feed_url,
-                "update_reason": update_reason.value,
                 "source": Source.RSS.value,
                 **metadata,  # Добавляем все извлеченные метаданные
             }
@@ -0,0 +1,212 @@
+"""
+Распределение лент между несколькими репликами парсера
+
+Режимы (Config.PARSER_WORKER_MODE):
+- single: одна реплика проверяет все ленты (поведение по умолчанию)
+- lease: реплики разбирают ленты по очереди, захватывая аренду в Redis
+- hash: каждая лента закреплена за репликой rendezvous хешированием по живым
+  репликам (heartbeat); при падении реплики ее ленты переходят к остальным
+
+В обоих распределенных режимах ленту обрабатывает только держатель аренды
+parser:lease:{tag_id}, поэтому даже при расхождении списков живых реплик
+лента не загружается дважды за цикл.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import socket
+import time
+from typing import List, Optional
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = "parser:workers"
+LEASE_KEY = "parser:lease:{feed}"
+
+FEED_LEASES = metrics.counter(
+    "parser_feed_leases_total",
+    "Попытки захвата аренды ленты: acquired/busy/skipped",
+    ["result"],
+)
+LIVE_WORKERS = metrics.gauge(
+    "parser_live_workers", "Количество живых реплик парсера по heartbeat"
+)
+
+
+def default_worker_id() -> str:
+    """Идентификатор реплики по умолчанию: хост и PID"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def rendezvous_owner(feed: str, workers: List[str]) -> Optional[str]:
+    """
+    Выбирает владельца ленты rendezvous (HRW) хешированием
+
+    При уходе реплики переезжают только ее ленты, остальные остаются на месте.
+    """
+    best_worker = None
+    best_score = -1
+    for worker in workers:
+        digest = hashlib.blake2b(f"{worker}:{feed}".encode(), digest_size=8).digest()
+        score = int.from_bytes(digest, "big")
+        if score > best_score:
+            best_worker, best_score = worker, score
+    return best_worker
+
+
+class FeedSharding:
+    """Координация реплик парсера через heartbeat и аренды лент в Redis"""
+
+    def __init__(
+        self,
+        redis: RedisConnector,
+        mode: str = "lease",
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 0,
+        heartbeat_seconds: float = 30,
+        worker_ttl_seconds: float = 90,
+    ):
+        self.redis = redis
+        self.mode = mode
+        self.worker_id = worker_id or default_worker_id()
+        # По умолчанию аренда живет почти весь интервал проверки: за цикл
+        # ленту забирает ровно одна реплика
+        self.lease_seconds = lease_seconds or max(
+            60.0, Config.CHECK_INTERVAL_MINUTES * 60 * 0.9
+        )
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_ttl_seconds = worker_ttl_seconds
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _lease_key(feed_label: str) -> str:
+        return LEASE_KEY.format(feed=feed_label)
+
+    async def heartbeat(self):
+        """Отмечает реплику живой и удаляет просроченные реплики"""
+        await self.redis._ensure_connected()
+        now = time.time()
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+            pipe.zremrangebyscore(WORKERS_KEY, 0, now - self.worker_ttl_seconds)
+            await pipe.execute()
+
+    async def live_workers(self) -> List[str]:
+        """Возвращает отсортированный список живых реплик"""
+        await self.redis._ensure_connected()
+        cutoff = time.time() - self.worker_ttl_seconds
+        raw = await self.redis.redis.zrangebyscore(WORKERS_KEY, cutoff, "+inf")
+        workers = sorted(w.decode() if isinstance(w, bytes) else w for w in raw)
+        LIVE_WORKERS.set(len(workers))
+        return workers
+
+    async def start(self):
+        """Регистрирует реплику и запускает фоновый heartbeat"""
+        await self.heartbeat()
+        self.task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(
+            "Реплика парсера %s запущена в режиме %s", self.worker_id, self.mode
+        )
+
+    async def stop(self):
+        """Останавливает heartbeat и сразу выводит реплику из распределения"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        try:
+            await self.redis._ensure_connected()
+            await self.redis.redis.zrem(WORKERS_KEY, self.worker_id)
+        except Exception as e:
+            logger.error(f"Ошибка снятия реплики {self.worker_id} с учета: {e}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Ошибка heartbeat реплики {self.worker_id}: {e}")
+
+    async def select_feeds(self, feed_urls: List[str], label_of) -> List[str]:
+        """
+        Возвращает ленты, которые реплике стоит попытаться обработать в этом цикле
+
+        Args:
+            feed_urls: Все ленты
+            label_of: Функция получения метки ленты (tag_id) из URL
+        """
+        if self.mode == "hash":
+            await self.heartbeat()
+            workers = await self.live_workers()
+            if self.worker_id not in workers:
+                workers.append(self.worker_id)
+            selected = [
+                url
+                for url in feed_urls
+                if rendezvous_owner(label_of(url), workers) == self.worker_id
+            ]
+            FEED_LEASES.inc(len(feed_urls) - len(selected), result="skipped")
+            logger.info(
+                "Реплике %s назначено %s из %s лент (%s живых реплик)",
+                self.worker_id,
+                len(selected),
+                len(feed_urls),
+                len(workers),
+            )
+            return selected
+
+        # lease: все реплики идут по лентам в своем случайном порядке,
+        # чтобы реже сталкиваться на одних и тех же арендах
+        selected = list(feed_urls)
+        random.shuffle(selected)
+        return selected
+
+    async def acquire(self, feed_label: str) -> bool:
+        """Захватывает аренду ленты; True, если ленту обрабатывает эта реплика"""
+        await self.redis._ensure_connected()
+        key = self._lease_key(feed_label)
+        acquired = await self.redis.redis.set(
+            key, self.worker_id, nx=True, px=int(self.lease_seconds * 1000)
+        )
+        if acquired:
+            FEED_LEASES.inc(result="acquired")
+            return True
+        FEED_LEASES.inc(result="busy")
+        logger.debug("Лента %s занята другой репликой", feed_label)
+        return False
+
+    async def release(self, feed_label: str):
+        """Освобождает аренду ленты (например, после ошибки загрузки)"""
+        try:
+            await self.redis._ensure_connected()
+            key = self._lease_key(feed_label)
+            owner = await self.redis.redis.get(key)
+            if owner is not None and owner.decode() == self.worker_id:
+                await self.redis.redis.delete(key)
+        except Exception as e:
+            logger.error(f"Ошибка освобождения аренды ленты {feed_label}: {e}")
+
+
+def create_sharding(redis: RedisConnector) -> Optional[FeedSharding]:
+    """Создает координатор по настройкам Config или None в режиме single"""
+    if Config.PARSER_WORKER_MODE not in ("lease", "hash"):
+        return None
+    return FeedSharding(
+        redis,
+        mode=Config.PARSER_WORKER_MODE,
+        worker_id=Config.PARSER_WORKER_ID or None,
+        lease_seconds=Config.FEED_LEASE_SECONDS,
+        heartbeat_seconds=Config.PARSER_HEARTBEAT_SECONDS,
+        worker_ttl_seconds=Config.PARSER_WORKER_TTL_SECONDS,
+    )
@@ -1,106 +1,225 @@
 import asyncio
 import logging
 import sys
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
 from config import Config
-from telegram_bot.telegram_bot import TelegramNotifier
-from utils.redis_connector import redis_connector
+from telegram_bot.commands import (
+    CommandPoller,
+    register_search_commands,
+    register_subscription_commands,
+)
+from telegram_bot.telegram_bot import ChatUnavailable, TelegramNotifier
+from utils.metrics import metrics
+from utils.profiler import cycle_profiler
+from utils.redis_connector import RedisConnector, redis_connector
 from utils.schemas import Source
+from utils.search import create_search
+from utils.subscriptions import SubscriptionIndex, create_subscriptions
+from utils.tracing import SpanContext, tracer
 
 logger = logging.getLogger(__name__)
 
+DELIVERY_BUCKETS = (10, 30, 60, 300, 600, 1800, 3600, 7200, 21600, 86400)
+ENQUEUE_TO_POST_SECONDS = metrics.histogram(
+    "queue_enqueue_to_post_seconds",
+    "Время от постановки в очередь до отправки в канал",
+    buckets=DELIVERY_BUCKETS,
+)
+FEED_TO_POST_SECONDS = metrics.histogram(
+    "ao3_update_to_post_seconds",
+    "Время от обновления работы в AO3 до отправки в канал",
+    buckets=DELIVERY_BUCKETS,
+)
+DIRECT_MESSAGES = metrics.counter(
+    "subscriptions_messages_total",
+    "Личные сообщения подписчикам: sent, failed, unavailable",
+    ["result"],
+)
+
 
 class RSSBot:
     """Основной класс бота для работы с очередью Redis"""
 
-    def __init__(self):
-        self.telegram_notifier = TelegramNotifier(
+    def __init__(
+        self,
+        telegram_notifier: Optional[TelegramNotifier] = None,
+        redis: Optional[RedisConnector] = None,
+        consumers: int = Config.BOT_CONSUMERS,
+        subscriptions: Optional[SubscriptionIndex] = None,
+        commands: Optional[CommandPoller] = None,
+    ):
+        self.telegram_notifier = telegram_notifier or TelegramNotifier(
             Config.TELEGRAM_BOT_TOKEN, Config.TELEGRAM_CHANNEL_ID
         )
-        self.redis = redis_connector
+        self.redis = redis or redis_connector
+        # Личные очереди подписчиков (None - только канал)
+        self.subscriptions = subscriptions
+        # Команды в личных сообщениях (None - бот команды не читает)
+        self.commands = commands
+        # Несколько потребителей поддерживаются только транспортом stream
+        self.consumers = max(1, consumers)
+        self.running = False
+        # Запрошена остановка: начатая отправка завершается, паузы прерываются
+        self._stop_event = asyncio.Event()
+
+    def request_stop(self):
+        """Просит остановиться после текущей отправки"""
         self.running = False
+        self._stop_event.set()
+        if self.commands:
+            self.commands.stop()
 
-    async def process_queue_item(self, work_id: str) -> bool:
-        """Обрабатывает один элемент из очереди"""
+    async def _sleep(self, seconds: float):
+        """Пауза, прерываемая request_stop"""
         try:
-            logger.info(f"Обрабатываем work_id: {work_id}")
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def process_queue_item(
+        self, work_id: str, meta: Optional[Dict] = None
+    ) -> bool:
+        """
+        Обрабатывает один элемент из очереди
+
+        Args:
+            work_id: ID работы
+            meta: Данные элемента очереди (время постановки, traceparent)
+        """
+        meta = meta or {}
+        parent = SpanContext.from_traceparent(meta.get("traceparent", ""))
+        with tracer.span("process_queue_item", parent=parent, work_id=work_id) as span:
+            try:
+                logger.info("Обрабатываем work_id: %s", work_id)
 
-            # Получаем метаданные из Redis
-            metadata = await self.redis.get_fanfic_metadata(work_id)
-            if not metadata:
-                logger.warning(f"Метаданные для work_id {work_id} не найдены")
-                return False
+                # Получаем метаданные из Redis
+                metadata = await self.redis.get_fanfic_metadata(work_id)
+                if not metadata:
+                    logger.warning("Метаданные для work_id %s не найдены", work_id)
+                    # Повторная доставка не поможет - убираем элемент
+                    await self.redis.ack_queue_item(work_id, meta)
+                    return False
 
-            logger.info(
-                f"Получены метаданные для work_id {work_id}: {metadata.get('title', 'Без названия')}"
-            )
+                logger.info(
+                    "Получены метаданные для work_id %s: %s",
+                    work_id,
+                    metadata.get("title", "Без названия"),
+                )
 
-            # Проверяем источник работы
-            source = metadata.get("source")
-            if source == Source.SEARCH.value:
-                # Если источник - поиск, переносим в конец очереди без отправки
-                logger.info(f"Work {work_id} из поиска - переносим в конец очереди")
-                await self.redis.add_to_queue(work_id)
-                logger.info(f"Work {work_id} добавлен в конец очереди")
-                return True
+                # Проверяем источник работы
+                source = metadata.get("source")
+                if source == Source.SEARCH.value:
+                    # Если источник - поиск, переносим в конец очереди без отправки
+                    logger.info(
+                        "Work %s из поиска - переносим в конец очереди", work_id
+                    )
+                    requeue_meta = {
+                        k: v
+                        for k, v in meta.items()
+                        if k not in ("enqueued_at", "stream_id")
+                    }
+                    await self.redis.add_to_queue(work_id, requeue_meta)
+                    await self.redis.ack_queue_item(work_id, meta)
+                    logger.info("Work %s добавлен в конец очереди", work_id)
+                    return True
+
+                # Для RSS работ формируем и отправляем сообщение
+                logger.info("Work %s из RSS - формируем сообщение", work_id)
+
+                # Форматируем сообщение
+                message = self.telegram_notifier.format_entry_for_telegram(metadata)
+                logger.info("Сформировано сообщение длиной %s символов", len(message))
+
+                # Отправляем сообщение
+                logger.info("Отправляем сообщение в Telegram...")
+                with tracer.span("send_message", work_id=work_id):
+                    success = await self.telegram_notifier.send_message(message)
+                if not success:
+                    logger.error(
+                        f"Не удалось отправить сообщение для work_id {work_id}"
+                    )
+                    return False
+
+                self._record_delivery_latency(span, meta)
+
+                # Записываем в channel:sent_messages
+                current_time = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+                await self.redis.save_sent_message(work_id, "sent", current_time)
+                logger.info(
+                    "Записано в channel:sent_messages: %s -> %s", work_id, current_time
+                )
+                # Подтверждаем только после записи об отправке: при падении до
+                # этого момента элемент заберет другой потребитель
+                await self.redis.ack_queue_item(work_id, meta)
 
-            # Для RSS работ формируем и отправляем сообщение
-            logger.info(f"Work {work_id} из RSS - формируем сообщение")
+                logger.info("Сообщение для work_id %s успешно отправлено", work_id)
+                return True
 
-            # Форматируем сообщение
-            message = self.telegram_notifier.format_entry_for_telegram(metadata)
-            logger.info(f"Сформировано сообщение длиной {len(message)} символов")
+            except Exception as e:
+                logger.error(f"Ошибка обработки work_id {work_id}: {e}")
+                import traceback
 
-            # Отправляем сообщение
-            logger.info("Отправляем сообщение в Telegram...")
-            success = await self.telegram_notifier.send_message(message)
-            if not success:
-                logger.error(f"Не удалось отправить сообщение для work_id {work_id}")
+                logger.error(f"Traceback: {traceback.format_exc()}")
                 return False
 
-            # Записываем в channel:sent_messages
-            current_time = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-            await self.redis.save_sent_message(work_id, "sent", current_time)
-            logger.info(
-                f"Записано в channel:sent_messages: {work_id} -> {current_time}"
-            )
-
-            logger.info(f"Сообщение для work_id {work_id} успешно отправлено")
-            return True
-
-        except Exception as e:
-            logger.error(f"Ошибка обработки work_id {work_id}: {e}")
-            import traceback
+    @staticmethod
+    def _record_delivery_latency(span, meta: Dict):
+        """Записывает задержки от обновления в AO3 и от постановки в очередь до отправки"""
+        now = time.time()
 
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return False
+        enqueued_at = meta.get("enqueued_at")
+        if enqueued_at:
+            queue_seconds = now - float(enqueued_at)
+            span.set_attribute("enqueue_to_post_seconds", queue_seconds)
+            ENQUEUE_TO_POST_SECONDS.observe(queue_seconds)
 
-    async def process_queue(self) -> int:
-        """Обрабатывает очередь Redis"""
+        feed_updated = meta.get("feed_updated")
+        if feed_updated:
+            try:
+                updated = datetime.strptime(feed_updated, "%Y-%m-%dT%H:%M:%SZ").replace(
+                    tzinfo=timezone.utc
+                )
+            except ValueError:
+                return
+            feed_seconds = now - updated.timestamp()
+            span.set_attribute("feed_to_post_seconds", feed_seconds)
+            FEED_TO_POST_SECONDS.observe(feed_seconds)
+
+    async def process_queue(self, consumer: Optional[str] = None) -> int:
+        """
+        Обрабатывает очередь Redis
+
+        Args:
+            consumer: Имя потребителя в группе (только для транспорта stream)
+        """
         try:
             # Получаем длину очереди
             queue_length = await self.redis.get_queue_length()
-            logger.info(f"Длина очереди: {queue_length}")
+            logger.info("Длина очереди: %s", queue_length)
 
             if queue_length == 0:
                 logger.debug("Очередь пуста")
                 return 0
 
-            logger.info(f"В очереди {queue_length} элементов")
+            logger.info("В очереди %s элементов", queue_length)
 
             # Обрабатываем один элемент
-            work_id = await self.redis.get_from_queue(timeout=0)
-            if not work_id:
-                logger.warning("Не удалось получить элемент из очереди")
+            queue_entry = await self.redis.pop_queue_entry(timeout=0, consumer=consumer)
+            if not queue_entry:
+                # В stream все элементы могут быть выданы другим потребителям
+                logger.info("Нет доступных элементов в очереди")
                 return 0
 
-            logger.info(f"Получен work_id из очереди: {work_id}")
+            work_id, queue_meta = queue_entry
+            logger.info("Получен work_id из очереди: %s", work_id)
 
             # Обрабатываем элемент
-            success = await self.process_queue_item(work_id)
+            success = await self.process_queue_item(work_id, queue_meta)
             if success:
-                logger.info(f"Элемент {work_id} успешно обработан")
+                logger.info("Элемент %s успешно обработан", work_id)
             else:
                 logger.error(f"Не удалось обработать элемент {work_id}")
             return 1 if success else 0
@@ -114,28 +233,35 @@ class RSSBot:
 
     async def run_periodic_processing(self):
         """Запускает периодическую обработку очереди"""
+        if self.redis.queue_transport == "stream":
+            await self.run_consumers()
+            return
+
         logger.info(
-            f"Запуск периодической обработки каждые {Config.SEND_INTERVAL_SECONDS} секунд"
+            "Запуск периодической обработки каждые %s секунд",
+            Config.SEND_INTERVAL_SECONDS,
         )
 
         while self.running:
             try:
                 logger.info("Проверяем очередь...")
                 # Обрабатываем очередь
-                processed = await self.process_queue()
+                async with cycle_profiler.profile("bot"):
+                    processed = await self.process_queue()
 
                 if processed > 0:
-                    logger.info(f"Обработано {processed} элементов из очереди")
+                    logger.info("Обработано %s элементов из очереди", processed)
                 else:
                     logger.info("Очередь пуста, ожидание...")
 
                 # Ждем до следующей обработки
                 wait_seconds = Config.SEND_INTERVAL_SECONDS
                 logger.info(
-                    f"Ожидание {Config.SEND_INTERVAL_SECONDS} секунд до следующей обработки..."
+                    "Ожидание %s секунд до следующей обработки...",
+                    Config.SEND_INTERVAL_SECONDS,
                 )
 
-                await asyncio.sleep(wait_seconds)
+                await self._sleep(wait_seconds)
 
             except asyncio.CancelledError:
                 logger.info("Периодическая обработка отменена")
@@ -143,7 +269,102 @@ class RSSBot:
             except Exception as e:
                 logger.error(f"Ошибка в периодической обработке: {e}")
                 # При ошибке ждем 5 минут перед следующей попыткой
-                await asyncio.sleep(300)
+                await self._sleep(300)
+
+    async def run_consumers(self):
+        """
+        Запускает несколько потребителей потока с общим бюджетом отправки
+
+        Бюджет (не чаще одного сообщения в SEND_INTERVAL_SECONDS) хранится в Redis,
+        поэтому соблюдается и между процессами бота.
+        """
+        logger.info(
+            "Запуск %s потребителей очереди, одно сообщение в %s секунд",
+            self.consumers,
+            Config.SEND_INTERVAL_SECONDS,
+        )
+        await asyncio.gather(
+            *(
+                self._consume(f"{self.redis.consumer_name}-{index}")
+                for index in range(self.consumers)
+            )
+        )
+
+    async def _consume(self, consumer: str):
+        """Цикл одного потребителя очереди"""
+        while self.running:
+            try:
+                wait_seconds = await self.redis.acquire_send_slot(
+                    Config.SEND_INTERVAL_SECONDS
+                )
+                if wait_seconds > 0:
+                    await self._sleep(wait_seconds)
+                    continue
+
+                async with cycle_profiler.profile("bot"):
+                    processed = await self.process_queue(consumer)
+
+                if not processed:
+                    await self._sleep(Config.SEND_INTERVAL_SECONDS)
+
+            except asyncio.CancelledError:
+                logger.info("Потребитель %s остановлен", consumer)
+                break
+            except Exception as e:
+                logger.error(f"Ошибка потребителя {consumer}: {e}")
+                # При ошибке ждем 5 минут перед следующей попыткой
+                await self._sleep(300)
+
+    async def deliver_subscriptions(self, limit: int = 100) -> int:
+        """
+        Отправляет подписчикам по одной работе из их личных очередей
+
+        Returns:
+            Количество отправленных сообщений
+        """
+        sent = 0
+        for user_id in await self.subscriptions.pending_users(limit):
+            if not self.running:
+                break
+            work_id = await self.subscriptions.peek_user_item(user_id)
+            if not work_id:
+                continue
+            metadata = await self.redis.get_fanfic_metadata(work_id)
+            if not metadata:
+                # Повторная доставка не поможет - убираем работу
+                await self.subscriptions.ack_user_item(user_id, work_id)
+                continue
+            message = self.telegram_notifier.format_entry_for_telegram(metadata)
+            try:
+                if await self.telegram_notifier.send_message(message, chat_id=user_id):
+                    DIRECT_MESSAGES.inc(result="sent")
+                    await self.subscriptions.ack_user_item(user_id, work_id)
+                    sent += 1
+                else:
+                    # Работа остается в очереди до следующего прохода
+                    DIRECT_MESSAGES.inc(result="failed")
+            except ChatUnavailable as e:
+                # Пользователь заблокировал бота - подписки больше не нужны
+                DIRECT_MESSAGES.inc(result="unavailable")
+                removed = await self.subscriptions.unsubscribe_all(user_id)
+                logger.info(
+                    "Чат %s недоступен (%s), удалено подписок: %s", user_id, e, removed
+                )
+            await self._sleep(Config.SUBSCRIPTIONS_SEND_INTERVAL_SECONDS)
+        return sent
+
+    async def run_subscription_delivery(self):
+        """Цикл отправки личных сообщений подписчикам"""
+        logger.info("Запуск отправки личных сообщений подписчикам")
+        while self.running:
+            try:
+                if not await self.deliver_subscriptions():
+                    await self._sleep(Config.SEND_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Ошибка отправки личных сообщений: {e}")
+                await self._sleep(60)
 
     async def start(self):
         """Запускает бота"""
@@ -175,9 +396,14 @@ class RSSBot:
         self.running = True
         logger.info("RSS бот запущен")
 
-        # Запускаем периодическую обработку
+        # Запускаем периодическую обработку (и личные сообщения с командами)
         logger.info("Запускаем периодическую обработку...")
-        self.task = asyncio.create_task(self.run_periodic_processing())
+        loops = [self.run_periodic_processing()]
+        if self.subscriptions:
+            loops.append(self.run_subscription_delivery())
+        if self.commands:
+            loops.append(self.commands.run())
+        self.task = asyncio.create_task(self._run_loops(loops))
         try:
             await self.task
         except asyncio.CancelledError:
@@ -187,20 +413,45 @@ class RSSBot:
 
         return True
 
+    @staticmethod
+    async def _run_loops(loops):
+        await asyncio.gather(*loops)
+
     async def stop(self):
         """Останавливает бота"""
         logger.info("Остановка RSS бота...")
         self.running = False
+        if self.commands:
+            self.commands.stop()
         logger.info("RSS бот остановлен")
 
 
+def create_bot() -> RSSBot:
+    """Создает бота с подписками, поиском и командами по настройкам Config"""
+    notifier = TelegramNotifier(Config.TELEGRAM_BOT_TOKEN, Config.TELEGRAM_CHANNEL_ID)
+    subscriptions = create_subscriptions(redis_connector)
+    commands = None
+    if Config.BOT_COMMANDS_ENABLED:
+        commands = CommandPoller(notifier, redis_connector)
+        if subscriptions:
+            register_subscription_commands(commands, subscriptions)
+        search = create_search(redis_connector)
+        if search:
+            register_search_commands(
+                commands, search, limit=Config.SEARCH_RESULTS_LIMIT
+            )
+    return RSSBot(
+        telegram_notifier=notifier, subscriptions=subscriptions, commands=commands
+    )
+
+
 async def main():
     """Главная функция"""
     logger.info("Запуск RSS бота")
     logger.info(f"Интервал отправки: {Config.SEND_INTERVAL_SECONDS} секунд")
 
     # Создаем бота
-    bot = RSSBot()
+    bot = create_bot()
 
     try:
         await bot.start()
@@ -0,0 +1,270 @@
+"""
+Команды бота в личных сообщениях
+
+Обновления читаются long polling'ом (getUpdates); номер последнего
+обработанного обновления хранится в Redis, поэтому после перезапуска команды
+не выполняются повторно. Читать обновления может только один клиент бота,
+поэтому команды включаются (BOT_COMMANDS_ENABLED) в одном процессе отправки.
+"""
+
+import asyncio
+import html
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram.error import TelegramError
+
+from telegram_bot.telegram_bot import ChatUnavailable, TelegramNotifier
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+from utils.search import SearchIndex, parse_query
+from utils.subscriptions import KINDS, SubscriptionIndex
+
+logger = logging.getLogger(__name__)
+
+UPDATES_OFFSET_KEY = "bot:updates_offset"
+
+COMMANDS_TOTAL = metrics.counter(
+    "bot_commands_total", "Команды пользователей боту", ["command"]
+)
+
+# Обработчик команды: (id пользователя, аргументы) -> ответ в HTML
+CommandHandler = Callable[[str, str], Awaitable[str]]
+
+# Русские названия видов подписки
+KIND_ALIASES = {
+    "фандом": "fandom",
+    "пейринг": "relationship",
+    "персонаж": "character",
+    "ship": "relationship",
+}
+KIND_NAMES = {"fandom": "фандом", "relationship": "пейринг", "character": "персонаж"}
+
+
+class CommandPoller:
+    """Читает обновления бота и отвечает на команды из личных чатов"""
+
+    def __init__(
+        self,
+        notifier: TelegramNotifier,
+        redis: RedisConnector,
+        poll_timeout: int = 30,
+    ):
+        self.notifier = notifier
+        self.redis = redis
+        self.poll_timeout = poll_timeout
+        self.handlers: Dict[str, CommandHandler] = {}
+        self.help_lines: Dict[str, str] = {}
+        # Остановка прерывает и ожидание getUpdates
+        self._stop_event = asyncio.Event()
+        self.register("help", self._help, "/help - список команд")
+
+    def register(self, command: str, handler: CommandHandler, help_line: str = ""):
+        """Добавляет команду; help_line попадает в ответ на /help и /start"""
+        self.handlers[command] = handler
+        if help_line:
+            self.help_lines[command] = help_line
+
+    async def _help(self, user_id: str, args: str) -> str:
+        return "\n".join(self.help_lines.values())
+
+    async def handle_text(self, user_id: str, text: str) -> Optional[str]:
+        """Выполняет команду из текста сообщения и возвращает ответ"""
+        if not text.startswith("/"):
+            return None
+        command, _, args = text[1:].partition(" ")
+        # /command@bot_name в группах и при выборе из меню
+        command = command.split("@", 1)[0].lower()
+        if command == "start":
+            command = "help"
+        handler = self.handlers.get(command)
+        if handler is None:
+            return "Неизвестная команда. /help - список команд"
+        COMMANDS_TOTAL.inc(command=command)
+        try:
+            return await handler(user_id, args.strip())
+        except Exception as e:
+            logger.error(f"Ошибка команды /{command} от {user_id}: {e}")
+            return "Не удалось выполнить команду, попробуйте позже"
+
+    async def poll_once(self) -> int:
+        """Читает порцию обновлений и отвечает на команды; возвращает их число"""
+        await self.redis._ensure_connected()
+        raw_offset = await self.redis.redis.get(UPDATES_OFFSET_KEY)
+        offset = int(raw_offset) if raw_offset else None
+        fetch = asyncio.ensure_future(
+            self.notifier.bot.get_updates(
+                offset=offset, timeout=self.poll_timeout, allowed_updates=["message"]
+            )
+        )
+        stop = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            await asyncio.wait({fetch, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+            if not fetch.done():
+                # Отметка не сдвинута - прочитанное Telegram отдаст снова
+                fetch.cancel()
+        if fetch.cancelled():
+            return 0
+        updates = fetch.result()
+        for update in updates:
+            message = update.message
+            # Сдвигаем отметку до ответа: упавшая команда не повторяется по кругу
+            await self.redis.redis.set(UPDATES_OFFSET_KEY, update.update_id + 1)
+            if not message or not message.text or message.chat.type != "private":
+                continue
+            user_id = str(message.chat.id)
+            reply = await self.handle_text(user_id, message.text)
+            if not reply:
+                continue
+            try:
+                await self.notifier.send_message(reply, chat_id=user_id)
+            except ChatUnavailable:
+                logger.info("Чат %s недоступен, ответ не отправлен", user_id)
+        return len(updates)
+
+    async def run(self):
+        """Цикл чтения обновлений"""
+        logger.info("Запуск обработки команд бота: %s", ", ".join(self.handlers))
+        while not self._stop_event.is_set():
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                break
+            except TelegramError as e:
+                logger.error(f"Ошибка чтения обновлений бота: {e}")
+                await self._pause(5)
+            except Exception as e:
+                logger.error(f"Ошибка обработки команд: {e}")
+                await self._pause(5)
+
+    async def _pause(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self):
+        """Завершает цикл, не дожидаясь ответа getUpdates"""
+        self._stop_event.set()
+
+
+def _parse_subscription(args: str):
+    """'<вид> <тег>' -> (вид, тег) или None"""
+    kind, _, tag = args.partition(" ")
+    kind = KIND_ALIASES.get(kind.lower(), kind.lower())
+    tag = tag.strip()
+    if kind not in KINDS or not tag:
+        return None
+    return kind, tag
+
+
+SUBSCRIBE_USAGE = (
+    "Формат: /subscribe &lt;вид&gt; &lt;тег&gt;\n"
+    "Вид: фандом (fandom), пейринг (relationship), персонаж (character)\n"
+    "Пример: /subscribe фандом Russian Actor RPF"
+)
+
+
+def register_subscription_commands(poller: CommandPoller, index: SubscriptionIndex):
+    """Команды подписок: /subscribe, /unsubscribe, /subscriptions"""
+
+    async def subscribe(user_id: str, args: str) -> str:
+        parsed = _parse_subscription(args)
+        if parsed is None:
+            return SUBSCRIBE_USAGE
+        kind, tag = parsed
+        if not await index.subscribe(user_id, kind, tag):
+            return (
+                f"Достигнут предел подписок ({index.max_per_user}) - "
+                "отпишитесь от лишних: /subscriptions"
+            )
+        return (
+            f"Подписка оформлена: {KIND_NAMES[kind]} <b>{html.escape(tag)}</b>\n"
+            "Новые работы и главы будут приходить сюда"
+        )
+
+    async def unsubscribe(user_id: str, args: str) -> str:
+        if args.lower() in ("all", "все"):
+            count = await index.unsubscribe_all(user_id)
+            return f"Удалено подписок: {count}"
+        parsed = _parse_subscription(args)
+        if parsed is None:
+            return "Формат: /unsubscribe &lt;вид&gt; &lt;тег&gt; или /unsubscribe all"
+        kind, tag = parsed
+        if not await index.unsubscribe(user_id, kind, tag):
+            return "Такой подписки нет. Список: /subscriptions"
+        return f"Подписка удалена: {KIND_NAMES[kind]} <b>{html.escape(tag)}</b>"
+
+    async def subscriptions(user_id: str, args: str) -> str:
+        items = await index.list_subscriptions(user_id)
+        if not items:
+            return "Подписок нет.\n" + SUBSCRIBE_USAGE
+        lines = [f"Подписки ({len(items)}):"]
+        lines += [f"• {KIND_NAMES[kind]}: {html.escape(tag)}" for kind, tag in items]
+        return "\n".join(lines)
+
+    poller.register(
+        "subscribe", subscribe, "/subscribe &lt;вид&gt; &lt;тег&gt; - подписаться"
+    )
+    poller.register(
+        "unsubscribe",
+        unsubscribe,
+        "/unsubscribe &lt;вид&gt; &lt;тег&gt; | all - отписаться",
+    )
+    poller.register("subscriptions", subscriptions, "/subscriptions - мои подписки")
+
+
+SEARCH_USAGE = (
+    "Формат: /search &lt;слова&gt; [фильтры]\n"
+    "Фильтры: rating:&lt;рейтинг&gt;, lang:&lt;язык&gt;, words:&lt;от&gt;-&lt;до&gt;\n"
+    "Пример: /search кофейня флафф rating:teen words:1000-10000"
+)
+
+
+def format_search_results(found: dict) -> str:
+    """Ответ на /search: список найденных работ со ссылками"""
+    if not found["results"]:
+        return "Ничего не найдено"
+    # Запрос из одних частых слов проверяется не по всем работам
+    more = "" if found["complete"] else "+ - уточните запрос"
+    lines = [f"Найдено работ: {found['total']}{more}"]
+    for number, item in enumerate(found["results"], 1):
+        # Поля сохранены как в ленте - могут содержать HTML-сущности
+        title = html.escape(html.unescape(item.get("title") or item["work_id"]))
+        link = item.get("link") or (
+            f"https://archiveofourown.org/works/{item['work_id']}"
+        )
+        # Ссылки как в канале
+        link = link.replace("archiveofourown.org", "archiveofourown.gay")
+        details = [
+            html.escape(html.unescape(item[field]))
+            for field in ("author", "fandom")
+            if item.get(field)
+        ]
+        if item.get("words"):
+            details.append(f"{item['words']} слов")
+        lines.append(f"{number}. <a href='{html.escape(link)}'>{title}</a>")
+        if details:
+            lines.append("    " + " · ".join(details))
+    return "\n".join(lines)
+
+
+def register_search_commands(
+    poller: CommandPoller, search: SearchIndex, limit: int = 10
+):
+    """Команда /search по сохраненным работам"""
+
+    async def search_command(user_id: str, args: str) -> str:
+        try:
+            query = parse_query(args)
+        except ValueError as e:
+            return f"{html.escape(str(e))}\n{SEARCH_USAGE}"
+        if query.empty:
+            return SEARCH_USAGE
+        return format_search_results(await search.search(query, limit=limit))
+
+    poller.register(
+        "search", search_command, "/search &lt;слова&gt; [фильтры] - поиск работ"
+    )
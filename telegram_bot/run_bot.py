@@ -8,17 +8,11 @@ import logging
 import signal
 import sys
 
-from telegram_bot.bot import RSSBot
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bot.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
-)
+from telegram_bot.bot import create_bot
+from utils.logging_config import setup_logging
+
+# Настройка логирования (запись в stdout и bot.log выполняет фоновый поток)
+setup_logging("INFO", log_file="bot.log")
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +36,7 @@ class BotRunner:
             logger.info("=== ЗАПУСК RSS BOT ===")
 
             # Создаем экземпляр бота
-            self.bot = RSSBot()
+            self.bot = create_bot()
             self.running = True
 
             # Настраиваем обработчики сигналов
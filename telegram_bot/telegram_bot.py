@@ -1,14 +1,33 @@
 import asyncio
 import logging
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional
 
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 
+from utils.metrics import metrics
 from utils.schemas import UpdateReason
 
 logger = logging.getLogger(__name__)
 
+SEND_SECONDS = metrics.histogram(
+    "telegram_send_duration_seconds", "Длительность отправки сообщения в Telegram"
+)
+SEND_ERRORS = metrics.counter(
+    "telegram_send_errors_total", "Ошибки отправки сообщений в Telegram", ["error"]
+)
+SEND_THROTTLES = metrics.counter(
+    "telegram_send_throttled_total", "Отказы Telegram из-за ограничения частоты"
+)
+SENT_MESSAGES = metrics.counter(
+    "telegram_messages_sent_total", "Успешно отправленные сообщения"
+)
+
+
+class ChatUnavailable(Exception):
+    """Личный чат недоступен: пользователь заблокировал бота или удален"""
+
 
 class TelegramNotifier:
     """Класс для отправки уведомлений в Telegram"""
@@ -17,26 +36,51 @@ class TelegramNotifier:
         self.bot = Bot(token=bot_token)
         self.channel_id = channel_id
 
-    async def send_message(self, message: str, parse_mode: str = "HTML") -> bool:
-        """Отправляет сообщение в канал"""
+    async def send_message(
+        self, message: str, parse_mode: str = "HTML", chat_id: Optional[str] = None
+    ) -> bool:
+        """
+        Отправляет сообщение в канал или в личный чат
+
+        Args:
+            chat_id: Личный чат пользователя (None - канал). Если чат
+                недоступен, выбрасывается ChatUnavailable
+        """
+        start = time.perf_counter()
+        target = chat_id or self.channel_id
         try:
-            logger.info(f"Отправляем сообщение в канал {self.channel_id}")
-            logger.debug(f"Содержимое сообщения: {message[:200]}...")
+            logger.info("Отправляем сообщение в чат %s", target)
+            logger.debug("Содержимое сообщения: %s...", message[:200])
 
             await self.bot.send_message(
-                chat_id=self.channel_id,
+                chat_id=target,
                 text=message,
                 parse_mode=parse_mode,
                 disable_web_page_preview=False,
             )
-            logger.info("Сообщение успешно отправлено в канал")
+            SEND_SECONDS.observe(time.perf_counter() - start)
+            SENT_MESSAGES.inc()
+            logger.info("Сообщение успешно отправлено")
             return True
 
+        except RetryAfter as e:
+            SEND_THROTTLES.inc()
+            logger.error(
+                f"Telegram ограничил частоту отправки, повтор через {e.retry_after}"
+            )
+            return False
         except TelegramError as e:
+            SEND_ERRORS.inc(error=type(e).__name__)
+            if chat_id and (
+                isinstance(e, Forbidden)
+                or (isinstance(e, BadRequest) and "chat not found" in str(e).lower())
+            ):
+                raise ChatUnavailable(str(e)) from e
             logger.error(f"Ошибка при отправке сообщения в Telegram: {e}")
             logger.error(f"Тип ошибки: {type(e).__name__}")
             return False
         except Exception as e:
+            SEND_ERRORS.inc(error=type(e).__name__)
             logger.error(f"Неожиданная ошибка при отправке сообщения: {e}")
             import traceback
 
@@ -53,7 +97,7 @@ class TelegramNotifier:
                 # Небольшая задержка между сообщениями, чтобы не спамить
                 await asyncio.sleep(1)
 
-        logger.info(f"Отправлено {success_count} из {len(messages)} сообщений")
+        logger.info("Отправлено %s из %s сообщений", success_count, len(messages))
         return success_count
 
     async def test_connection(self) -> bool:
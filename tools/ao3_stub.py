@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка AO3: отдает синтетические ленты /tags/{id}/feed.atom
+
+Используется для нагрузочного тестирования парсера без обращения к AO3.
+Пример:
+    uv run python -m tools.ao3_stub --port 8089 --entries 20 --churn 0.1 --latency 0.05
+"""
+
+import argparse
+import gzip
+import html
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+FEED_PATH_RE = re.compile(r"^/tags/(\d+)/feed\.atom$")
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def format_time(moment: datetime) -> str:
+    """Форматирует время в формате AO3: YYYY-MM-DDTHH:MM:SSZ"""
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_entry(work: Dict, summary_size: int) -> str:
+    """Собирает одну запись Atom в формате AO3"""
+    work_id = work["work_id"]
+    filler = ("Текст описания работы. " * (summary_size // 24 + 1))[:summary_size]
+    summary = (
+        f'<p>by <a rel="author" href="https://archiveofourown.org/users/author{work_id}">'
+        f"author{work_id}</a></p>"
+        f"<p>{filler}</p>"
+        f"<p>Words: {work['words']}, Chapters: {work['chapters']}/?, "
+        f"Language: {work['language']}</p>"
+        "<ul>"
+        '<li>Fandoms: <a href="https://archiveofourown.org/tags/x">Russian Actor RPF</a></li>'
+        '<li>Rating: <a href="https://archiveofourown.org/tags/x">General Audiences</a></li>'
+        '<li>Warnings: <a href="https://archiveofourown.org/tags/x">'
+        "No Archive Warnings Apply</a></li>"
+        '<li>Categories: <a href="https://archiveofourown.org/tags/x">Gen</a></li>'
+        '<li>Characters: <a href="https://archiveofourown.org/tags/x">Персонаж А</a>, '
+        '<a href="https://archiveofourown.org/tags/x">Персонаж Б</a></li>'
+        '<li>Relationships: <a href="https://archiveofourown.org/tags/x">А/Б</a></li>'
+        '<li>Additional Tags: <a href="https://archiveofourown.org/tags/x">Fluff</a></li>'
+        "</ul>"
+    )
+    return (
+        "<entry>"
+        f"<id>tag:archiveofourown.org,2005:Work/{work_id}</id>"
+        f"<published>{work['published']}</published>"
+        f"<updated>{work['updated']}</updated>"
+        f"<title>Работа {work_id}</title>"
+        f'<summary type="html">{html.escape(summary)}</summary>'
+        f"<author><name>author{work_id}</name></author>"
+        f'<link rel="alternate" type="text/html" '
+        f'href="https://archiveofourown.org/works/{work_id}"/>'
+        "</entry>"
+    )
+
+
+def build_feed(tag_id: str, works: List[Dict], summary_size: int) -> bytes:
+    """Собирает документ Atom ленты тега"""
+    updated = works[0]["updated"] if works else format_time(BASE_TIME)
+    body = "".join(build_entry(work, summary_size) for work in works)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="en-US">'
+        f"<id>tag:archiveofourown.org,2005:/tags/{tag_id}/feed</id>"
+        f"<title>AO3 works tagged {tag_id}</title>"
+        f"<updated>{updated}</updated>"
+        f"{body}"
+        "</feed>"
+    ).encode("utf-8")
+
+
+class SyntheticTag:
+    """Состояние одной синтетической ленты: работы от новых к старым"""
+
+    def __init__(self, tag_id: str, entries: int, non_russian_share: float, rng):
+        self.tag_id = tag_id
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.next_work_id = int(tag_id) * 1000
+        self.non_russian_share = non_russian_share
+        self.clock = BASE_TIME
+        self.works = [self._new_work() for _ in range(entries)]
+        self.works.reverse()
+
+    def _new_work(self) -> Dict:
+        self.next_work_id += 1
+        self.clock += timedelta(minutes=1)
+        stamp = format_time(self.clock)
+        language = (
+            "English" if self.rng.random() < self.non_russian_share else "Русский"
+        )
+        return {
+            "work_id": str(self.next_work_id),
+            "published": stamp,
+            "updated": stamp,
+            "chapters": 1,
+            "words": self.rng.randint(500, 50000),
+            "language": language,
+        }
+
+    def churn(self):
+        """Добавляет новую работу или новую главу в начало ленты"""
+        with self.lock:
+            if self.rng.random() < 0.5 or len(self.works) < 2:
+                self.works.insert(0, self._new_work())
+                self.works.pop()
+            else:
+                # Новая глава существующей работы поднимает ее в начало ленты
+                index = self.rng.randrange(1, len(self.works))
+                work = self.works.pop(index)
+                self.clock += timedelta(minutes=1)
+                work["updated"] = format_time(self.clock)
+                work["chapters"] += 1
+                work["words"] += self.rng.randint(500, 5000)
+                self.works.insert(0, work)
+
+
+class StubState:
+    """Общее состояние заглушки и ее параметры"""
+
+    def __init__(
+        self,
+        entries: int = 20,
+        summary_size: int = 600,
+        churn: float = 0.1,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        non_russian_share: float = 0.2,
+        seed: int = 42,
+    ):
+        self.entries = entries
+        self.summary_size = summary_size
+        self.churn = churn
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.non_russian_share = non_russian_share
+        self.rng = random.Random(seed)
+        self.tags: Dict[str, SyntheticTag] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def get_tag(self, tag_id: str) -> SyntheticTag:
+        with self.lock:
+            tag = self.tags.get(tag_id)
+            if tag is None:
+                tag = SyntheticTag(
+                    tag_id,
+                    self.entries,
+                    self.non_russian_share,
+                    random.Random(f"{tag_id}:{self.rng.random()}"),
+                )
+                self.tags[tag_id] = tag
+            return tag
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """HTTP обработчик заглушки"""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными write: без TCP_NODELAY keep-alive клиенты
+    # ждут delayed ACK (~40 мс) на каждом запросе
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        # Не засоряем вывод логом каждого запроса
+        pass
+
+    def do_GET(self):
+        state = self.state
+        with state.lock:
+            state.requests += 1
+
+        delay = state.latency + state.rng.uniform(0, state.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        match = FEED_PATH_RE.match(self.path.split("?", 1)[0])
+        if not match:
+            self._send(404, b"not found", "text/plain")
+            return
+
+        if state.rng.random() < state.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send(503, b"temporarily unavailable", "text/plain")
+            return
+
+        tag = state.get_tag(match.group(1))
+        if state.rng.random() < state.churn:
+            tag.churn()
+
+        with tag.lock:
+            body = build_feed(tag.tag_id, tag.works, state.summary_size)
+        self._send(200, body, "application/atom+xml; charset=utf-8")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        # Как и AO3, сжимаем ответ, если клиент это умеет
+        if status == 200 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host: str, port: int, state: StubState) -> ThreadingHTTPServer:
+    """Создает HTTP сервер заглушки (port=0 - выбрать свободный порт)"""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Локальная заглушка лент AO3")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--entries", type=int, default=20, help="Записей в ленте")
+    parser.add_argument(
+        "--summary-size", type=int, default=600, help="Размер описания работы (символы)"
+    )
+    parser.add_argument(
+        "--churn", type=float, default=0.1, help="Вероятность изменения ленты на запрос"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка (с)")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Разброс задержки (с)"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Доля ответов 503"
+    )
+    parser.add_argument(
+        "--non-russian", type=float, default=0.2, help="Доля работ не на русском"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    state = StubState(
+        entries=args.entries,
+        summary_size=args.summary_size,
+        churn=args.churn,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        non_russian_share=args.non_russian,
+        seed=args.seed,
+    )
+    server = create_server(args.host, args.port, state)
+    host, port = server.server_address[:2]
+    print(
+        f"Заглушка AO3 слушает http://{host}:{port}/tags/{{id}}/feed.atom", flush=True
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Запросов: {state.requests}, ошибок: {state.errors}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Перестроение фильтра Блума известных работ
+
+Строит фильтр по индексу fanfic:ids (после удаления работ или смены
+BLOOM_CAPACITY / BLOOM_ERROR_RATE) и сохраняет его в Redis и в BLOOM_FILE.
+Пример:
+    uv run python -m tools.bloom_rebuild
+    uv run python -m tools.bloom_rebuild --reindex   # сначала заполнить индекс по ключам метаданных
+"""
+
+import argparse
+import asyncio
+import sys
+
+from config import Config
+from rss_parser.known_works import KnownWorks
+from utils.logging_config import setup_logging
+from utils.redis_connector import RedisConnector
+
+
+async def rebuild(
+    redis_url: str, capacity: int, error_rate: float, path: str, reindex: bool
+) -> int:
+    """Перестраивает фильтр и возвращает количество работ в нем"""
+    connector = RedisConnector(redis_url)
+    try:
+        await connector.connect()
+        work_ids = None
+        if reindex:
+            work_ids = await connector.rebuild_fanfic_index()
+        known_works = KnownWorks(connector, capacity, error_rate, path)
+        count = await known_works.rebuild(replace=True, work_ids=work_ids)
+        await known_works.snapshot()
+        print(
+            f"Работ в фильтре: {count}, бит: {known_works.bits}, "
+            f"хешей: {known_works.hashes}, "
+            f"заполнение: {known_works.filter.fill_ratio():.1%}"
+        )
+        if count > capacity:
+            print(
+                f"Работ больше BLOOM_CAPACITY ({capacity}) - доля ложных "
+                "срабатываний выше расчетной, увеличьте емкость"
+            )
+        return count
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(
+        description="Перестроение фильтра Блума известных работ по индексу fanfic:ids"
+    )
+    parser.add_argument("--redis-url", default=Config.REDIS_URL, help="URL Redis")
+    parser.add_argument(
+        "--capacity", type=int, default=Config.BLOOM_CAPACITY, help="Емкость фильтра"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=Config.BLOOM_ERROR_RATE,
+        help="Доля ложноположительных ответов",
+    )
+    parser.add_argument(
+        "--file", default=Config.BLOOM_FILE, help="Файл снимка (пусто - не сохранять)"
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Сначала заполнить fanfic:ids по ключам fanfic:metadata:*",
+    )
+    args = parser.parse_args()
+
+    setup_logging("INFO")
+    asyncio.run(
+        rebuild(args.redis_url, args.capacity, args.error_rate, args.file, args.reindex)
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
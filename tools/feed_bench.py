@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Сравнение разбора лент: feedparser против потокового парсера AO3
+
+По умолчанию ленты генерируются так же, как в заглушке AO3; можно передать
+каталог записи (FEED_RECORD_DIR), тогда берутся записанные ответы.
+Пример:
+    uv run python -m tools.feed_bench --entries 20,100,500 --new 3
+    uv run python -m tools.feed_bench --record-dir recordings
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+from rss_parser.ao3_atom import parse_feed_stream, parse_with_feedparser
+from tools.ao3_stub import SyntheticTag, build_feed
+
+FIELDS = ("id", "title", "link", "author", "updated", "published")
+
+
+def _chunks(body: bytes, size: int = 16384):
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+# Записи, на которых парсеры расходились: соавторы, автор с email
+EDGE_CASES_FEED = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="en-US">'
+    "<id>tag:archiveofourown.org,2005:/tags/1/feed</id><title>AO3</title>"
+    "<entry><id>tag:archiveofourown.org,2005:Work/1</id>"
+    '<link rel="alternate" href="https://archiveofourown.org/works/1"/>'
+    "<title>Соавторы</title><updated>2024-01-02T00:00:00Z</updated>"
+    "<author><name>A</name></author><author><name>B</name></author></entry>"
+    "<entry><id>tag:archiveofourown.org,2005:Work/2</id>"
+    '<link rel="alternate" href="https://archiveofourown.org/works/2"/>'
+    "<title>Email</title><updated>2024-01-01T00:00:00Z</updated>"
+    "<author><name>A</name><email>a@example.org</email></author>"
+    "<author><email>b@example.org</email></author></entry>"
+    "<entry><id>tag:archiveofourown.org,2005:Work/3</id>"
+    '<link rel="alternate" href="https://archiveofourown.org/works/3"/>'
+    "<title>Без имени</title><updated>2024-01-01T00:00:00Z</updated>"
+    "<author><email>c@example.org</email></author></entry>"
+    "</feed>"
+).encode("utf-8")
+
+
+def time_parser(func: Callable, rounds: int) -> float:
+    """Возвращает среднее время одного вызова в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def check_parity(body: bytes) -> List[str]:
+    """Сравнивает поля записей двух парсеров, возвращает список расхождений"""
+    reference = parse_with_feedparser(body).entries
+    streamed = parse_feed_stream(_chunks(body)).entries
+    problems = []
+    if len(reference) != len(streamed):
+        problems.append(f"записей: feedparser {len(reference)}, ao3 {len(streamed)}")
+    for ref, own in zip(reference, streamed):
+        for field in FIELDS:
+            if ref.get(field, "") != own.get(field, ""):
+                problems.append(
+                    f"{ref.get('id')}: {field} {ref.get(field)!r} != {own.get(field)!r}"
+                )
+    return problems
+
+
+def bench_document(body: bytes, new_entries: int, rounds: int) -> Dict:
+    """Замеряет полный разбор обоими парсерами и разбор с остановкой на отметке"""
+    entries = parse_feed_stream(_chunks(body)).entries
+    # Отметка прошлой проверки: новыми считаются первые new_entries записей
+    stop_before = None
+    if 0 < new_entries < len(entries):
+        stop_before = entries[new_entries].get("updated")
+
+    return {
+        "entries": len(entries),
+        "bytes": len(body),
+        "feedparser_ms": time_parser(lambda: parse_with_feedparser(body), rounds),
+        "ao3_full_ms": time_parser(lambda: parse_feed_stream(_chunks(body)), rounds),
+        "ao3_watermark_ms": time_parser(
+            lambda: parse_feed_stream(_chunks(body), stop_before), rounds
+        ),
+    }
+
+
+def synthetic_documents(sizes: List[int]) -> List[bytes]:
+    """Генерирует по одной ленте каждого размера"""
+    documents = []
+    for size in sizes:
+        tag = SyntheticTag("31415212", size, 0.2, random.Random(size))
+        documents.append(build_feed(tag.tag_id, tag.works, 600))
+    return documents
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(
+        description="Сравнение feedparser и потокового парсера лент AO3"
+    )
+    parser.add_argument(
+        "--entries",
+        default="20,100,500",
+        help="Размеры синтетических лент через запятую",
+    )
+    parser.add_argument(
+        "--record-dir", default=None, help="Каталог записи вместо синтетики"
+    )
+    parser.add_argument(
+        "--new", type=int, default=3, help="Сколько записей новее отметки"
+    )
+    parser.add_argument("--rounds", type=int, default=20, help="Повторов на документ")
+    args = parser.parse_args()
+
+    if args.record_dir:
+        documents = []
+        for path in sorted(glob.glob(os.path.join(args.record_dir, "*.atom"))):
+            with open(path, "rb") as f:
+                documents.append(f.read())
+    else:
+        documents = synthetic_documents([int(n) for n in args.entries.split(",")])
+
+    problems = check_parity(EDGE_CASES_FEED)
+    for body in documents:
+        problems.extend(check_parity(body))
+    if problems:
+        print("Расхождения между парсерами:")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        print()
+
+    print(
+        f"{'записей':>8} {'КБ':>8} {'feedparser мс':>14} {'ao3 мс':>10} "
+        f"{'ao3+отметка мс':>15} {'ускорение':>10}"
+    )
+    for body in documents:
+        result = bench_document(body, args.new, args.rounds)
+        speedup = result["feedparser_ms"] / max(result["ao3_watermark_ms"], 1e-9)
+        print(
+            f"{result['entries']:>8} {result['bytes'] / 1024:>8.1f} "
+            f"{result['feedparser_ms']:>14.2f} {result['ao3_full_ms']:>10.2f} "
+            f"{result['ao3_watermark_ms']:>15.2f} {speedup:>9.1f}x"
+        )
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
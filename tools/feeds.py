@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Управление реестром RSS лент в Redis
+
+Изменения подхватываются работающим парсером в начале следующего цикла.
+Пример:
+    uv run python -m tools.feeds import                  # перенести Config.RSS_FEEDS
+    uv run python -m tools.feeds import --file feeds.json  # {"tag_id": "описание", ...}
+    uv run python -m tools.feeds add 31415212 "Russian Actor RPF" --priority 10
+    uv run python -m tools.feeds set 94785088 --interval 360
+    uv run python -m tools.feeds disable 94785088
+    uv run python -m tools.feeds list
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from config import Config
+from rss_parser.feed_registry import FeedInfo, FeedRegistry
+from utils.redis_connector import RedisConnector
+
+
+async def run_command(args) -> int:
+    """Выполняет команду CLI, возвращает код выхода"""
+    connector = RedisConnector(args.redis_url)
+    registry = FeedRegistry(connector)
+    try:
+        await connector.connect()
+
+        if args.command == "import":
+            feeds = Config.RSS_FEEDS
+            if args.file:
+                with open(args.file, encoding="utf-8") as f:
+                    feeds = json.load(f)
+            count = await registry.import_feeds(feeds, overwrite=args.overwrite)
+            print(f"Импортировано лент: {count} из {len(feeds)}")
+            return 0
+
+        await registry.refresh()
+
+        if args.command == "list":
+            print(f"Источник: {registry.source}, версия {registry.version}")
+            feeds = sorted(
+                registry.feeds.values(), key=lambda f: (-f.priority, f.tag_id)
+            )
+            for feed in feeds:
+                interval = feed.interval_minutes or "-"
+                state = "вкл" if feed.enabled else "выкл"
+                print(
+                    f"{feed.tag_id:>12} {state:>4} {interval:>6} "
+                    f"{feed.priority:>4}  {feed.description}"
+                )
+            return 0
+
+        if args.command == "add":
+            feed = FeedInfo(
+                args.tag_id,
+                args.description,
+                enabled=not args.disabled,
+                interval_minutes=args.interval,
+                priority=args.priority,
+            )
+            await registry.save([feed])
+            print(f"Лента {feed.tag_id} сохранена: {feed.url}")
+            return 0
+
+        if args.command == "remove":
+            removed = await registry.remove(args.tag_ids)
+            print(f"Удалено лент: {removed}")
+            return 0
+
+        # Команды изменения существующих лент
+        if registry.source != "redis":
+            print("Реестр пуст - сначала выполните import")
+            return 1
+        feeds = []
+        for tag_id in args.tag_ids:
+            feed = registry.get(tag_id)
+            if feed is None:
+                print(f"Лента {tag_id} не найдена")
+                return 1
+            if args.command in ("enable", "disable"):
+                feed.enabled = args.command == "enable"
+            elif args.command == "set":
+                if args.description is not None:
+                    feed.description = args.description
+                if args.interval is not None:
+                    feed.interval_minutes = args.interval
+                if args.priority is not None:
+                    feed.priority = args.priority
+            feeds.append(feed)
+        await registry.save(feeds)
+        print(f"Изменено лент: {len(feeds)}")
+        return 0
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Реестр RSS лент в Redis")
+    parser.add_argument("--redis-url", default=Config.REDIS_URL, help="URL Redis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import", help="Импорт лент из Config.RSS_FEEDS или JSON файла"
+    )
+    import_parser.add_argument(
+        "--file", default=None, help='JSON {"tag_id": "описание"}'
+    )
+    import_parser.add_argument(
+        "--overwrite", action="store_true", help="Обновить описания заведенных лент"
+    )
+
+    commands.add_parser("list", help="Список лент")
+
+    add_parser = commands.add_parser("add", help="Добавить или заменить ленту")
+    add_parser.add_argument("tag_id")
+    add_parser.add_argument("description")
+    add_parser.add_argument("--interval", type=int, default=0, help="Минуты, 0 - общий")
+    add_parser.add_argument("--priority", type=int, default=0)
+    add_parser.add_argument("--disabled", action="store_true")
+
+    for name, help_text in (
+        ("enable", "Включить ленты"),
+        ("disable", "Отключить ленты"),
+        ("remove", "Удалить ленты"),
+    ):
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument("tag_ids", nargs="+")
+
+    set_parser = commands.add_parser("set", help="Изменить настройки лент")
+    set_parser.add_argument("tag_ids", nargs="+")
+    set_parser.add_argument("--description", default=None)
+    set_parser.add_argument("--interval", type=int, default=None)
+    set_parser.add_argument("--priority", type=int, default=None)
+
+    args = parser.parse_args()
+    return asyncio.run(run_command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест парсера против локальной заглушки AO3 (tools.ao3_stub)
+
+Перебирает число лент и степень параллелизма, для каждой точки запускает
+отдельный процесс и измеряет время цикла, CPU и пиковый RSS.
+Пример:
+    uv run python -m tools.load_test --feeds 50,500,2000 --concurrency 1,8,32 --csv load.csv
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import csv
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from rss_parser.fetcher import AsyncFeedFetcher
+from rss_parser.rss_parser import RSSParser
+from tools.replay import create_redis_client
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mb() -> float:
+    # На Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_point(
+    base_url: str,
+    feeds: int,
+    concurrency: int,
+    cycles: int,
+    redis_url: Optional[str] = None,
+    flush_redis: bool = False,
+    http_client: str = "urllib",
+) -> Dict:
+    """Выполняет несколько циклов проверки для одной точки нагрузки"""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    )
+
+    client = create_redis_client(redis_url)
+    if redis_url and flush_redis:
+        await client.flushdb()
+    connector = RedisConnector(redis_url or "fakeredis://")
+    connector.redis = client
+
+    feed_urls = [f"{base_url}/tags/{100000 + i}/feed.atom" for i in range(feeds)]
+    # Один пул соединений на все шарды, как в основном процессе
+    http_fetcher = (
+        AsyncFeedFetcher(max_connections=max(concurrency, 1))
+        if http_client == "httpx"
+        else None
+    )
+    parsers = []
+    for shard in range(concurrency):
+        parser = RSSParser(
+            feed_urls[shard::concurrency], redis=connector, http_fetcher=http_fetcher
+        )
+        parser.feed_delay_seconds = 0
+        parsers.append(parser)
+
+    cycle_results = []
+    for cycle in range(cycles):
+        http_mark = dict(http_fetcher.stats) if http_fetcher else {}
+        cpu_start = _cpu_seconds()
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(parser.get_new_entries() for parser in parsers)
+        )
+        cycle_results.append(
+            {
+                "cycle": cycle,
+                "cycle_seconds": time.perf_counter() - started,
+                "cpu_seconds": _cpu_seconds() - cpu_start,
+                "updated_works": sum(len(result) for result in results),
+                "http": http_fetcher.stats_since(http_mark) if http_fetcher else {},
+            }
+        )
+
+    if http_fetcher:
+        await http_fetcher.close()
+    await connector.disconnect()
+
+    return {
+        "feeds": feeds,
+        "concurrency": concurrency,
+        "cycles": cycle_results,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def start_stub(args) -> subprocess.Popen:
+    """Запускает заглушку AO3 в отдельном процессе и ждет готовности"""
+    command = [
+        sys.executable,
+        "-m",
+        "tools.ao3_stub",
+        "--port",
+        str(args.port),
+        "--entries",
+        str(args.entries),
+        "--summary-size",
+        str(args.summary_size),
+        "--churn",
+        str(args.churn),
+        "--latency",
+        str(args.latency),
+        "--jitter",
+        str(args.jitter),
+        "--error-rate",
+        str(args.error_rate),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # Первая строка вывода означает, что сервер слушает порт
+    process.stdout.readline()
+    return process
+
+
+def run_sweep(args) -> List[Dict]:
+    """Перебирает точки нагрузки, каждую в отдельном процессе"""
+    base_url = f"http://127.0.0.1:{args.port}"
+    stub = start_stub(args)
+    rows = []
+
+    try:
+        for feeds in [int(value) for value in args.feeds.split(",")]:
+            for concurrency in [int(value) for value in args.concurrency.split(",")]:
+                command = [
+                    sys.executable,
+                    "-m",
+                    "tools.load_test",
+                    "point",
+                    "--base-url",
+                    base_url,
+                    "--feeds",
+                    str(feeds),
+                    "--concurrency",
+                    str(concurrency),
+                    "--cycles",
+                    str(args.cycles),
+                    "--http-client",
+                    args.http_client,
+                ]
+                if args.redis_url:
+                    command += ["--redis-url", args.redis_url, "--flush-redis"]
+
+                completed = subprocess.run(
+                    command, capture_output=True, text=True, check=True
+                )
+                point = json.loads(completed.stdout.strip().splitlines()[-1])
+
+                for cycle in point["cycles"]:
+                    row = {
+                        "feeds": feeds,
+                        "concurrency": concurrency,
+                        "cycle": cycle["cycle"],
+                        "cycle_seconds": round(cycle["cycle_seconds"], 4),
+                        "cpu_seconds": round(cycle["cpu_seconds"], 4),
+                        "updated_works": cycle["updated_works"],
+                        "peak_rss_mb": round(point["peak_rss_mb"], 1),
+                        "connections_new": cycle["http"].get("connections_new", ""),
+                        "connections_reused": cycle["http"].get(
+                            "connections_reused", ""
+                        ),
+                        "wire_kb": round(cycle["http"].get("wire_bytes", 0) / 1024, 1),
+                        "decoded_kb": round(
+                            cycle["http"].get("decoded_bytes", 0) / 1024, 1
+                        ),
+                    }
+                    rows.append(row)
+                    print(
+                        f"feeds={feeds:<6} concurrency={concurrency:<4} "
+                        f"cycle={cycle['cycle']} time={row['cycle_seconds']:.3f}s "
+                        f"cpu={row['cpu_seconds']:.3f}s rss={row['peak_rss_mb']:.1f}MB "
+                        f"updated={row['updated_works']}",
+                        flush=True,
+                    )
+                    if cycle["http"]:
+                        print(
+                            f"    соединений новых={row['connections_new']} "
+                            f"переиспользовано={row['connections_reused']} "
+                            f"по сети={row['wire_kb']}КБ из {row['decoded_kb']}КБ",
+                            flush=True,
+                        )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    return rows
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест RSS парсера")
+    subparsers = parser.add_subparsers(dest="command")
+
+    point = subparsers.add_parser("point", help="Одна точка нагрузки (служебная)")
+    point.add_argument("--base-url", required=True)
+    point.add_argument("--feeds", type=int, required=True)
+    point.add_argument("--concurrency", type=int, default=1)
+    point.add_argument("--cycles", type=int, default=2)
+    point.add_argument("--redis-url", default=None)
+    point.add_argument("--flush-redis", action="store_true")
+    point.add_argument("--http-client", choices=("urllib", "httpx"), default="urllib")
+
+    parser.add_argument("--feeds", default="50,500,2000,5000", help="Число лент")
+    parser.add_argument("--concurrency", default="1,4,16", help="Параллелизм")
+    parser.add_argument("--cycles", type=int, default=2, help="Циклов на точку")
+    parser.add_argument("--port", type=int, default=8089, help="Порт заглушки AO3")
+    parser.add_argument("--entries", type=int, default=20)
+    parser.add_argument("--summary-size", type=int, default=600)
+    parser.add_argument("--churn", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--redis-url",
+        default=None,
+        help="Отдельный Redis (база очищается перед каждой точкой!)",
+    )
+    parser.add_argument(
+        "--http-client",
+        choices=("urllib", "httpx"),
+        default="urllib",
+        help="Загрузка лент: urllib в потоках или общий пул httpx",
+    )
+    parser.add_argument("--csv", default=None, help="Сохранить кривые в CSV")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    if args.command == "point":
+        result = asyncio.run(
+            run_point(
+                args.base_url,
+                args.feeds,
+                args.concurrency,
+                args.cycles,
+                redis_url=args.redis_url,
+                flush_redis=args.flush_redis,
+                http_client=args.http_client,
+            )
+        )
+        print(json.dumps(result))
+        return 0
+
+    rows = run_sweep(args)
+    if args.csv and rows:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
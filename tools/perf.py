@@ -0,0 +1,84 @@
+"""
+Общие помощники для инструментов измерения производительности
+"""
+
+import functools
+import inspect
+import math
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Возвращает перцентиль (метод ближайшего ранга) для списка значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class StageTimer:
+    """Сбор длительностей по стадиям конвейера"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        """Добавляет замер для стадии"""
+        self.samples[stage].append(seconds)
+
+    def wrap(self, obj, method_name: str, stage: str):
+        """Подменяет метод экземпляра на версию, замеряющую время вызова"""
+        original = getattr(obj, method_name)
+
+        if inspect.iscoroutinefunction(original):
+
+            @functools.wraps(original)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+
+            setattr(obj, method_name, timed_async)
+        else:
+
+            @functools.wraps(original)
+            def timed_sync(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+
+            setattr(obj, method_name, timed_sync)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Возвращает перцентили по стадиям в миллисекундах"""
+        result = {}
+        for stage, values in self.samples.items():
+            result[stage] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p90_ms": percentile(values, 90) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+        return result
+
+
+def format_stage_table(summary: Dict[str, Dict[str, float]]) -> str:
+    """Форматирует сводку по стадиям в текстовую таблицу"""
+    lines = [
+        f"{'стадия':<20} {'вызовов':>8} {'p50 мс':>10} {'p90 мс':>10} "
+        f"{'p99 мс':>10} {'max мс':>10}"
+    ]
+    for stage, stats in summary.items():
+        lines.append(
+            f"{stage:<20} {stats['count']:>8} {stats['p50_ms']:>10.3f} "
+            f"{stats['p90_ms']:>10.3f} {stats['p99_ms']:>10.3f} {stats['max_ms']:>10.3f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Replay записанных RSS лент через полный конвейер:
+RSSParser.get_new_entries -> Redis (fakeredis или отдельный Redis) -> RSSBot с заглушкой Telegram
+
+Запись лент включается переменной окружения FEED_RECORD_DIR при обычном запуске.
+Пример:
+    FEED_RECORD_DIR=recordings uv run rss-parser
+    uv run rss-replay recordings --json replay_report.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from config import Config
+from rss_parser.fetcher import FeedFetcher
+from rss_parser.known_works import KnownWorks
+from rss_parser.rss_parser import RSSParser
+from telegram_bot.bot import RSSBot
+from telegram_bot.telegram_bot import TelegramNotifier
+from tools.perf import StageTimer, format_stage_table
+from utils.logging_config import setup_logging
+from utils.redis_connector import RedisConnector
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayFeedFetcher(FeedFetcher):
+    """Отдает ранее записанные ответы лент вместо обращения к сети"""
+
+    def __init__(self, source_dir: str):
+        super().__init__(record_dir=None)
+        self.source_dir = source_dir
+        self.current: Dict[str, str] = {}
+
+    def fetch(self, feed_url: str) -> bytes:
+        """Возвращает записанное тело ответа для ленты текущего цикла"""
+        file_name = self.current[feed_url]
+        with open(os.path.join(self.source_dir, file_name), "rb") as f:
+            return f.read()
+
+    def iter_chunks(self, feed_url: str, chunk_size: int = 16384):
+        """Отдает записанное тело ответа частями, как при загрузке по сети"""
+        file_name = self.current[feed_url]
+        with open(os.path.join(self.source_dir, file_name), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+class StubTelegramNotifier(TelegramNotifier):
+    """Заглушка Telegram: ничего не отправляет, только считает сообщения"""
+
+    def __init__(self, latency: float = 0.0):
+        self.channel_id = "replay"
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, message: str, parse_mode: str = "HTML") -> bool:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+        return True
+
+    async def test_connection(self) -> bool:
+        return True
+
+
+class RoundTripCounter:
+    """Считает обращения к Redis: каждая команда и каждый pipeline - один round trip"""
+
+    def __init__(self, client):
+        self.count = 0
+
+        original_execute = client.execute_command
+        original_pipeline = client.pipeline
+
+        @functools.wraps(original_execute)
+        async def execute_command(*args, **kwargs):
+            self.count += 1
+            return await original_execute(*args, **kwargs)
+
+        @functools.wraps(original_pipeline)
+        def pipeline(*args, **kwargs):
+            pipe = original_pipeline(*args, **kwargs)
+            original_pipe_execute = pipe.execute
+
+            async def pipe_execute(*p_args, **p_kwargs):
+                self.count += 1
+                return await original_pipe_execute(*p_args, **p_kwargs)
+
+            pipe.execute = pipe_execute
+            return pipe
+
+        client.execute_command = execute_command
+        client.pipeline = pipeline
+
+
+def load_cycles(record_dir: str) -> List[List[Dict]]:
+    """
+    Читает манифест записи и разбивает его на циклы проверки
+
+    Новый цикл начинается, когда URL ленты встречается повторно.
+    """
+    manifest_path = os.path.join(record_dir, "manifest.jsonl")
+    cycles: List[List[Dict]] = []
+    current: List[Dict] = []
+    seen_urls = set()
+
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item["url"] in seen_urls:
+                cycles.append(current)
+                current = []
+                seen_urls = set()
+            seen_urls.add(item["url"])
+            current.append(item)
+
+    if current:
+        cycles.append(current)
+    return cycles
+
+
+def create_redis_client(redis_url: Optional[str]):
+    """Создает клиент Redis: реальный по URL или встроенный fakeredis"""
+    if redis_url:
+        return aioredis.from_url(redis_url)
+
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit(
+            "Для replay без Redis нужен пакет fakeredis: uv sync --extra bench"
+        )
+    return fakeredis.FakeAsyncRedis()
+
+
+async def run_replay(
+    record_dir: str,
+    redis_url: Optional[str] = None,
+    max_cycles: int = 0,
+    send_latency: float = 0.0,
+    transport: str = "list",
+    bloom: bool = False,
+) -> Dict:
+    """Прогоняет записанные циклы через парсер и бота, возвращает отчет"""
+    cycles = load_cycles(record_dir)
+    if max_cycles > 0:
+        cycles = cycles[:max_cycles]
+
+    client = create_redis_client(redis_url)
+    round_trips = RoundTripCounter(client)
+    connector = RedisConnector(redis_url or "fakeredis://", queue_transport=transport)
+    connector.redis = client
+
+    fetcher = ReplayFeedFetcher(record_dir)
+    known_works = (
+        KnownWorks(connector, Config.BLOOM_CAPACITY, Config.BLOOM_ERROR_RATE)
+        if bloom
+        else None
+    )
+    parser = RSSParser([], redis=connector, fetcher=fetcher, known_works=known_works)
+    parser.feed_delay_seconds = 0
+    notifier = StubTelegramNotifier(latency=send_latency)
+    bot = RSSBot(telegram_notifier=notifier, redis=connector)
+
+    timer = StageTimer()
+    timer.wrap(parser, "fetch_feed", "fetch_parse")
+    timer.wrap(parser, "_extract_work_id", "extract_work_id")
+    timer.wrap(parser, "_parse_entry", "parse_entry")
+    timer.wrap(connector, "get_fanfic_metadata", "redis_lookup")
+    timer.wrap(connector, "save_fanfic_metadata", "persist")
+    timer.wrap(connector, "update_fanfic_metadata", "persist_fields")
+    timer.wrap(connector, "was_message_sent_recently", "sent_check")
+    timer.wrap(connector, "add_to_queue", "enqueue")
+    timer.wrap(connector, "pop_queue_entry", "dequeue")
+    timer.wrap(bot, "process_queue_item", "process_item")
+    timer.wrap(notifier, "send_message", "send")
+
+    updated_works = 0
+    watermark_skipped = 0
+    started = time.perf_counter()
+
+    for cycle in cycles:
+        fetcher.current = {item["url"]: item["file"] for item in cycle}
+        parser.feed_urls = [item["url"] for item in cycle]
+
+        cycle_start = time.perf_counter()
+        new_entries = await parser.get_new_entries()
+        timer.record("ingest_cycle", time.perf_counter() - cycle_start)
+        updated_works += len(new_entries)
+        watermark_skipped += parser.last_cycle_stats.get("watermark_skipped", 0)
+
+        drain_start = time.perf_counter()
+        # Неотправленный элемент stream остается неподтвержденным и до
+        # QUEUE_CLAIM_IDLE_MS не выдается снова: когда в потоке остались только
+        # такие элементы, ждать их нет смысла
+        while await connector.get_queue_length() > await connector.get_pending_count():
+            await bot.process_queue()
+        timer.record("drain_cycle", time.perf_counter() - drain_start)
+
+    elapsed = time.perf_counter() - started
+    stages = timer.summary()
+    entries_checked = stages.get("extract_work_id", {}).get("count", 0)
+    unacked = await connector.get_pending_count()
+
+    await connector.disconnect()
+
+    return {
+        "cycles": len(cycles),
+        "feeds": sum(len(cycle) for cycle in cycles),
+        "entries_checked": entries_checked,
+        "watermark_skipped": watermark_skipped,
+        "updated_works": updated_works,
+        "messages_sent": notifier.sent,
+        "unacked": unacked,
+        "elapsed_seconds": elapsed,
+        "works_per_second": entries_checked / elapsed if elapsed else 0.0,
+        "redis_round_trips": round_trips.count,
+        "redis_round_trips_per_work": (
+            round_trips.count / entries_checked if entries_checked else 0.0
+        ),
+        "stages": stages,
+    }
+
+
+def print_report(report: Dict):
+    """Печатает отчет replay в консоль"""
+    print(f"Циклов: {report['cycles']}, лент: {report['feeds']}")
+    print(
+        f"Записей проверено: {report['entries_checked']}, "
+        f"пропущено по отметке: {report['watermark_skipped']}, "
+        f"обновлено: {report['updated_works']}, отправлено: {report['messages_sent']}"
+    )
+    if report["unacked"]:
+        print(f"Не подтверждено элементов stream: {report['unacked']}")
+    print(f"Время: {report['elapsed_seconds']:.3f} с")
+    print(f"Работ в секунду: {report['works_per_second']:.1f}")
+    print(
+        f"Round trip Redis: {report['redis_round_trips']} "
+        f"({report['redis_round_trips_per_work']:.2f} на работу)"
+    )
+    print()
+    print(format_stage_table(report["stages"]))
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(
+        description="Replay записанных RSS лент через парсер, Redis и заглушку Telegram"
+    )
+    parser.add_argument("record_dir", help="Каталог с записью (FEED_RECORD_DIR)")
+    parser.add_argument(
+        "--redis-url",
+        default=None,
+        help="URL отдельного Redis (по умолчанию встроенный fakeredis)",
+    )
+    parser.add_argument(
+        "--cycles", type=int, default=0, help="Ограничить число циклов (0 - все)"
+    )
+    parser.add_argument(
+        "--send-latency",
+        type=float,
+        default=0.0,
+        help="Искусственная задержка отправки в заглушке Telegram (секунды)",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=("list", "stream"),
+        default="list",
+        help="Транспорт очереди отправки",
+    )
+    parser.add_argument(
+        "--bloom",
+        action="store_true",
+        help="Пропускать чтение метаданных по фильтру известных работ",
+    )
+    parser.add_argument("--json", default=None, help="Сохранить отчет в JSON файл")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логирования")
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+
+    report = asyncio.run(
+        run_replay(
+            args.record_dir,
+            redis_url=args.redis_url,
+            max_cycles=args.cycles,
+            send_latency=args.send_latency,
+            transport=args.transport,
+            bloom=args.bloom,
+        )
+    )
+    print_report(report)
+    tracer.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Поиск по сохраненным работам и обслуживание поискового индекса
+
+Индекс обновляется парсером при записи метаданных (SEARCH_ENABLED=true);
+для данных, сохраненных до включения поиска или загруженных tools.state,
+он строится командой rebuild. bench замеряет запросы на синтетическом
+корпусе во встроенном fakeredis в сравнении с перебором всех работ.
+Пример:
+    uv run python -m tools.search query драббл флафф rating:teen words:-5000
+    uv run python -m tools.search facets
+    uv run python -m tools.search rebuild
+    uv run python -m tools.search bench --works 100000
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from typing import Dict, List
+
+from config import Config
+from tools.perf import StageTimer, format_stage_table, percentile
+from tools.state import _connector
+from utils.redis_connector import FANFIC_IDS_KEY, RedisConnector
+from utils.search import SearchIndex, SearchQuery, parse_query
+from utils.search_text import document_facets, document_terms, document_words
+
+RATINGS = (
+    "General Audiences",
+    "Teen And Up Audiences",
+    "Mature",
+    "Explicit",
+    "Not Rated",
+)
+ENDINGS = ("а", "ы", "ой", "ами", "ов", "е", "ая", "ого", "ить", "ился", "и", "у")
+SYLLABLES = ("ка", "ро", "ми", "ле", "сна", "тру", "ви", "до", "жа", "пу", "бре", "зо")
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    """Синтетические основы русских слов"""
+    stems = set()
+    while len(stems) < size:
+        stems.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(stems)
+
+
+def _zipf_weights(size: int) -> List[float]:
+    """Накопленные веса закона Ципфа: частые слова встречаются чаще"""
+    return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def _synthetic_work(rng: random.Random, stems: List[str], weights, tags) -> Dict:
+    def words(count):
+        return " ".join(
+            stem + rng.choice(ENDINGS)
+            for stem in rng.choices(stems, cum_weights=weights, k=count)
+        )
+
+    return {
+        "title": words(3).capitalize(),
+        "author": f"author{rng.randint(1, 5000)}",
+        "fandom": f"Фандом {rng.randint(1, 200)}",
+        "relationships": f"Персонаж {rng.randint(1, 500)}/Персонаж {rng.randint(1, 500)}",
+        "additional_tags": ", ".join(rng.sample(tags, 4)),
+        "summary": words(25),
+        "rating": rng.choice(RATINGS),
+        "language": "Русский" if rng.random() < 0.9 else "English",
+        "words": str(int(rng.lognormvariate(9, 1.2))),
+    }
+
+
+def _scan(documents: List[Dict], query: SearchQuery) -> int:
+    """Число совпадений перебором всех работ (для сравнения)"""
+    low, high = query.words
+    total = 0
+    for terms, facets, words in documents:
+        if any(term not in terms for term in query.terms):
+            continue
+        if any(
+            not any(value.startswith(prefix) for value in facets[field])
+            for field, prefix in query.facets.items()
+        ):
+            continue
+        if (low, high) != (None, None):
+            if words is None or (low is not None and words < low):
+                continue
+            if high is not None and words > high:
+                continue
+        total += 1
+    return total
+
+
+async def run_bench(
+    works: int, queries: int, batch: int, redis_url: str = None, seed: int = 1
+) -> Dict[str, Dict[str, float]]:
+    """Строит индекс синтетического корпуса и замеряет запросы"""
+    connector = _connector(redis_url)
+    await connector._ensure_connected()
+    index = SearchIndex(connector)
+    rng = random.Random(seed)
+    stems = _vocabulary(rng, 5000)
+    weights = _zipf_weights(len(stems))
+    tags = [f"Tag {number}" for number in range(300)]
+    timer = StageTimer()
+    documents = []
+    try:
+        start = time.perf_counter()
+        for first in range(0, works, batch):
+            async with connector.redis.pipeline(transaction=False) as pipe:
+                for number in range(first, min(first + batch, works)):
+                    work_id = str(20_000_000 + number)
+                    metadata = _synthetic_work(rng, stems, weights, tags)
+                    index_start = time.perf_counter()
+                    connector._index_work(pipe, work_id, None, metadata)
+                    timer.record("index_work", time.perf_counter() - index_start)
+                    pipe.hset(
+                        f"fanfic:metadata:{work_id}",
+                        mapping={"work_id": work_id, **metadata},
+                    )
+                    pipe.sadd(FANFIC_IDS_KEY, work_id)
+                    documents.append(
+                        (
+                            set(document_terms(metadata)),
+                            document_facets(metadata),
+                            document_words(metadata),
+                        )
+                    )
+                await pipe.execute()
+        print(
+            f"Корпус: {works} работ за {time.perf_counter() - start:.1f} с",
+            file=sys.stderr,
+        )
+
+        # Запросы: 1-3 слова из описаний, часть - с фильтрами
+        matched = partial = 0
+        checked = []
+        for number in range(queries):
+            words = [
+                stem + rng.choice(ENDINGS)
+                for stem in rng.choices(stems, cum_weights=weights, k=rng.randint(1, 3))
+            ]
+            if number % 3 == 1:
+                words.append(f"rating:{rng.choice(RATINGS).split()[0]}")
+            if number % 3 == 2:
+                words.append(f"words:{rng.randint(1, 20) * 1000}-")
+            query = parse_query(" ".join(words))
+
+            start = time.perf_counter()
+            found = await index.search(query, limit=10)
+            timer.record("search", time.perf_counter() - start)
+            checked.append(found["candidates"])
+
+            start = time.perf_counter()
+            expected = _scan(documents, query)
+            timer.record("scan", time.perf_counter() - start)
+            if found["complete"]:
+                if found["total"] != expected:
+                    raise SystemExit(f"Расхождение индекса и перебора: {words}")
+            else:
+                partial += 1
+            matched += found["total"]
+        print(
+            f"\nРабот: {works}, запросов: {queries}, найдено всего: {matched}, "
+            f"запросов по части списка: {partial}"
+        )
+        print(
+            "Проверено работ на запрос: "
+            f"p50 {percentile(checked, 50):.0f}, p90 {percentile(checked, 90):.0f}, "
+            f"max {max(checked, default=0)} (перебор: {works})"
+        )
+        summary = timer.summary()
+        print(format_stage_table(summary))
+        return summary
+    finally:
+        await connector.disconnect()
+
+
+def format_results(found: Dict) -> str:
+    """Текстовый вывод результатов поиска"""
+    lines = [f"Найдено: {found['total']}{'' if found['complete'] else '+'}"]
+    for item in found["results"]:
+        lines.append(
+            f"{item['score']:>5.0f}  {item['work_id']:>10}  {item.get('title', '')}"
+            f"  ({item.get('fandom', '-')}, {item.get('words', '?')} слов)"
+        )
+    return "\n".join(lines)
+
+
+async def run_command(args) -> int:
+    """Выполняет команду CLI, возвращает код выхода"""
+    if args.command == "bench":
+        await run_bench(args.works, args.queries, args.batch, args.bench_redis_url)
+        return 0
+
+    connector = RedisConnector(args.redis_url)
+    index = SearchIndex(connector)
+    try:
+        await connector.connect()
+
+        if args.command == "rebuild":
+            count = await index.rebuild(batch=args.batch)
+            print(f"Индекс построен по {count} работам")
+            return 0
+
+        if args.command == "facets":
+            for field, values in (await index.facet_values()).items():
+                print(f"{field}: {', '.join(values) or '-'}")
+            return 0
+
+        try:
+            query = parse_query(" ".join(args.text))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        found = await index.search(query, limit=args.limit)
+        if args.json:
+            print(json.dumps(found, ensure_ascii=False, indent=2))
+        else:
+            print(format_results(found))
+        return 0
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Поиск по сохраненным работам")
+    parser.add_argument("--redis-url", default=Config.REDIS_URL, help="URL Redis")
+    parser.add_argument("--batch", type=int, default=500, help="Работ за pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = commands.add_parser("query", help="Найти работы")
+    query_parser.add_argument("text", nargs="+", help="Слова и фильтры запроса")
+    query_parser.add_argument("--limit", type=int, default=10)
+    query_parser.add_argument("--json", action="store_true", help="Вывод в JSON")
+
+    commands.add_parser("facets", help="Известные значения фильтров")
+    commands.add_parser("rebuild", help="Построить индекс заново по метаданным")
+
+    bench_parser = commands.add_parser("bench", help="Замер на синтетическом корпусе")
+    bench_parser.add_argument("--works", type=int, default=100000)
+    bench_parser.add_argument("--queries", type=int, default=300)
+    bench_parser.add_argument(
+        "--bench-redis-url", default=None, help="URL Redis (по умолчанию fakeredis)"
+    )
+
+    args = parser.parse_args()
+    return asyncio.run(run_command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
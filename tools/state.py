@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+Выгрузка и загрузка состояния Redis в сжатый NDJSON
+
+Переносит метаданные работ (fanfic:metadata:*), отправленные сообщения
+(channel:sent_messages) и очередь отправки (список queue:new_fanfics или
+поток queue:stream вместе с queue:meta) между инстансами Redis. Данные
+читаются порциями через SCAN/HSCAN/LRANGE и пишутся порциями через pipeline,
+поэтому память не растет с размером базы.
+
+Формат - gzip, по JSON объекту на строку: заголовок, записи (metadata, sent,
+queue в порядке постановки) и итог с количеством записей. Загрузка пишет
+номер последней примененной записи в <файл>.progress; прерванную загрузку
+продолжает --resume.
+
+Пример:
+    uv run python -m tools.state export state.ndjson.gz
+    uv run python -m tools.state import state.ndjson.gz --redis-url redis://new:6379/0
+    uv run python -m tools.state import state.ndjson.gz --resume
+    uv run python -m tools.state bench --works 200000   # нужен fakeredis
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+from config import Config
+from utils.redis_connector import (
+    FANFIC_IDS_KEY,
+    QUEUE_KEY,
+    QUEUE_META_KEY,
+    QUEUE_STREAM_KEY,
+    RedisConnector,
+)
+
+FORMAT_VERSION = 1
+SECTIONS = ("metadata", "sent", "queue")
+METADATA_PREFIX = "fanfic:metadata:"
+SENT_MESSAGES_KEY = "channel:sent_messages"
+# Как часто печатать прогресс (записей)
+PROGRESS_EVERY = 10000
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class Progress:
+    """Печатает количество обработанных записей и скорость"""
+
+    def __init__(self, action: str, every: int = PROGRESS_EVERY):
+        """
+        Args:
+            every: Печатать прогресс каждые every записей (0 - не печатать)
+        """
+        self.action = action
+        self.every = every
+        self.count = 0
+        self.counts: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def add(self, section: str, count: int = 1):
+        before = self.count // self.every if self.every else 0
+        self.count += count
+        self.counts[section] = self.counts.get(section, 0) + count
+        if self.every and self.count // self.every > before:
+            self.report()
+
+    @property
+    def rate(self) -> float:
+        return self.count / max(time.perf_counter() - self.started, 1e-9)
+
+    def report(self, final: bool = False):
+        sections = ", ".join(f"{name}: {n}" for name, n in self.counts.items())
+        prefix = "Итого" if final else self.action
+        print(
+            f"{prefix}: {self.count} записей ({sections}), {self.rate:.0f} записей/с",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+async def _export_metadata(redis, write, progress: Progress, batch: int):
+    """Метаданные работ: SCAN ключей, HGETALL порцией в одном pipeline"""
+    keys: List[bytes] = []
+
+    async def flush():
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            results = await pipe.execute()
+        for key, fields in zip(keys, results):
+            if not fields:
+                # Ключ удален между SCAN и HGETALL
+                continue
+            write(
+                {
+                    "type": "metadata",
+                    "work_id": _text(key)[len(METADATA_PREFIX) :],
+                    "fields": {_text(k): _text(v) for k, v in fields.items()},
+                }
+            )
+            progress.add("metadata")
+        keys.clear()
+
+    async for key in redis.scan_iter(match=f"{METADATA_PREFIX}*", count=batch):
+        keys.append(key)
+        if len(keys) >= batch:
+            await flush()
+    if keys:
+        await flush()
+
+
+async def _export_sent(redis, write, progress: Progress, batch: int):
+    """Отправленные сообщения: HSCAN хеша channel:sent_messages"""
+    async for work_id, value in redis.hscan_iter(SENT_MESSAGES_KEY, count=batch):
+        write({"type": "sent", "work_id": _text(work_id), "value": _text(value)})
+        progress.add("sent")
+
+
+async def _export_queue(redis, write, progress: Progress, batch: int):
+    """
+    Очередь отправки от самого старого элемента к новому
+
+    Элементы выгружаются без привязки к транспорту: загрузка ставит их
+    в очередь того транспорта, который настроен у целевого инстанса.
+    """
+    # Поток: XRANGE порциями, данные элемента хранятся в самом потоке
+    last_id = "-"
+    while True:
+        entries = await redis.xrange(QUEUE_STREAM_KEY, min=last_id, count=batch + 1)
+        if last_id != "-":
+            entries = entries[1:]
+        if not entries:
+            break
+        for entry_id, fields in entries:
+            fields = {_text(k): _text(v) for k, v in fields.items()}
+            write(
+                {
+                    "type": "queue",
+                    "work_id": fields.get("work_id", ""),
+                    "meta": json.loads(fields.get("meta") or "{}"),
+                }
+            )
+            progress.add("queue")
+        last_id = entries[-1][0]
+
+    # Список: LPUSH в голову, RPOP с хвоста - самые старые в конце
+    length = await redis.llen(QUEUE_KEY)
+    end = length
+    while end > 0:
+        start = max(0, end - batch)
+        work_ids = await redis.lrange(QUEUE_KEY, start, end - 1)
+        work_ids = [_text(work_id) for work_id in reversed(work_ids)]
+        raw_metas = await redis.hmget(QUEUE_META_KEY, work_ids) if work_ids else []
+        for work_id, raw_meta in zip(work_ids, raw_metas):
+            write(
+                {
+                    "type": "queue",
+                    "work_id": work_id,
+                    "meta": json.loads(raw_meta) if raw_meta else {},
+                }
+            )
+            progress.add("queue")
+        end = start
+
+
+EXPORTERS = {
+    "metadata": _export_metadata,
+    "sent": _export_sent,
+    "queue": _export_queue,
+}
+
+
+async def export_state(
+    connector: RedisConnector,
+    path: str,
+    sections=SECTIONS,
+    batch: int = 500,
+    quiet: bool = False,
+) -> Dict[str, int]:
+    """
+    Выгружает разделы состояния в gzip NDJSON
+
+    Файл пишется во временный и переименовывается в конце, поэтому
+    недописанная выгрузка не выдает себя за полную.
+
+    Returns:
+        Количество записей по разделам
+    """
+    await connector._ensure_connected()
+    redis = connector.redis
+    progress = Progress("Выгружено", every=0 if quiet else PROGRESS_EVERY)
+    partial = f"{path}.partial"
+
+    with gzip.open(partial, "wt", encoding="utf-8", compresslevel=6) as f:
+
+        def write(record: Dict):
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+        write(
+            {
+                "type": "header",
+                "version": FORMAT_VERSION,
+                "exported_at": int(time.time()),
+                "sections": list(sections),
+            }
+        )
+        for section in sections:
+            progress.counts.setdefault(section, 0)
+            await EXPORTERS[section](redis, write, progress, batch)
+        write({"type": "end", "counts": progress.counts})
+
+    os.replace(partial, path)
+    if not quiet:
+        progress.report(final=True)
+    return progress.counts
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """Читает записи выгрузки по одной, проверяя заголовок и итог"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("type") != "header":
+            raise ValueError(f"{path}: нет заголовка выгрузки")
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"{path}: версия формата {header.get('version')}, "
+                f"поддерживается {FORMAT_VERSION}"
+            )
+        complete = False
+        for line in f:
+            record = json.loads(line)
+            if record.get("type") == "end":
+                complete = True
+                break
+            yield record
+        if not complete:
+            raise ValueError(f"{path}: выгрузка оборвана (нет итоговой записи)")
+
+
+class StateImporter:
+    """Пишет записи выгрузки в Redis порциями через pipeline"""
+
+    def __init__(self, connector: RedisConnector):
+        self.connector = connector
+        self.redis = connector.redis
+        self.stream = connector.queue_transport == "stream"
+
+    async def apply(self, records: List[Dict]):
+        """Применяет порцию записей; повторное применение безопасно"""
+        queued = [record for record in records if record["type"] == "queue"]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for record in records:
+                kind = record["type"]
+                if kind == "metadata":
+                    pipe.hset(
+                        f"{METADATA_PREFIX}{record['work_id']}",
+                        mapping=record["fields"],
+                    )
+                    pipe.sadd(FANFIC_IDS_KEY, record["work_id"])
+                elif kind == "sent":
+                    pipe.hset(SENT_MESSAGES_KEY, record["work_id"], record["value"])
+            # Как и в add_to_queue, запись в queue:meta - маркер элемента:
+            # работа, которая уже ждет в очереди, второй раз не ставится
+            for record in queued:
+                pipe.hsetnx(
+                    QUEUE_META_KEY, record["work_id"], json.dumps(record["meta"])
+                )
+            results = await pipe.execute()
+
+        if not queued:
+            return
+        added = [
+            record
+            for record, is_new in zip(queued, results[len(results) - len(queued) :])
+            if is_new
+        ]
+        if not added:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for record in added:
+                    if self.stream:
+                        pipe.xadd(
+                            QUEUE_STREAM_KEY,
+                            {
+                                "work_id": record["work_id"],
+                                "meta": json.dumps(record["meta"]),
+                            },
+                            maxlen=Config.QUEUE_STREAM_MAXLEN,
+                            approximate=True,
+                        )
+                    else:
+                        pipe.lpush(QUEUE_KEY, record["work_id"])
+                entry_ids = await pipe.execute()
+        except Exception:
+            # Маркеры без элементов не дали бы поставить работы при повторе
+            await self.redis.hdel(
+                QUEUE_META_KEY, *(record["work_id"] for record in added)
+            )
+            raise
+        if self.stream:
+            # Как в add_to_queue: id элемента в маркере
+            await self.redis.hset(
+                QUEUE_META_KEY,
+                mapping={
+                    record["work_id"]: json.dumps(
+                        {**record["meta"], "stream_id": _text(entry_id)}
+                    )
+                    for record, entry_id in zip(added, entry_ids)
+                },
+            )
+
+
+def _read_progress(path: str) -> int:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(json.load(f).get("records", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_progress(path: str, records: int):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"records": records}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+async def import_state(
+    connector: RedisConnector,
+    path: str,
+    batch: int = 500,
+    resume: bool = False,
+    quiet: bool = False,
+) -> Dict[str, int]:
+    """
+    Загружает выгрузку в Redis
+
+    После каждой порции номер последней записи сохраняется в <файл>.progress;
+    с resume загрузка пропускает уже примененные записи. После полной
+    загрузки файл прогресса удаляется.
+
+    Returns:
+        Количество загруженных записей по разделам
+    """
+    await connector._ensure_connected()
+    importer = StateImporter(connector)
+    progress_path = f"{path}.progress"
+    skip = _read_progress(progress_path) if resume else 0
+    if skip and not quiet:
+        print(f"Продолжаем загрузку с записи {skip + 1}", file=sys.stderr)
+
+    progress = Progress("Загружено", every=0 if quiet else PROGRESS_EVERY)
+    position = 0
+    pending: List[Dict] = []
+
+    async def flush():
+        await importer.apply(pending)
+        for record in pending:
+            progress.add(record["type"])
+        _write_progress(progress_path, position)
+        pending.clear()
+
+    for record in read_records(path):
+        position += 1
+        if position <= skip:
+            continue
+        pending.append(record)
+        if len(pending) >= batch:
+            await flush()
+    if pending:
+        await flush()
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    if not quiet:
+        progress.report(final=True)
+        if progress.counts.get("metadata"):
+            steps = ["счетчики статистики (uv run python -m tools.stats rebuild)"]
+            if Config.BLOOM_ENABLED:
+                steps.append(
+                    "фильтр известных работ (uv run python -m tools.bloom_rebuild)"
+                )
+            if Config.SEARCH_ENABLED:
+                steps.append("поисковый индекс (uv run python -m tools.search rebuild)")
+            print(
+                "Загружены метаданные - перестройте " + ", ".join(steps),
+                file=sys.stderr,
+            )
+    return progress.counts
+
+
+def _create_fake_client():
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit(
+            "Для bench без Redis нужен пакет fakeredis: uv sync --extra bench"
+        )
+    return fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+
+
+def _connector(redis_url: Optional[str]) -> RedisConnector:
+    """Коннектор к Redis по URL или к отдельному встроенному fakeredis"""
+    if redis_url:
+        return RedisConnector(redis_url)
+    connector = RedisConnector("fakeredis://")
+    connector.redis = _create_fake_client()
+    return connector
+
+
+async def _fill_synthetic(connector: RedisConnector, works: int, batch: int):
+    """Заполняет Redis синтетическими работами, отправками и очередью"""
+    redis = connector.redis
+    summary = "Саммари работы, несколько предложений текста. " * 8
+    for start in range(0, works, batch):
+        async with redis.pipeline(transaction=False) as pipe:
+            for index in range(start, min(start + batch, works)):
+                work_id = str(10_000_000 + index)
+                pipe.hset(
+                    f"{METADATA_PREFIX}{work_id}",
+                    mapping={
+                        "work_id": work_id,
+                        "title": f"Работа {index}",
+                        "author": f"author{index % 997}",
+                        "link": f"https://archiveofourown.org/works/{work_id}",
+                        "updated_at": "2024-01-01",
+                        "chapters": str(index % 40 + 1),
+                        "words": str(1000 + index * 7 % 90000),
+                        "fandom": "Russian Actor RPF",
+                        "additional_tags": "Fluff, Angst, Alternate Universe",
+                        "summary": summary,
+                        "source": "rss",
+                    },
+                )
+                pipe.sadd(FANFIC_IDS_KEY, work_id)
+                if index % 2 == 0:
+                    pipe.hset(SENT_MESSAGES_KEY, work_id, f"{index}:2024-01-01")
+                if index % 50 == 0:
+                    pipe.hset(
+                        QUEUE_META_KEY,
+                        work_id,
+                        json.dumps({"enqueued_at": time.time()}),
+                    )
+                    pipe.lpush(QUEUE_KEY, work_id)
+            await pipe.execute()
+
+
+async def run_bench(works: int, batch: int, source_url: str, target_url: str) -> Dict:
+    """Выгружает и загружает синтетический корпус, возвращает замеры"""
+    source = _connector(source_url)
+    target = _connector(target_url)
+    try:
+        await source._ensure_connected()
+        await target._ensure_connected()
+        fill_start = time.perf_counter()
+        await _fill_synthetic(source, works, batch)
+        print(
+            f"Корпус: {works} работ за {time.perf_counter() - fill_start:.1f} с",
+            file=sys.stderr,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.ndjson.gz")
+            start = time.perf_counter()
+            counts = await export_state(source, path, batch=batch, quiet=True)
+            export_seconds = time.perf_counter() - start
+            size = os.path.getsize(path)
+
+            start = time.perf_counter()
+            imported = await import_state(target, path, batch=batch, quiet=True)
+            import_seconds = time.perf_counter() - start
+
+        records = sum(counts.values())
+        return {
+            "works": works,
+            "records": records,
+            "file_bytes": size,
+            "export_seconds": export_seconds,
+            "export_records_per_second": records / export_seconds,
+            "import_seconds": import_seconds,
+            "import_records_per_second": records / import_seconds,
+            "imported": imported,
+            # Пиковая память процесса (Linux - КБ)
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    finally:
+        await source.disconnect()
+        await target.disconnect()
+
+
+async def run_command(args) -> int:
+    """Выполняет команду CLI, возвращает код выхода"""
+    if args.command == "bench":
+        report = await run_bench(
+            args.works, args.batch, args.redis_url, args.target_url
+        )
+        print(
+            f"Записей: {report['records']}, файл: {report['file_bytes'] / 2**20:.1f} МБ\n"
+            f"Выгрузка: {report['export_seconds']:.2f} с, "
+            f"{report['export_records_per_second']:.0f} записей/с\n"
+            f"Загрузка: {report['import_seconds']:.2f} с, "
+            f"{report['import_records_per_second']:.0f} записей/с\n"
+            f"Пик памяти процесса: {report['max_rss_mb']:.0f} МБ"
+        )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        return 0
+
+    connector = RedisConnector(args.redis_url or Config.REDIS_URL)
+    try:
+        await connector.connect()
+        if args.command == "export":
+            sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+            unknown = set(sections) - set(SECTIONS)
+            if unknown:
+                print(f"Неизвестные разделы: {', '.join(sorted(unknown))}")
+                return 1
+            await export_state(connector, args.file, sections, args.batch)
+        else:
+            try:
+                await import_state(connector, args.file, args.batch, args.resume)
+            except ValueError as e:
+                print(e)
+                return 1
+        return 0
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(
+        description="Выгрузка и загрузка состояния Redis (gzip NDJSON)"
+    )
+    parser.add_argument(
+        "--redis-url",
+        default=None,
+        help="URL Redis (по умолчанию REDIS_URL; для bench - встроенный fakeredis)",
+    )
+    parser.add_argument(
+        "--batch", type=int, default=500, help="Записей в одном pipeline"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Выгрузить состояние в файл")
+    export_parser.add_argument("file")
+    export_parser.add_argument(
+        "--sections",
+        default=",".join(SECTIONS),
+        help="Разделы через запятую: metadata, sent, queue",
+    )
+
+    import_parser = commands.add_parser("import", help="Загрузить состояние из файла")
+    import_parser.add_argument("file")
+    import_parser.add_argument(
+        "--resume", action="store_true", help="Продолжить прерванную загрузку"
+    )
+
+    bench_parser = commands.add_parser(
+        "bench", help="Замер выгрузки и загрузки синтетического корпуса"
+    )
+    bench_parser.add_argument("--works", type=int, default=100000)
+    bench_parser.add_argument(
+        "--target-url", default=None, help="Redis для загрузки (по умолчанию fakeredis)"
+    )
+    bench_parser.add_argument("--json", default=None, help="Сохранить отчет в JSON")
+
+    args = parser.parse_args()
+    return asyncio.run(run_command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
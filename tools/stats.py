@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Статистика работ, обновлений и отправок из счетчиков Redis
+
+Счетчики ведутся при записи (RedisConnector.save_fanfic_metadata,
+update_fanfic_metadata, save_sent_message), поэтому чтение статистики не
+обходит ключи. Для данных, сохраненных до появления счетчиков или
+загруженных tools.state, счетчики работ пересчитываются командой rebuild.
+Пример:
+    uv run python -m tools.stats show --days 14 --top 10
+    uv run python -m tools.stats show --snapshot   # последний снимок парсера
+    uv run python -m tools.stats rebuild
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from config import Config
+from utils.redis_connector import RedisConnector
+
+
+def format_stats(stats: dict) -> str:
+    """Текстовый отчет по результату get_stats"""
+    lines = [
+        f"Работ: {stats['fanfic_metadata_count']}, "
+        f"отправлено: {stats['sent_messages_count']}, "
+        f"в очереди: {stats['queue_length']}"
+    ]
+    if "generated_at" in stats:
+        lines.append(f"Снимок от {stats['generated_at']}")
+    for dimension, counts in stats["works"].items():
+        lines.append(f"\n{dimension}:")
+        for value, count in counts.items():
+            lines.append(f"  {count:>7}  {value}")
+    lines.append("\nпо дням:")
+    for day, counts in stats["daily"].items():
+        updates = ", ".join(f"{k}: {v}" for k, v in sorted(counts["updates"].items()))
+        lines.append(f"  {day}  отправлено {counts['sent']:>5}  {updates or '-'}")
+    return "\n".join(lines)
+
+
+async def run_command(args) -> int:
+    """Выполняет команду CLI, возвращает код выхода"""
+    connector = RedisConnector(args.redis_url)
+    try:
+        await connector.connect()
+
+        if args.command == "rebuild":
+            count = await connector.rebuild_stats()
+            print(f"Счетчики пересчитаны по {count} работам")
+            return 0
+
+        if args.snapshot:
+            stats = await connector.get_stats_snapshot()
+            if stats is None:
+                print("Снимка нет - парсер еще не сохранял статистику")
+                return 1
+        else:
+            stats = await connector.get_stats(days=args.days, top=args.top)
+        if not stats:
+            return 1
+        if args.json:
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+        else:
+            print(format_stats(stats))
+        return 0
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Статистика из счетчиков Redis")
+    parser.add_argument("--redis-url", default=Config.REDIS_URL, help="URL Redis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = commands.add_parser("show", help="Показать статистику")
+    show_parser.add_argument("--days", type=int, default=7, help="Дней по дням")
+    show_parser.add_argument(
+        "--top", type=int, default=20, help="Значений по каждому полю (0 - все)"
+    )
+    show_parser.add_argument(
+        "--snapshot", action="store_true", help="Последний снимок stats:snapshot"
+    )
+    show_parser.add_argument("--json", action="store_true", help="Вывод в JSON")
+
+    commands.add_parser("rebuild", help="Пересчитать счетчики работ по метаданным")
+
+    args = parser.parse_args()
+    return asyncio.run(run_command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
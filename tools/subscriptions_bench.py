@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Замер сопоставления работ с подписками на большом числе подписок
+
+Заполняет индекс синтетическими подписками (популярность тегов убывает по
+закону Ципфа, как в реальных фандомах), затем сопоставляет синтетические
+работы и ставит их в личные очереди. Для сравнения замеряется и перебор всех
+подписок, которым пришлось бы сопоставлять работы без обратного индекса.
+Пример:
+    uv run python -m tools.subscriptions_bench --subscriptions 100000
+    uv run python -m tools.subscriptions_bench --sizes 1000,10000,100000
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from typing import Dict, List
+
+from tools.perf import StageTimer, format_stage_table
+from tools.state import _connector
+from utils.subscriptions import KINDS, TAG_KEY, SubscriptionIndex, normalize_tag
+
+TAGS_PER_KIND = 5000
+
+
+def tag_pool() -> Dict[str, List[str]]:
+    """Синтетические теги каждого вида"""
+    return {
+        kind: [f"{kind.title()} Tag {index}" for index in range(TAGS_PER_KIND)]
+        for kind in KINDS
+    }
+
+
+# Накопленные веса тегов по закону Ципфа: вес тега с номером r - 1 / r
+ZIPF_WEIGHTS = list(
+    itertools.accumulate(1 / rank for rank in range(1, TAGS_PER_KIND + 1))
+)
+
+
+def zipf_choice(rng: random.Random, items: List[str]) -> str:
+    """Тег с вероятностью, обратной его номеру (популярные встречаются чаще)"""
+    return rng.choices(items, cum_weights=ZIPF_WEIGHTS)[0]
+
+
+def synthetic_work(rng: random.Random, tags: Dict[str, List[str]]) -> Dict:
+    """Метаданные работы: 1-2 фандома, 1-3 пейринга, 2-6 персонажей"""
+    counts = {"fandom": rng.randint(1, 2), "relationship": rng.randint(1, 3)}
+    counts["character"] = rng.randint(2, 6)
+    return {
+        KINDS[kind]: ", ".join({zipf_choice(rng, tags[kind]) for _ in range(count)})
+        for kind, count in counts.items()
+    }
+
+
+async def fill_index(
+    index: SubscriptionIndex, size: int, tags: Dict[str, List[str]], seed: int
+) -> List[tuple]:
+    """Заполняет индекс подписками (по 5 на пользователя), возвращает их список"""
+    rng = random.Random(seed)
+    subscriptions = []
+    redis = index.redis.redis
+    kinds = list(KINDS)
+    batch = []
+    for number in range(size):
+        user_id = str(1_000_000 + number // 5)
+        kind = rng.choice(kinds)
+        subscriptions.append(
+            (user_id, kind, normalize_tag(zipf_choice(rng, tags[kind])))
+        )
+        batch.append(subscriptions[-1])
+        if len(batch) >= 1000 or number == size - 1:
+            async with redis.pipeline(transaction=False) as pipe:
+                for user, kind_, tag in batch:
+                    pipe.sadd(TAG_KEY.format(kind=kind_, tag=tag), user)
+                    pipe.hset(f"subs:user:{user}", f"{kind_}:{tag}", tag)
+                await pipe.execute()
+            batch = []
+    return subscriptions
+
+
+def scan_match(subscriptions: List[tuple], metadata: Dict) -> set:
+    """Сопоставление перебором всех подписок (для сравнения)"""
+    work = {
+        kind: {normalize_tag(tag) for tag in (metadata.get(field) or "").split(",")}
+        for kind, field in KINDS.items()
+    }
+    return {user for user, kind, tag in subscriptions if tag in work[kind]}
+
+
+async def run_bench(
+    size: int, works: int, redis_url: str = None, seed: int = 1
+) -> Dict[str, Dict[str, float]]:
+    """Замеряет сопоставление и постановку в очереди для одного размера индекса"""
+    connector = _connector(redis_url)
+    await connector._ensure_connected()
+    index = SubscriptionIndex(connector)
+    tags = tag_pool()
+    timer = StageTimer()
+    try:
+        subscriptions = await fill_index(index, size, tags, seed)
+        rng = random.Random(seed + 1)
+        matched = 0
+        for number in range(works):
+            metadata = synthetic_work(rng, tags)
+
+            start = time.perf_counter()
+            users = await index.match(metadata)
+            timer.record("match", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await index.fan_out(str(number), metadata)
+            timer.record("fan_out", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = scan_match(subscriptions, metadata)
+            timer.record("scan_match", time.perf_counter() - start)
+            if users != expected:
+                raise SystemExit(f"Расхождение индекса и перебора на работе {number}")
+            matched += len(users)
+        print(f"\nПодписок: {size}, работ: {works}, совпадений: {matched}")
+        summary = timer.summary()
+        print(format_stage_table(summary))
+        return summary
+    finally:
+        await connector.disconnect()
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(
+        description="Сопоставление работ с подписками: индекс против перебора"
+    )
+    parser.add_argument("--subscriptions", type=int, default=100000)
+    parser.add_argument(
+        "--sizes", default=None, help="Несколько размеров индекса через запятую"
+    )
+    parser.add_argument("--works", type=int, default=200, help="Работ на размер")
+    parser.add_argument(
+        "--redis-url", default=None, help="URL Redis (по умолчанию fakeredis)"
+    )
+    args = parser.parse_args()
+
+    sizes = (
+        [int(size) for size in args.sizes.split(",")]
+        if args.sizes
+        else [args.subscriptions]
+    )
+    for size in sizes:
+        asyncio.run(run_bench(size, args.works, args.redis_url))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Отчет по трассам из JSONL файла (TRACING_EXPORTER=file)
+
+Показывает перцентили длительности каждой стадии и сквозные задержки
+"обновление в AO3 -> отправка" и "постановка в очередь -> отправка".
+Пример:
+    uv run python -m tools.trace_report traces.jsonl
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from tools.perf import format_stage_table, percentile
+
+
+def load_spans(path: str) -> List[Dict]:
+    """Читает спаны из JSONL файла"""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def build_report(spans: List[Dict]) -> Dict:
+    """Считает перцентили по стадиям и сквозные задержки"""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    end_to_end: Dict[str, List[float]] = defaultdict(list)
+
+    for span in spans:
+        durations[span["name"]].append(span["duration_ms"] / 1000)
+        attributes = span.get("attributes", {})
+        for key in ("feed_to_post_seconds", "enqueue_to_post_seconds"):
+            if key in attributes:
+                end_to_end[key].append(float(attributes[key]))
+
+    stages = {}
+    for name, values in durations.items():
+        stages[name] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+
+    latency = {}
+    for key, values in end_to_end.items():
+        latency[key] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values),
+        }
+
+    return {"spans": len(spans), "stages": stages, "end_to_end": latency}
+
+
+def main():
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Отчет по трассам обработки работ")
+    parser.add_argument("trace_file", help="JSONL файл со спанами")
+    parser.add_argument("--json", default=None, help="Сохранить отчет в JSON файл")
+    args = parser.parse_args()
+
+    report = build_report(load_spans(args.trace_file))
+
+    print(f"Спанов: {report['spans']}")
+    print()
+    print(format_stage_table(report["stages"]))
+    print()
+    for key, stats in report["end_to_end"].items():
+        print(
+            f"{key}: n={stats['count']} p50={stats['p50']:.1f}s "
+            f"p90={stats['p90']:.1f}s p99={stats['p99']:.1f}s max={stats['max']:.1f}s"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
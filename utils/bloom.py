@@ -0,0 +1,146 @@
+"""
+Фильтр Блума для множеств строковых идентификаторов
+
+Раскладка битов совпадает с битовыми строками Redis (бит 0 - старший бит
+первого байта), поэтому фильтр можно хранить в ключе Redis, дописывать
+SETBIT и объединять BITOP OR без преобразований.
+"""
+
+import hashlib
+import math
+import os
+import struct
+from typing import Iterable, List, Tuple
+
+# Заголовок файла: сигнатура, число бит, число хеш-функций
+_FILE_MAGIC = b"BLM1"
+_FILE_HEADER = struct.Struct(">4sQI")
+
+
+def optimal_size(capacity: int, error_rate: float) -> Tuple[int, int]:
+    """
+    Рассчитывает размер фильтра
+
+    Args:
+        capacity: Ожидаемое количество элементов
+        error_rate: Допустимая доля ложноположительных ответов
+
+    Returns:
+        (число бит, число хеш-функций)
+    """
+    capacity = max(1, capacity)
+    error_rate = min(max(error_rate, 1e-9), 0.5)
+    bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+    # Округляем до целого байта
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: отрицательный ответ точен, положительный - с вероятностью
+    ошибки error_rate при заполнении до capacity элементов
+
+    Удалять элементы нельзя; фильтр с удаленными элементами перестраивают.
+    """
+
+    def __init__(self, bits: int, hashes: int, data: bytes = b""):
+        self.bits = bits
+        self.hashes = hashes
+        size = (bits + 7) // 8
+        # Битовая строка Redis не хранит хвост из нулевых байт - дополняем
+        self.data = bytearray(data[:size].ljust(size, b"\x00"))
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Создает пустой фильтр под заданные емкость и долю ошибок"""
+        bits, hashes = optimal_size(capacity, error_rate)
+        return cls(bits, hashes)
+
+    def positions(self, item: str) -> List[int]:
+        """Номера бит элемента (двойное хеширование Кирша-Митценмахера)"""
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        # Нечетный шаг, чтобы позиции не повторялись при четном числе бит
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, item: str):
+        """Добавляет элемент"""
+        for position in self.positions(item):
+            self.data[position >> 3] |= 0x80 >> (position & 7)
+
+    def update(self, items: Iterable[str]):
+        """Добавляет несколько элементов"""
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.data[position >> 3] & (0x80 >> (position & 7))
+            for position in self.positions(item)
+        )
+
+    def compatible(self, other: "BloomFilter") -> bool:
+        """Можно ли объединять фильтры (одинаковые размер и хеш-функции)"""
+        return self.bits == other.bits and self.hashes == other.hashes
+
+    def merge(self, other) -> "BloomFilter":
+        """
+        Объединяет с другим фильтром того же размера (побитовое ИЛИ)
+
+        Args:
+            other: BloomFilter или сырая битовая строка (например, из Redis)
+        """
+        if isinstance(other, BloomFilter):
+            if not self.compatible(other):
+                raise ValueError(
+                    f"Несовместимые фильтры: {self.bits}/{self.hashes} "
+                    f"и {other.bits}/{other.hashes}"
+                )
+            other = other.data
+        size = min(len(self.data), len(other))
+        merged = int.from_bytes(self.data[:size], "big") | int.from_bytes(
+            bytes(other[:size]), "big"
+        )
+        self.data[:size] = merged.to_bytes(size, "big")
+        return self
+
+    def fill_ratio(self) -> float:
+        """Доля установленных бит (при ~0.5 фильтр заполнен до емкости)"""
+        set_bits = int.from_bytes(self.data, "big").bit_count()
+        return set_bits / self.bits if self.bits else 0.0
+
+    def to_bytes(self) -> bytes:
+        """Битовая строка без заголовка"""
+        return bytes(self.data)
+
+    def save(self, path: str):
+        """Атомарно записывает фильтр в файл"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_FILE_HEADER.pack(_FILE_MAGIC, self.bits, self.hashes))
+            f.write(self.data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        """
+        Читает фильтр из файла
+
+        Raises:
+            OSError: Файл не прочитан
+            ValueError: Файл не является фильтром
+        """
+        with open(path, "rb") as f:
+            header = f.read(_FILE_HEADER.size)
+            if len(header) != _FILE_HEADER.size:
+                raise ValueError(f"Файл {path} не является фильтром Блума")
+            magic, bits, hashes = _FILE_HEADER.unpack(header)
+            if magic != _FILE_MAGIC:
+                raise ValueError(f"Файл {path} не является фильтром Блума")
+            return cls(bits, hashes, f.read())
@@ -0,0 +1,218 @@
+"""
+Неблокирующее логирование: записи уходят в очередь, а форматирование и запись
+в stdout/файл выполняет фоновый поток QueueListener.
+Поддерживает сэмплирование частых INFO/DEBUG сообщений и вывод в JSON.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from config import Config
+from utils.metrics import metrics
+
+LOG_RECORDS_SAMPLED = metrics.counter(
+    "log_records_sampled_total", "Записи лога, отброшенные сэмплированием", ("logger",)
+)
+LOG_RECORDS_DROPPED = metrics.counter(
+    "log_records_dropped_total", "Записи лога, отброшенные из-за переполнения очереди"
+)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    Разбирает настройку сэмплирования вида "rss_parser=0.1,telegram_bot.bot=0.25"
+
+    Ключ - имя логгера (или его префикс), значение - доля сохраняемых записей.
+    """
+    rates: Dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей каждого семейства сообщений
+
+    Семейство - пара (логгер, шаблон сообщения до подстановки аргументов),
+    поэтому "Новая работа %s" сэмплируется независимо от "Обновляем work %s".
+    Отбор детерминированный: при доле 0.1 проходит каждая десятая запись.
+    WARNING и выше не сэмплируются никогда. Сообщение, собранное f-строкой,
+    образует новое семейство на каждое значение, поэтому счетчики
+    сбрасываются, когда семейств становится больше max_families.
+    """
+
+    def __init__(self, rates: Dict[str, float], max_families: int = 10000):
+        super().__init__()
+        self.rates = rates
+        self.max_families = max_families
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._rate_cache: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, logger_name: str) -> float:
+        rate = self._rate_cache.get(logger_name)
+        if rate is None:
+            rate = 1.0
+            # Самый длинный подходящий префикс имени логгера
+            best = -1
+            for name, value in self.rates.items():
+                if (logger_name == name or logger_name.startswith(name + ".")) and len(
+                    name
+                ) > best:
+                    best = len(name)
+                    rate = value
+            self._rate_cache[logger_name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self._rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            LOG_RECORDS_SAMPLED.inc(logger=record.name)
+            return False
+
+        family = (record.name, str(record.msg))
+        with self._lock:
+            if len(self._counters) >= self.max_families:
+                self._counters.clear()
+            seen = self._counters.get(family, 0)
+            self._counters[family] = seen + 1
+        # Первая запись семейства всегда проходит, дальше - каждая 1/rate
+        if seen % max(1, round(1 / rate)) == 0:
+            return True
+        LOG_RECORDS_SAMPLED.inc(logger=record.name)
+        return False
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный prepare() собирает итоговую строку до постановки в очередь.
+    Здесь сообщение и аргументы передаются как есть, а подстановку выполняет
+    форматтер в потоке QueueListener. В вызывающем потоке рендерится только
+    traceback: объекты исключения нельзя безопасно отдавать в другой поток.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                # Ошибки не теряем: ждем, пока фоновый поток разгрузит очередь
+                self.queue.put(record)
+            else:
+                LOG_RECORDS_DROPPED.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    level: str = Config.LOG_LEVEL,
+    log_file: Optional[str] = None,
+    log_format: str = Config.LOG_FORMAT,
+    sampling: str = Config.LOG_SAMPLING,
+    queue_size: int = 10000,
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер на запись через фоновый поток
+
+    Args:
+        level: Уровень логирования
+        log_file: Дополнительный файл для записи логов
+        log_format: "text" или "json"
+        sampling: Доли сэмплирования INFO/DEBUG по логгерам (см. parse_sampling)
+        queue_size: Размер очереди записей
+
+    Returns:
+        Запущенный QueueListener (останавливается автоматически при выходе)
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    if log_format == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    record_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(record_queue)
+    rates = parse_sampling(sampling)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(
+        record_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
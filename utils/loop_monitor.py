@@ -0,0 +1,116 @@
+"""
+Мониторинг задержки event loop: находит синхронные вызовы, блокирующие asyncio
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds",
+    "Задержка планирования event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_STALLS = metrics.counter(
+    "event_loop_stalls_total", "Блокировки event loop дольше порога"
+)
+
+
+class LoopLagMonitor:
+    """
+    Замер задержки event loop с сохранением стека при блокировке
+
+    Задача в loop просыпается каждые interval секунд и пишет фактическую задержку
+    в гистограмму. Фоновый поток следит за последним пробуждением: если loop
+    молчит дольше порога, он снимает стек потока loop в момент блокировки.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.2):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id = 0
+        self._last_tick = 0.0
+        self._stall_reported = False
+
+    async def start(self):
+        """Запускает замер в текущем event loop"""
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop_event.clear()
+
+        self.task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            f"Мониторинг event loop запущен: интервал {self.interval * 1000:.0f} мс, "
+            f"порог {self.threshold * 1000:.0f} мс"
+        )
+
+    async def stop(self):
+        """Останавливает замер"""
+        self._stop_event.set()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self):
+        while True:
+            expected = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - expected)
+            self._last_tick = time.monotonic()
+            self._stall_reported = False
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logger.warning(f"Задержка event loop {lag * 1000:.0f} мс")
+
+    def _watch(self):
+        check_every = min(self.threshold / 2, 0.1)
+        while not self._stop_event.wait(check_every):
+            silent_for = time.monotonic() - self._last_tick
+            if silent_for < self.interval + self.threshold or self._stall_reported:
+                continue
+
+            # Loop не просыпался дольше порога - он занят синхронным кодом
+            self._stall_reported = True
+            LOOP_STALLS.inc()
+            self._report_stall(silent_for - self.interval)
+
+    def _report_stall(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "нет данных"
+
+        task_name = "нет"
+        try:
+            task = asyncio.current_task(self.loop)
+            if task is not None:
+                task_name = task.get_name()
+        except RuntimeError:
+            pass
+
+        logger.warning(
+            f"Event loop заблокирован более {blocked_for * 1000:.0f} мс, "
+            f"задача: {task_name}\n{stack}"
+        )
@@ -0,0 +1,167 @@
+"""
+Профилирование циклов по запросу: cProfile + сэмплирование стеков в формате
+collapsed stacks (совместим с flamegraph.pl, speedscope, inferno)
+"""
+
+import cProfile
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class _StackSampler:
+    """Фоновый поток, снимающий стек заданного потока с фиксированным интервалом"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class CycleProfiler:
+    """
+    Профилирует следующие N циклов указанных компонентов
+
+    Пока профилировщик не взведен, profile() возвращает пустой контекст:
+    стоимость - одна проверка словаря на цикл.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "profiles",
+        keep: int = 20,
+        sample_interval: float = 0.005,
+    ):
+        self.output_dir = output_dir
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self._remaining: Dict[str, int] = {}
+        self._active = False
+
+    def arm(self, cycles: int, targets=("parser", "bot")):
+        """Взводит профилирование следующих cycles циклов для каждого компонента"""
+        for target in targets:
+            self._remaining[target] = cycles
+        logger.info(
+            f"Профилирование взведено: {cycles} циклов для {', '.join(targets)}"
+        )
+
+    def is_armed(self, target: str) -> bool:
+        return self._remaining.get(target, 0) > 0
+
+    def profile(self, target: str):
+        """Асинхронный контекстный менеджер вокруг одного цикла компонента"""
+        # Один cProfile на поток: пересекающиеся циклы не профилируем
+        if not self._remaining.get(target) or self._active:
+            return _NOOP_CONTEXT
+        return self._profile(target)
+
+    @asynccontextmanager
+    async def _profile(self, target: str):
+        self._active = True
+        self._remaining[target] -= 1
+
+        profile = cProfile.Profile()
+        sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+        started = time.perf_counter()
+
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            self._active = False
+            self._dump(target, profile, sampler, time.perf_counter() - started)
+
+    def _dump(
+        self,
+        target: str,
+        profile: cProfile.Profile,
+        sampler: _StackSampler,
+        duration: float,
+    ):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = (
+                time.strftime("%Y%m%d-%H%M%S")
+                + f"-{int(time.time() * 1000) % 1000:03d}"
+            )
+            base = os.path.join(self.output_dir, f"{target}-{stamp}")
+
+            profile.dump_stats(f"{base}.pstats")
+            with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            logger.info(
+                f"Профиль цикла {target} ({duration:.2f} с) сохранен в {base}.pstats "
+                f"и {base}.collapsed"
+            )
+            self._rotate(target)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения профиля {target}: {e}")
+
+    def _rotate(self, target: str):
+        """Оставляет только keep последних профилей компонента"""
+        for extension in ("pstats", "collapsed"):
+            files = sorted(
+                glob.glob(os.path.join(self.output_dir, f"{target}-*.{extension}"))
+            )
+            for old_file in files[: -self.keep] if self.keep > 0 else []:
+                try:
+                    os.remove(old_file)
+                except OSError:
+                    pass
+
+
+class _NoopAsyncContext:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_CONTEXT = _NoopAsyncContext()
+
+
+# Глобальный профилировщик циклов приложения
+cycle_profiler = CycleProfiler(
+    Config.PROFILE_DIR,
+    keep=Config.PROFILE_KEEP,
+    sample_interval=Config.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+)
@@ -1,26 +1,94 @@
+import functools
+import json
 import logging
-from datetime import datetime
+import os
+import socket
+import time
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 import redis.asyncio as aioredis
 from redis.asyncio import Redis
 
 from config import Config
+from utils.metrics import metrics
+from utils.search_text import document_facets, document_terms, document_words
 
 logger = logging.getLogger(__name__)
 
+REDIS_COMMANDS = metrics.counter(
+    "redis_commands_total", "Количество команд Redis", ["command"]
+)
+REDIS_COMMAND_SECONDS = metrics.histogram(
+    "redis_command_duration_seconds",
+    "Длительность команд и pipeline Redis",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+QUEUE_KEY = "queue:new_fanfics"
+QUEUE_STREAM_KEY = "queue:stream"
+QUEUE_STREAM_GROUP = "bot"
+QUEUE_META_KEY = "queue:meta"
+QUEUE_DEFERRED_KEY = "queue:deferred"
+# Маркер queue:meta моложе этого возраста (секунды) без элемента списка не
+# считается потерянным: другая реплика могла еще не выполнить LPUSH
+QUEUE_MARKER_GRACE_SECONDS = 60
+FEED_WATERMARK_KEY = "feed:watermark"
+SEND_BUDGET_KEY = "bot:send_budget"
+# Индекс id всех работ с метаданными (множество)
+FANFIC_IDS_KEY = "fanfic:ids"
+# Время полного заполнения fanfic:ids по ключам метаданных (rebuild_fanfic_index):
+# без этой отметки индекс может содержать только работы, сохраненные после
+# его появления
+FANFIC_IDS_COMPLETE_KEY = "fanfic:ids:complete"
+# Журнал изменений метаданных работы (список JSON, новые в начале)
+FANFIC_CHANGES_KEY = "fanfic:changes:{work_id}"
+# Битовая строка фильтра Блума известных работ (rss_parser.known_works)
+KNOWN_WORKS_BLOOM_KEY = "fanfic:bloom"
+# Счетчики статистики, обновляются при записи:
+# число работ по значению поля (хеш значение -> работ)
+STATS_WORKS_KEY = "stats:works:{dimension}"
+# события за день: updates:<причина> и sent (хеш, живет STATS_RETENTION_DAYS)
+STATS_DAILY_KEY = "stats:daily:{day}"
+# последний снимок get_stats (JSON) для частого опроса дашбордами
+STATS_SNAPSHOT_KEY = "stats:snapshot"
+# Поля метаданных, по которым считаются работы
+STATS_DIMENSIONS = ("fandom", "rating", "language")
+# Поисковый индекс (utils.search), обновляется при записи, если SEARCH_ENABLED:
+# работы с термом и весом совпадения (sorted set work_id -> вес)
+SEARCH_TERM_KEY = "search:term:{term}"
+# работы со значением фильтра (множество) и известные значения фильтра
+SEARCH_FACET_KEY = "search:facet:{field}:{value}"
+SEARCH_FACET_VALUES_KEY = "search:facets:{field}"
+# количество слов работ (sorted set work_id -> слов) для фильтра по объему
+SEARCH_WORDS_KEY = "search:words"
+
 
 class RedisConnector:
     """Класс для работы с Redis для RSS бота"""
 
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379/0",
+        queue_transport: Optional[str] = None,
+    ):
         self.redis_url = redis_url
         self.redis: Optional[Redis] = None
+        # Транспорт очереди отправки: list (queue:new_fanfics) или stream (queue:stream)
+        self.queue_transport = queue_transport or Config.QUEUE_TRANSPORT
+        self.consumer_name = (
+            Config.BOT_CONSUMER_NAME or f"{socket.gethostname()}-{os.getpid()}"
+        )
+        self._stream_group_ready = False
 
     async def connect(self):
         """Подключение к Redis"""
         try:
-            self.redis = aioredis.from_url(self.redis_url)
+            # Переиспользуем существующий клиент, чтобы не плодить пулы соединений
+            if self.redis is None:
+                self.redis = self._instrument(aioredis.from_url(self.redis_url))
             # Проверяем соединение
             await self.redis.ping()
             logger.info("Подключение к Redis установлено")
@@ -32,21 +100,75 @@ class RedisConnector:
         """Отключение от Redis"""
         if self.redis:
             await self.redis.close()
+            self.redis = None
             logger.info("Отключение от Redis")
 
+    @staticmethod
+    def _instrument(client: Redis) -> Redis:
+        """Оборачивает клиент для сбора количества и длительности команд"""
+        original_execute = client.execute_command
+        original_pipeline = client.pipeline
+
+        @functools.wraps(original_execute)
+        async def execute_command(*args, **kwargs):
+            command = str(args[0]).upper() if args else "UNKNOWN"
+            start = time.perf_counter()
+            try:
+                return await original_execute(*args, **kwargs)
+            finally:
+                REDIS_COMMANDS.inc(command=command)
+                REDIS_COMMAND_SECONDS.observe(
+                    time.perf_counter() - start, command=command
+                )
+
+        @functools.wraps(original_pipeline)
+        def pipeline(*args, **kwargs):
+            pipe = original_pipeline(*args, **kwargs)
+            original_pipe_execute = pipe.execute
+
+            async def pipe_execute(*p_args, **p_kwargs):
+                for command_args, _ in pipe.command_stack:
+                    REDIS_COMMANDS.inc(command=str(command_args[0]).upper())
+                start = time.perf_counter()
+                try:
+                    return await original_pipe_execute(*p_args, **p_kwargs)
+                finally:
+                    REDIS_COMMAND_SECONDS.observe(
+                        time.perf_counter() - start, command="PIPELINE"
+                    )
+
+            pipe.execute = pipe_execute
+            return pipe
+
+        client.execute_command = execute_command
+        client.pipeline = pipeline
+        return client
+
     async def _ensure_connected(self):
         """Проверяет, что соединение с Redis установлено"""
         if not self.redis:
             await self.connect()
 
     # Методы для работы с fanfic:metadata:{work_id}
-    async def save_fanfic_metadata(self, work_id: str, metadata: Dict) -> bool:
+    async def save_fanfic_metadata(
+        self,
+        work_id: str,
+        metadata: Dict,
+        bloom_bits: Optional[List[int]] = None,
+        change: Optional[Dict] = None,
+        previous: Optional[Dict] = None,
+    ) -> bool:
         """
         Сохраняет метаданные фанфика
 
         Args:
             work_id: ID работы
             metadata: Словарь с метаданными (title, author, summary, updated_at, chapters, words и т.д.)
+            bloom_bits: Биты работы в фильтре известных работ - выставляются
+                тем же pipeline
+            change: Запись журнала изменений - добавляется тем же pipeline
+            previous: Сохраненные ранее метаданные (None - работа новая) -
+                для счетчиков статистики и поискового индекса
         """
         try:
             await self._ensure_connected()
@@ -56,14 +178,174 @@ class RedisConnector:
             if "updated_at" not in metadata:
                 metadata["updated_at"] = datetime.now().strftime("%Y-%m-%d")
 
-            # Сохраняем как Hash
-            await self.redis.hset(key, mapping=metadata)
-            logger.debug(f"Сохранены метаданные для work_id: {work_id}")
+            # Сохраняем как Hash и отмечаем работу в индексе id
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping=metadata)
+                pipe.sadd(FANFIC_IDS_KEY, work_id)
+                for position in bloom_bits or ():
+                    pipe.setbit(KNOWN_WORKS_BLOOM_KEY, position, 1)
+                self._log_change(pipe, work_id, change)
+                self._count_work(pipe, previous, metadata)
+                self._count_update(pipe, change)
+                if Config.SEARCH_ENABLED:
+                    self._index_work(pipe, work_id, previous, metadata)
+                await pipe.execute()
+            logger.debug("Сохранены метаданные для work_id: %s", work_id)
             return True
         except Exception as e:
             logger.error(f"Ошибка сохранения метаданных для {work_id}: {e}")
             return False
 
+    async def update_fanfic_fields(self, updates: Dict[str, Dict]) -> bool:
+        """
+        Обновляет отдельные поля метаданных нескольких работ одним pipeline
+
+        Args:
+            updates: {work_id: {поле: значение}}
+        """
+        if not updates:
+            return True
+        try:
+            await self._ensure_connected()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for work_id, fields in updates.items():
+                    pipe.hset(f"fanfic:metadata:{work_id}", mapping=fields)
+                await pipe.execute()
+            logger.debug("Обновлены поля метаданных %s работ", len(updates))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления полей метаданных: {e}")
+            return False
+
+    async def update_fanfic_metadata(
+        self,
+        work_id: str,
+        fields: Dict,
+        change: Optional[Dict] = None,
+        previous: Optional[Dict] = None,
+    ) -> bool:
+        """
+        Записывает изменившиеся поля метаданных работы
+
+        В отличие от save_fanfic_metadata не трогает остальные поля
+        и не подставляет updated_at.
+
+        Args:
+            work_id: ID работы
+            fields: {поле: новое значение}
+            change: Запись журнала изменений - добавляется тем же pipeline
+            previous: Сохраненные ранее метаданные - для счетчиков статистики
+                и поискового индекса (None - счетчики работ и индекс не трогать)
+        """
+        if not fields:
+            return True
+        try:
+            await self._ensure_connected()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(f"fanfic:metadata:{work_id}", mapping=fields)
+                self._log_change(pipe, work_id, change)
+                if previous is not None:
+                    self._count_work(pipe, previous, fields)
+                    if Config.SEARCH_ENABLED:
+                        self._index_work(pipe, work_id, previous, fields)
+                self._count_update(pipe, change)
+                await pipe.execute()
+            logger.debug(
+                "Обновлены поля %s для work_id: %s", ", ".join(fields), work_id
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления метаданных для {work_id}: {e}")
+            return False
+
+    @staticmethod
+    def _log_change(pipe, work_id: str, change: Optional[Dict]):
+        """Добавляет запись в журнал изменений работы и обрезает журнал"""
+        if not change or Config.CHANGE_LOG_SIZE <= 0:
+            return
+        key = FANFIC_CHANGES_KEY.format(work_id=work_id)
+        pipe.lpush(key, json.dumps(change, ensure_ascii=False))
+        pipe.ltrim(key, 0, Config.CHANGE_LOG_SIZE - 1)
+
+    @staticmethod
+    def _count_work(pipe, previous: Optional[Dict], fields: Dict):
+        """
+        Переносит работу между значениями полей в счетчиках stats:works:*
+
+        Поле с несколькими значениями (фандомы через запятую) учитывается
+        в каждом из них.
+        """
+        for dimension in STATS_DIMENSIONS:
+            old = (previous or {}).get(dimension)
+            new = fields.get(dimension, old)
+            if old == new:
+                continue
+            key = STATS_WORKS_KEY.format(dimension=dimension)
+            for value in _split_values(old):
+                pipe.hincrby(key, value, -1)
+            for value in _split_values(new):
+                pipe.hincrby(key, value, 1)
+
+    @staticmethod
+    def _count_daily(pipe, field: str):
+        """Увеличивает дневной счетчик события"""
+        key = STATS_DAILY_KEY.format(day=datetime.now().strftime("%Y-%m-%d"))
+        pipe.hincrby(key, field, 1)
+        pipe.expire(key, Config.STATS_RETENTION_DAYS * 86400)
+
+    def _count_update(self, pipe, change: Optional[Dict]):
+        """Считает обновление работы по главной причине из записи журнала"""
+        if change and change.get("reasons"):
+            self._count_daily(pipe, f"updates:{change['reasons'][0]}")
+
+    @staticmethod
+    def _index_work(
+        pipe, work_id: str, previous: Optional[Dict], fields: Optional[Dict]
+    ):
+        """
+        Обновляет работу в поисковом индексе
+
+        Сравнивает термы, фильтры и объем до и после записи и меняет только
+        разницу. fields - записываемые поля (None - работа удаляется).
+        """
+        previous = previous or {}
+        current = {**previous, **fields} if fields is not None else {}
+
+        old_terms = document_terms(previous)
+        new_terms = document_terms(current)
+        for term in old_terms.keys() - new_terms.keys():
+            pipe.zrem(SEARCH_TERM_KEY.format(term=term), work_id)
+        for term, weight in new_terms.items():
+            if old_terms.get(term) != weight:
+                pipe.zadd(SEARCH_TERM_KEY.format(term=term), {work_id: weight})
+
+        old_facets = document_facets(previous)
+        for field, values in document_facets(current).items():
+            for value in set(old_facets[field]) - set(values):
+                pipe.srem(SEARCH_FACET_KEY.format(field=field, value=value), work_id)
+            for value in set(values) - set(old_facets[field]):
+                pipe.sadd(SEARCH_FACET_KEY.format(field=field, value=value), work_id)
+                pipe.sadd(SEARCH_FACET_VALUES_KEY.format(field=field), value)
+
+        words = document_words(current)
+        if words is None:
+            if document_words(previous) is not None:
+                pipe.zrem(SEARCH_WORDS_KEY, work_id)
+        elif words != document_words(previous):
+            pipe.zadd(SEARCH_WORDS_KEY, {work_id: words})
+
+    async def get_fanfic_changes(self, work_id: str, limit: int = 20) -> List[Dict]:
+        """Последние записи журнала изменений работы (новые первыми)"""
+        try:
+            await self._ensure_connected()
+            raw = await self.redis.lrange(
+                FANFIC_CHANGES_KEY.format(work_id=work_id), 0, limit - 1
+            )
+            return [json.loads(item) for item in raw]
+        except Exception as e:
+            logger.error(f"Ошибка получения журнала изменений для {work_id}: {e}")
+            return []
+
     async def get_fanfic_metadata(self, work_id: str) -> Optional[Dict]:
         """
         Получает метаданные фанфика
@@ -92,8 +374,23 @@ class RedisConnector:
         try:
             await self._ensure_connected()
             key = f"fanfic:metadata:{work_id}"
-            result = await self.redis.delete(key)
-            logger.debug(f"Удалены метаданные для work_id: {work_id}")
+            # Значения полей нужны, чтобы убрать работу из счетчиков и индекса
+            previous = await self.redis.hgetall(key)
+            previous = {k.decode(): v.decode() for k, v in previous.items()}
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(key)
+                pipe.srem(FANFIC_IDS_KEY, work_id)
+                pipe.delete(FANFIC_CHANGES_KEY.format(work_id=work_id))
+                if previous:
+                    self._count_work(
+                        pipe,
+                        previous,
+                        {dimension: None for dimension in STATS_DIMENSIONS},
+                    )
+                    if Config.SEARCH_ENABLED:
+                        self._index_work(pipe, work_id, previous, None)
+                result = (await pipe.execute())[0]
+            logger.debug("Удалены метаданные для work_id: %s", work_id)
             return bool(result)
         except Exception as e:
             logger.error(f"Ошибка удаления метаданных для {work_id}: {e}")
@@ -120,7 +417,10 @@ class RedisConnector:
 
             # Сохраняем как message_id:updated_at
             value = f"{message_id}:{updated_at}"
-            await self.redis.hset(key, work_id, value)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, work_id, value)
+                self._count_daily(pipe, "sent")
+                await pipe.execute()
             logger.debug(
                 f"Сохранена информация об отправленном сообщении для work_id: {work_id}"
             )
@@ -260,75 +560,455 @@ class RedisConnector:
             )
             return False
 
+    # Методы для работы с feed:watermark (отметка прошлой проверки ленты)
+    async def get_feed_watermark(self, feed: str) -> Dict:
+        """
+        Получает отметку ленты: {"updated": самая новая дата updated}
+
+        Args:
+            feed: Метка ленты (tag_id)
+        """
+        try:
+            await self._ensure_connected()
+            raw = await self.redis.hget(FEED_WATERMARK_KEY, feed)
+            return json.loads(raw) if raw else {}
+        except Exception as e:
+            logger.error(f"Ошибка получения отметки ленты {feed}: {e}")
+            return {}
+
+    async def save_feed_watermark(self, feed: str, watermark: Dict) -> bool:
+        """Сохраняет отметку ленты"""
+        try:
+            await self._ensure_connected()
+            await self.redis.hset(FEED_WATERMARK_KEY, feed, json.dumps(watermark))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения отметки ленты {feed}: {e}")
+            return False
+
     # Методы для работы с queue:new_fanfics
-    async def add_to_queue(self, work_id: str) -> bool:
+    async def add_to_queue(self, work_id: str, meta: Optional[Dict] = None) -> bool:
         """
         Добавляет work_id в очередь новых фанфиков
 
+        Работа, которая уже ждет в очереди, повторно не добавляется: запись в
+        queue:meta служит маркером, и из нескольких реплик парсера, одновременно
+        нашедших обновление, в очередь попадает только одна. Маркер без
+        элемента (добавление упало, процесс упал между записью маркера и
+        элемента, элемент потока срезан по maxlen) работу не блокирует.
+
         Args:
             work_id: ID работы для добавления в очередь
+            meta: Дополнительные данные элемента очереди (например, traceparent)
         """
         try:
             await self._ensure_connected()
-            key = "queue:new_fanfics"
-            await self.redis.lpush(key, work_id)
-            logger.debug(f"Добавлен в очередь: {work_id}")
+            # Время постановки в очередь - для возраста самого старого элемента
+            marker = {"enqueued_at": time.time(), **(meta or {})}
+            entry_meta = json.dumps(marker)
+            if not await self.redis.hsetnx(QUEUE_META_KEY, work_id, entry_meta):
+                if not await self._queue_marker_stale(work_id):
+                    logger.debug("Work %s уже в очереди", work_id)
+                    return True
+                logger.warning(f"Work {work_id}: маркер без элемента очереди, ставим")
+                await self.redis.hset(QUEUE_META_KEY, work_id, entry_meta)
+        except Exception as e:
+            logger.error(f"Ошибка добавления в очередь {work_id}: {e}")
+            return False
+
+        try:
+            if self.queue_transport == "stream":
+                # Данные элемента хранятся и в самом потоке: они нужны при
+                # повторной доставке зависшего элемента другому потребителю
+                entry_id = await self.redis.xadd(
+                    QUEUE_STREAM_KEY,
+                    {"work_id": work_id, "meta": entry_meta},
+                    maxlen=Config.QUEUE_STREAM_MAXLEN,
+                    approximate=True,
+                )
+                # По id элемента в маркере видно, что элемент срезан по maxlen
+                if isinstance(entry_id, bytes):
+                    entry_id = entry_id.decode()
+                marker["stream_id"] = entry_id
+                await self.redis.hset(QUEUE_META_KEY, work_id, json.dumps(marker))
+            else:
+                await self.redis.lpush(QUEUE_KEY, work_id)
+            logger.debug("Добавлен в очередь: %s", work_id)
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления в очередь {work_id}: {e}")
+            try:
+                # Маркер без элемента не дал бы поставить работу повторно
+                await self.redis.hdel(QUEUE_META_KEY, work_id)
+            except Exception as cleanup_error:
+                logger.error(
+                    f"Не удалось снять маркер очереди {work_id}: {cleanup_error}"
+                )
             return False
 
-    async def get_from_queue(self, timeout: int = 0) -> Optional[str]:
+    async def _queue_marker_stale(self, work_id: str) -> bool:
         """
-        Получает work_id из очереди
+        Маркер queue:meta остался без элемента очереди
+
+        Для stream в маркере хранится id элемента: если элемента в потоке нет
+        (срезан по maxlen), маркер устарел. Для list маркер старше
+        QUEUE_MARKER_GRACE_SECONDS устарел, если work_id нет в списке (LPOS):
+        так бывает, если процесс упал между HSETNX и LPUSH или между RPOP
+        и снятием маркера.
+        """
+        raw = await self.redis.hget(QUEUE_META_KEY, work_id)
+        try:
+            marker = json.loads(raw) if raw else {}
+        except ValueError:
+            return False
+        if self.queue_transport != "stream":
+            enqueued_at = float(marker.get("enqueued_at") or 0)
+            if time.time() - enqueued_at < QUEUE_MARKER_GRACE_SECONDS:
+                return False
+            return await self.redis.lpos(QUEUE_KEY, work_id) is None
+        stream_id = marker.get("stream_id")
+        if not stream_id:
+            # Элемент только что добавлен другой репликой
+            return False
+        return not await self.redis.xrange(
+            QUEUE_STREAM_KEY, stream_id, stream_id, count=1
+        )
+
+    async def pop_queue_entry(
+        self, timeout: int = 0, consumer: Optional[str] = None
+    ) -> Optional[Tuple[str, Dict]]:
+        """
+        Получает work_id из очереди вместе с данными элемента
+
+        В транспорте stream элемент остается в списке ожидающих подтверждения
+        (PEL) группы до вызова ack_queue_item.
 
         Args:
             timeout: Время ожидания в секундах (0 = не ждать)
+            consumer: Имя потребителя в группе (только для stream)
 
         Returns:
-            work_id или None если очередь пуста
+            Кортеж (work_id, meta) или None если очередь пуста
         """
         try:
             await self._ensure_connected()
-            key = "queue:new_fanfics"
+            if self.queue_transport == "stream":
+                return await self._with_stream_group(
+                    lambda: self._pop_stream_entry(
+                        timeout, consumer or self.consumer_name
+                    )
+                )
 
+            work_id = None
             if timeout > 0:
                 # Блокирующее получение
-                result = await self.redis.brpop(key, timeout=timeout)
+                result = await self.redis.brpop(QUEUE_KEY, timeout=timeout)
                 if result:
-                    return result[1].decode()
+                    work_id = result[1].decode()
             else:
                 # Неблокирующее получение
-                result = await self.redis.rpop(key)
+                result = await self.redis.rpop(QUEUE_KEY)
                 if result:
-                    return result.decode()
-            return None
+                    work_id = result.decode()
+
+            if not work_id:
+                return None
+
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hget(QUEUE_META_KEY, work_id)
+                pipe.hdel(QUEUE_META_KEY, work_id)
+                raw_meta, _ = await pipe.execute()
+
+            meta = {}
+            if raw_meta:
+                try:
+                    meta = json.loads(raw_meta)
+                except ValueError:
+                    logger.warning(f"Некорректные данные элемента очереди {work_id}")
+            return work_id, meta
         except Exception as e:
             logger.error(f"Ошибка получения из очереди: {e}")
             return None
 
+    async def _ensure_stream_group(self):
+        """Создает группу потребителей потока, если ее еще нет"""
+        if self._stream_group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(
+                QUEUE_STREAM_KEY, QUEUE_STREAM_GROUP, id="0", mkstream=True
+            )
+        except aioredis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._stream_group_ready = True
+
+    async def _with_stream_group(self, call):
+        """
+        Выполняет команду группы потребителей
+
+        Если поток удален (clear_queue в другом процессе, FLUSHDB), группа
+        пропадает вместе с ним: создаем ее заново и повторяем команду.
+        """
+        await self._ensure_stream_group()
+        try:
+            return await call()
+        except aioredis.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            logger.warning("Группа потока очереди пропала, создаем заново")
+            self._stream_group_ready = False
+            await self._ensure_stream_group()
+            return await call()
+
+    async def _pop_stream_entry(
+        self, timeout: int, consumer: str
+    ) -> Optional[Tuple[str, Dict]]:
+        """Забирает зависший элемент (XAUTOCLAIM) или новый (XREADGROUP)"""
+        # Сначала элементы, которые другой потребитель взял и не подтвердил
+        claimed = await self.redis.xautoclaim(
+            QUEUE_STREAM_KEY,
+            QUEUE_STREAM_GROUP,
+            consumer,
+            min_idle_time=Config.QUEUE_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=1,
+        )
+        entries = claimed[1] if claimed else []
+        if entries:
+            entry_id, fields = entries[0]
+            if await self._exceeds_deliveries(entry_id):
+                return None
+        else:
+            result = await self.redis.xreadgroup(
+                QUEUE_STREAM_GROUP,
+                consumer,
+                {QUEUE_STREAM_KEY: ">"},
+                count=1,
+                block=timeout * 1000 if timeout > 0 else None,
+            )
+            if not result or not result[0][1]:
+                return None
+            entry_id, fields = result[0][1][0]
+
+        entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        fields = {
+            (k.decode() if isinstance(k, bytes) else k): (
+                v.decode() if isinstance(v, bytes) else v
+            )
+            for k, v in fields.items()
+        }
+        work_id = fields.get("work_id", "")
+
+        # Маркер "уже в очереди" снимаем при выдаче, как и в транспорте list
+        await self.redis.hdel(QUEUE_META_KEY, work_id)
+
+        meta = {}
+        try:
+            meta = json.loads(fields.get("meta") or "{}")
+        except ValueError:
+            logger.warning(f"Некорректные данные элемента очереди {work_id}")
+        meta["stream_id"] = entry_id
+        return work_id, meta
+
+    async def _exceeds_deliveries(self, entry_id) -> bool:
+        """Удаляет элемент, который слишком много раз доставлялся без подтверждения"""
+        pending = await self.redis.xpending_range(
+            QUEUE_STREAM_KEY, QUEUE_STREAM_GROUP, entry_id, entry_id, 1
+        )
+        if not pending or pending[0]["times_delivered"] <= Config.QUEUE_MAX_DELIVERIES:
+            return False
+        logger.error(
+            f"Элемент очереди {entry_id!r} доставлялся "
+            f"{pending[0]['times_delivered']} раз без подтверждения, удаляем"
+        )
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(QUEUE_STREAM_KEY, QUEUE_STREAM_GROUP, entry_id)
+            pipe.xdel(QUEUE_STREAM_KEY, entry_id)
+            await pipe.execute()
+        return True
+
+    async def ack_queue_item(self, work_id: str, meta: Optional[Dict] = None) -> bool:
+        """
+        Подтверждает обработку элемента очереди
+
+        Для транспорта list ничего не делает: элемент удален уже при получении.
+        Для stream элемент убирается из PEL группы и из самого потока.
+        """
+        stream_id = (meta or {}).get("stream_id")
+        if self.queue_transport != "stream" or not stream_id:
+            return True
+        try:
+            await self._ensure_connected()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.xack(QUEUE_STREAM_KEY, QUEUE_STREAM_GROUP, stream_id)
+                pipe.xdel(QUEUE_STREAM_KEY, stream_id)
+                await pipe.execute()
+            logger.debug("Подтверждена обработка %s (%s)", work_id, stream_id)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка подтверждения элемента очереди {work_id}: {e}")
+            return False
+
+    async def get_pending_count(self) -> int:
+        """Возвращает число выданных, но не подтвержденных элементов (stream)"""
+        if self.queue_transport != "stream":
+            return 0
+        try:
+            await self._ensure_connected()
+            summary = await self._with_stream_group(
+                lambda: self.redis.xpending(QUEUE_STREAM_KEY, QUEUE_STREAM_GROUP)
+            )
+            return int(summary["pending"]) if summary else 0
+        except Exception as e:
+            logger.error(f"Ошибка получения числа неподтвержденных элементов: {e}")
+            return 0
+
+    async def acquire_send_slot(self, interval: float) -> float:
+        """
+        Общий для всех потребителей бюджет отправки: не чаще одного сообщения
+        в interval секунд
+
+        Returns:
+            0, если слот получен, иначе сколько секунд ждать следующего
+        """
+        try:
+            await self._ensure_connected()
+            if await self.redis.set(
+                SEND_BUDGET_KEY, self.consumer_name, nx=True, px=int(interval * 1000)
+            ):
+                return 0.0
+            remaining = await self.redis.pttl(SEND_BUDGET_KEY)
+            return max(remaining, 1) / 1000
+        except Exception as e:
+            logger.error(f"Ошибка получения слота отправки: {e}")
+            return interval
+
+    async def get_from_queue(self, timeout: int = 0) -> Optional[str]:
+        """
+        Получает work_id из очереди
+
+        Args:
+            timeout: Время ожидания в секундах (0 = не ждать)
+
+        Returns:
+            work_id или None если очередь пуста
+        """
+        entry = await self.pop_queue_entry(timeout)
+        return entry[0] if entry else None
+
     async def get_queue_length(self) -> int:
-        """Возвращает длину очереди"""
+        """Возвращает длину очереди (для stream - включая неподтвержденные)"""
         try:
             await self._ensure_connected()
-            key = "queue:new_fanfics"
-            return await self.redis.llen(key)
+            if self.queue_transport == "stream":
+                return await self.redis.xlen(QUEUE_STREAM_KEY)
+            return await self.redis.llen(QUEUE_KEY)
         except Exception as e:
             logger.error(f"Ошибка получения длины очереди: {e}")
             return 0
 
+    async def get_oldest_queue_age(self) -> float:
+        """Возвращает возраст самого старого элемента очереди в секундах"""
+        try:
+            await self._ensure_connected()
+            if self.queue_transport == "stream":
+                # ID элемента потока начинается с времени добавления в миллисекундах
+                oldest = await self.redis.xrange(QUEUE_STREAM_KEY, count=1)
+                if not oldest:
+                    return 0.0
+                entry_id = oldest[0][0]
+                if isinstance(entry_id, bytes):
+                    entry_id = entry_id.decode()
+                added_ms = int(entry_id.split("-")[0])
+                return max(0.0, time.time() - added_ms / 1000)
+
+            # Элементы добавляются LPUSH и забираются RPOP: самый старый - последний
+            oldest = await self.redis.lindex(QUEUE_KEY, -1)
+            if not oldest:
+                return 0.0
+            raw_meta = await self.redis.hget(QUEUE_META_KEY, oldest)
+            if not raw_meta:
+                return 0.0
+            enqueued_at = json.loads(raw_meta).get("enqueued_at", time.time())
+            return max(0.0, time.time() - float(enqueued_at))
+        except Exception as e:
+            logger.error(f"Ошибка получения возраста очереди: {e}")
+            return 0.0
+
     async def clear_queue(self) -> bool:
         """Очищает очередь"""
         try:
             await self._ensure_connected()
-            key = "queue:new_fanfics"
-            await self.redis.delete(key)
+            await self.redis.delete(QUEUE_KEY, QUEUE_STREAM_KEY, QUEUE_META_KEY)
+            self._stream_group_ready = False
             logger.debug("Очередь очищена")
             return True
         except Exception as e:
             logger.error(f"Ошибка очистки очереди: {e}")
             return False
 
+    # Методы для работы с queue:deferred (отложенные при backpressure работы)
+    async def defer_queue_item(self, work_id: str, meta: Optional[Dict] = None) -> bool:
+        """
+        Откладывает постановку работы в очередь до разгрузки отправителя
+
+        Хранится одна запись на работу, поэтому размер не растет при повторных
+        обновлениях одной и той же работы.
+        """
+        try:
+            await self._ensure_connected()
+            await self.redis.hset(QUEUE_DEFERRED_KEY, work_id, json.dumps(meta or {}))
+            logger.debug("Отложена постановка в очередь: %s", work_id)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка откладывания {work_id}: {e}")
+            return False
+
+    async def discard_deferred(self, work_id: str) -> bool:
+        """Убирает работу из отложенных (например, если она уже поставлена в очередь)"""
+        try:
+            await self._ensure_connected()
+            return bool(await self.redis.hdel(QUEUE_DEFERRED_KEY, work_id))
+        except Exception as e:
+            logger.error(f"Ошибка удаления отложенной работы {work_id}: {e}")
+            return False
+
+    async def get_deferred(self, limit: int = 100) -> List[Tuple[str, Dict]]:
+        """
+        Возвращает до limit отложенных работ, не удаляя их
+
+        Работа убирается из отложенных (discard_deferred) только после
+        постановки в очередь, чтобы сбой посередине порции ее не потерял.
+        """
+        try:
+            await self._ensure_connected()
+            _, items = await self.redis.hscan(QUEUE_DEFERRED_KEY, 0, count=limit)
+            items = list(items.items())[:limit]
+            if not items:
+                return []
+
+            result = []
+            for key, raw_meta in items:
+                try:
+                    meta = json.loads(raw_meta)
+                except ValueError:
+                    meta = {}
+                result.append((key.decode(), meta))
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка получения отложенных работ: {e}")
+            return []
+
+    async def get_deferred_count(self) -> int:
+        """Возвращает количество отложенных работ"""
+        try:
+            await self._ensure_connected()
+            return await self.redis.hlen(QUEUE_DEFERRED_KEY)
+        except Exception as e:
+            logger.error(f"Ошибка получения числа отложенных работ: {e}")
+            return 0
+
     # Вспомогательные методы
     async def get_all_fanfic_ids(self) -> List[str]:
         """Получает все work_id из метаданных"""
@@ -341,6 +1021,62 @@ class RedisConnector:
             logger.error(f"Ошибка получения всех work_id: {e}")
             return []
 
+    async def get_indexed_fanfic_ids(self) -> List[str]:
+        """Получает work_id из индекса fanfic:ids (SSCAN, без блокировки Redis)"""
+        try:
+            await self._ensure_connected()
+            return [
+                work_id.decode() if isinstance(work_id, bytes) else work_id
+                async for work_id in self.redis.sscan_iter(FANFIC_IDS_KEY, count=1000)
+            ]
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса work_id: {e}")
+            return []
+
+    async def rebuild_fanfic_index(self) -> List[str]:
+        """
+        Заполняет индекс fanfic:ids по ключам метаданных (SCAN)
+
+        Нужен для данных, сохраненных до появления индекса.
+
+        Returns:
+            Найденные work_id
+        """
+        await self._ensure_connected()
+        prefix = "fanfic:metadata:"
+        work_ids = []
+        batch = []
+        async for key in self.redis.scan_iter(match=f"{prefix}*", count=1000):
+            batch.append(key.decode()[len(prefix) :])
+            if len(batch) >= 1000:
+                await self.redis.sadd(FANFIC_IDS_KEY, *batch)
+                work_ids.extend(batch)
+                batch = []
+        if batch:
+            await self.redis.sadd(FANFIC_IDS_KEY, *batch)
+            work_ids.extend(batch)
+        # Работы, сохраненные во время прохода, добавляет сама запись
+        await self.redis.set(FANFIC_IDS_COMPLETE_KEY, int(time.time()))
+        logger.info(f"Индекс work_id перестроен: {len(work_ids)} работ")
+        return work_ids
+
+    async def ensure_fanfic_index(self) -> bool:
+        """
+        Заполняет fanfic:ids по ключам метаданных, если это еще не делалось
+
+        Запись метаданных добавляет в индекс только новые работы, поэтому
+        после обновления индекс не пуст, но неполон, пока не выполнен проход
+        rebuild_fanfic_index.
+
+        Returns:
+            True, если индекс пришлось заполнять
+        """
+        await self._ensure_connected()
+        if await self.redis.exists(FANFIC_IDS_COMPLETE_KEY):
+            return False
+        await self.rebuild_fanfic_index()
+        return True
+
     async def cleanup_old_data(self, days_old: int = 30) -> int:
         """
         Очищает старые данные
@@ -381,25 +1117,164 @@ class RedisConnector:
             logger.error(f"Ошибка очистки старых данных: {e}")
             return 0
 
-    async def get_stats(self) -> Dict:
-        """Возвращает статистику по Redis"""
+    async def get_stats(self, days: int = 7, top: int = 20) -> Dict:
+        """
+        Возвращает статистику по счетчикам, которые ведутся при записи
+
+        Один pipeline команд O(1) и небольших хешей - без обхода ключей
+        и чтения всех отправок, поэтому статистику можно запрашивать часто.
+        Только первый вызов на старых данных заполняет индекс fanfic:ids
+        (ensure_fanfic_index), по которому считаются работы.
+
+        Args:
+            days: За сколько последних дней вернуть обновления и отправки
+            top: Сколько самых частых значений вернуть по каждому полю
+                (0 - все)
+        """
         try:
-            await self._ensure_connected()
+            await self.ensure_fanfic_index()
+            today = datetime.now()
+            day_names = [
+                (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+                for offset in range(days)
+            ]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.scard(FANFIC_IDS_KEY)
+                pipe.hlen("channel:sent_messages")
+                for dimension in STATS_DIMENSIONS:
+                    pipe.hgetall(STATS_WORKS_KEY.format(dimension=dimension))
+                for day in day_names:
+                    pipe.hgetall(STATS_DAILY_KEY.format(day=day))
+                results = await pipe.execute()
+            fanfic_count, sent_count = results[0], results[1]
+            dimension_counts = results[2 : 2 + len(STATS_DIMENSIONS)]
+            daily_counts = results[2 + len(STATS_DIMENSIONS) :]
+
+            works = {}
+            for dimension, counts in zip(STATS_DIMENSIONS, dimension_counts):
+                values = sorted(
+                    (
+                        (value.decode(), int(count))
+                        for value, count in counts.items()
+                        if int(count) > 0
+                    ),
+                    key=lambda item: (-item[1], item[0]),
+                )
+                works[dimension] = dict(values[:top] if top else values)
 
-            fanfic_count = len(await self.get_all_fanfic_ids())
-            sent_messages = await self.get_all_sent_messages()
-            queue_length = await self.get_queue_length()
+            daily = {}
+            for day, counts in zip(day_names, daily_counts):
+                counts = {field.decode(): int(count) for field, count in counts.items()}
+                daily[day] = {
+                    "updates": {
+                        field.split(":", 1)[1]: count
+                        for field, count in counts.items()
+                        if field.startswith("updates:")
+                    },
+                    "sent": counts.get("sent", 0),
+                }
 
             return {
                 "fanfic_metadata_count": fanfic_count,
-                "sent_messages_count": len(sent_messages),
-                "queue_length": queue_length,
-                "redis_info": await self.redis.info(),
+                "sent_messages_count": sent_count,
+                "queue_length": await self.get_queue_length(),
+                "works": works,
+                "daily": daily,
+                "redis_info": await self._redis_info(),
             }
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
             return {}
 
+    async def _redis_info(self) -> Dict:
+        """INFO сервера Redis для get_stats ({} - если команда недоступна)"""
+        try:
+            return await self.redis.info()
+        except Exception as e:
+            logger.warning(f"INFO Redis недоступен: {e}")
+            return {}
+
+    async def save_stats_snapshot(self) -> Optional[Dict]:
+        """Сохраняет снимок get_stats в stats:snapshot и возвращает его"""
+        stats = await self.get_stats()
+        if not stats:
+            return None
+        stats["generated_at"] = int(time.time())
+        try:
+            await self.redis.set(
+                STATS_SNAPSHOT_KEY, json.dumps(stats, ensure_ascii=False)
+            )
+            return stats
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимка статистики: {e}")
+            return None
+
+    async def get_stats_snapshot(self) -> Optional[Dict]:
+        """Последний снимок статистики (одна команда GET)"""
+        try:
+            await self._ensure_connected()
+            raw = await self.redis.get(STATS_SNAPSHOT_KEY)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.error(f"Ошибка чтения снимка статистики: {e}")
+            return None
+
+    async def rebuild_stats(self, batch: int = 500) -> int:
+        """
+        Пересчитывает счетчики работ stats:works:* по сохраненным метаданным
+
+        Нужен для данных, сохраненных до появления счетчиков или загруженных
+        tools.state. Работы читаются по индексу fanfic:ids порциями (на старых
+        данных он сначала заполняется по ключам метаданных), новые
+        счетчики заменяют старые одной транзакцией. Дневные
+        счетчики обновлений и отправок задним числом не восстанавливаются.
+
+        Returns:
+            Количество учтенных работ
+        """
+        await self.ensure_fanfic_index()
+        counts = {dimension: {} for dimension in STATS_DIMENSIONS}
+        total = 0
+        work_ids = []
+
+        async def flush():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for work_id in work_ids:
+                    pipe.hmget(f"fanfic:metadata:{work_id}", *STATS_DIMENSIONS)
+                rows = await pipe.execute()
+            for row in rows:
+                for dimension, value in zip(STATS_DIMENSIONS, row):
+                    if value is None:
+                        continue
+                    for item in _split_values(value.decode()):
+                        counts[dimension][item] = counts[dimension].get(item, 0) + 1
+            work_ids.clear()
+
+        async for work_id in self.redis.sscan_iter(FANFIC_IDS_KEY, count=batch):
+            work_ids.append(work_id.decode() if isinstance(work_id, bytes) else work_id)
+            total += 1
+            if len(work_ids) >= batch:
+                await flush()
+        if work_ids:
+            await flush()
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for dimension, values in counts.items():
+                key = STATS_WORKS_KEY.format(dimension=dimension)
+                pipe.delete(key)
+                if values:
+                    pipe.hset(key, mapping=values)
+            await pipe.execute()
+        logger.info(f"Счетчики статистики пересчитаны: {total} работ")
+        return total
+
+
+def _split_values(value: Optional[str]) -> List[str]:
+    """Значения поля со списком через запятую (фандомы, рейтинги)"""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 
 # Глобальный экземпляр для использования в приложении
 redis_connector = RedisConnector(Config.REDIS_URL)
@@ -7,6 +7,10 @@ class UpdateReason(Enum):
     NEW = "new"
     AUTHOR = "author"
     CHAPTER = "chapter"
+    TITLE = "title"
+    WORDS = "words"
+    TAGS = "tags"
+    SUMMARY = "summary"
 
 
 class Source(Enum):
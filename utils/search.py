@@ -0,0 +1,369 @@
+"""
+Поиск по сохраненным работам
+
+Индекс хранится в Redis и обновляется при записи метаданных
+(RedisConnector._index_work): для каждого терма - sorted set работ с весом
+совпадения, для значений рейтинга и языка - множества работ, для объема -
+sorted set работ по числу слов. Запрос берет работы из самого короткого
+списка (терма, фильтра или диапазона слов) и проверяет остальные списки
+только для них (ZMSCORE, SMISMEMBER), поэтому время запроса зависит от
+самого редкого условия, а не от числа работ. Нужен Redis 6.2+.
+
+Запрос - слова и фильтры вида поле:значение:
+    драббл флафф rating:teen lang:русский words:1000-5000
+"""
+
+import heapq
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import (
+    FANFIC_IDS_KEY,
+    SEARCH_FACET_KEY,
+    SEARCH_FACET_VALUES_KEY,
+    SEARCH_TERM_KEY,
+    SEARCH_WORDS_KEY,
+    RedisConnector,
+)
+from utils.search_text import FACET_FIELDS, facet_value, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые возвращаются вместе с найденными работами
+RESULT_FIELDS = ("title", "author", "fandom", "rating", "words", "link")
+# Сколько работ запрос проверяет по остальным спискам (см. _candidates)
+MAX_CANDIDATES = 2000
+
+FILTER_ALIASES = {
+    "rating": "rating",
+    "рейтинг": "rating",
+    "lang": "language",
+    "language": "language",
+    "язык": "language",
+    "words": "words",
+    "слов": "words",
+    "слова": "words",
+}
+FILTER_RE = re.compile(r"^(\w+):(\S+)$")
+WORDS_RANGE_RE = re.compile(r"^(\d*)-(\d*)$")
+
+QUERY_SECONDS = metrics.histogram(
+    "search_query_duration_seconds",
+    "Поисковые запросы по работам",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+def _recency(work_id: str) -> int:
+    """Порядок работ по новизне: id AO3 растут со временем"""
+    return int(work_id) if work_id.isdigit() else 0
+
+
+class SearchQuery:
+    """Разобранный запрос: основы слов и фильтры"""
+
+    def __init__(
+        self,
+        terms: List[str],
+        facets: Optional[Dict[str, str]] = None,
+        words: Tuple[Optional[int], Optional[int]] = (None, None),
+    ):
+        self.terms = terms
+        # {поле: префикс значения}, например {"rating": "teen"}
+        self.facets = facets or {}
+        # (от, до) включительно; None - без ограничения
+        self.words = words
+
+    @property
+    def empty(self) -> bool:
+        return not self.terms and not self.facets and self.words == (None, None)
+
+
+def parse_query(text: str) -> SearchQuery:
+    """
+    Разбирает текст запроса
+
+    Raises:
+        ValueError: Неизвестный фильтр или неверный диапазон слов
+    """
+    words_text = []
+    facets: Dict[str, str] = {}
+    words = (None, None)
+    for part in text.split():
+        match = FILTER_RE.match(part)
+        if not match:
+            words_text.append(part)
+            continue
+        name, value = match.group(1).lower(), match.group(2)
+        field = FILTER_ALIASES.get(name)
+        if field is None:
+            raise ValueError(f"Неизвестный фильтр: {name}")
+        if field != "words":
+            facets[field] = facet_value(value.replace("_", " "))
+            continue
+        # words:1000-5000, words:1000- или words:-5000; words:1000 - от 1000
+        if value.isdigit():
+            words = (int(value), None)
+            continue
+        range_match = WORDS_RANGE_RE.match(value)
+        if not range_match or value == "-":
+            raise ValueError(f"Неверный диапазон слов: {value}")
+        low, high = (int(item) if item else None for item in range_match.groups())
+        words = (low, high)
+    return SearchQuery(
+        list(dict.fromkeys(tokenize(" ".join(words_text)))), facets, words
+    )
+
+
+class SearchIndex:
+    """Запросы к поисковому индексу работ"""
+
+    def __init__(self, redis: RedisConnector):
+        self.redis = redis
+
+    async def _facet_keys(self, facets: Dict[str, str]) -> Optional[List[List[str]]]:
+        """
+        Ключи множеств работ для фильтров; значение фильтра - префикс
+        ("teen" -> "teen and up audiences"), подходят работы с любым из
+        найденных значений
+
+        Returns:
+            [[ключ значения]] по фильтрам или None, если для какого-то фильтра
+            нет подходящих значений
+        """
+        keys = []
+        for field, prefix in facets.items():
+            values = await self.redis.redis.smembers(
+                SEARCH_FACET_VALUES_KEY.format(field=field)
+            )
+            matched = sorted(
+                value.decode() for value in values if value.decode().startswith(prefix)
+            )
+            if not matched:
+                return None
+            keys.append(
+                [SEARCH_FACET_KEY.format(field=field, value=value) for value in matched]
+            )
+        return keys
+
+    async def _candidates(
+        self, term_keys: List[str], facet_keys: List[List[str]], words: Tuple
+    ) -> Tuple[Optional[str], Dict[str, float], bool]:
+        """
+        Работы из самого короткого списка запроса
+
+        Из списка длиннее MAX_CANDIDATES берутся работы с наибольшим весом
+        терма (для фильтров - самые новые), чтобы запрос из одних частых слов
+        не превращался в перебор всех работ.
+
+        Returns:
+            (ключ терма, из которого взяты работы, или None; {work_id: вес};
+            взят ли список целиком)
+        """
+        redis = self.redis.redis
+        low, high = words
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in term_keys:
+                pipe.zcard(key)
+            for keys in facet_keys:
+                for key in keys:
+                    pipe.scard(key)
+            if words != (None, None):
+                pipe.zcount(
+                    SEARCH_WORDS_KEY,
+                    "-inf" if low is None else low,
+                    "+inf" if high is None else high,
+                )
+            sizes = iter(await pipe.execute())
+
+        sources = [(next(sizes), "term", key) for key in term_keys]
+        sources += [
+            (sum(next(sizes) for _ in keys), "facet", keys) for keys in facet_keys
+        ]
+        if words != (None, None):
+            sources.append((next(sizes), "words", None))
+        size, kind, source = min(sources, key=lambda item: item[0])
+        if not size:
+            return None, {}, True
+        complete = size <= MAX_CANDIDATES
+
+        if kind == "term":
+            members = await redis.zrevrange(
+                source, 0, MAX_CANDIDATES - 1, withscores=True
+            )
+            scores = {work_id.decode(): score for work_id, score in members}
+            return source, scores, complete
+        if kind == "facet":
+            members = await redis.sunion(source)
+        else:
+            members = await redis.zrangebyscore(
+                SEARCH_WORDS_KEY,
+                "-inf" if low is None else low,
+                "+inf" if high is None else high,
+            )
+        work_ids = [work_id.decode() for work_id in members]
+        if not complete:
+            work_ids = heapq.nlargest(MAX_CANDIDATES, work_ids, key=_recency)
+        return None, {work_id: 0.0 for work_id in work_ids}, complete
+
+    async def search(self, query: SearchQuery, limit: int = 10) -> Dict:
+        """
+        Ищет работы: все слова запроса и все фильтры должны совпасть
+
+        Returns:
+            {"total": найдено, "complete": False, если найдено не все (см.
+            _candidates), "candidates": проверено работ, "results": [{work_id,
+            score, поля RESULT_FIELDS}]} - лучшие совпадения первыми, при
+            равном весе - более новые работы
+        """
+        start = time.perf_counter()
+        await self.redis._ensure_connected()
+        found = {"total": 0, "complete": True, "candidates": 0, "results": []}
+        if query.empty:
+            return found
+        facet_keys = await self._facet_keys(query.facets)
+        if facet_keys is None:
+            return found
+        term_keys = [SEARCH_TERM_KEY.format(term=term) for term in query.terms]
+        low, high = query.words
+
+        source, scores, found["complete"] = await self._candidates(
+            term_keys, facet_keys, query.words
+        )
+        if scores:
+            # Остальные списки проверяются только для найденных работ
+            candidates = list(scores)
+            found["candidates"] = len(candidates)
+            async with self.redis.redis.pipeline(transaction=False) as pipe:
+                for key in term_keys:
+                    if key != source:
+                        pipe.zmscore(key, candidates)
+                for keys in facet_keys:
+                    for key in keys:
+                        pipe.smismember(key, candidates)
+                if query.words != (None, None):
+                    pipe.zmscore(SEARCH_WORDS_KEY, candidates)
+                checks = iter(await pipe.execute())
+
+            keep = [True] * len(candidates)
+            weights = [scores[work_id] for work_id in candidates]
+            for key in term_keys:
+                if key == source:
+                    continue
+                for position, score in enumerate(next(checks)):
+                    if score is None:
+                        keep[position] = False
+                    else:
+                        weights[position] += score
+            for keys in facet_keys:
+                matched = [False] * len(candidates)
+                for _ in keys:
+                    for position, member in enumerate(next(checks)):
+                        matched[position] = matched[position] or bool(member)
+                keep = [k and m for k, m in zip(keep, matched)]
+            if query.words != (None, None):
+                for position, count in enumerate(next(checks)):
+                    if (
+                        count is None
+                        or (low is not None and count < low)
+                        or (high is not None and count > high)
+                    ):
+                        keep[position] = False
+            scores = {
+                work_id: weight
+                for work_id, weight, kept in zip(candidates, weights, keep)
+                if kept
+            }
+
+        top = heapq.nlargest(
+            limit,
+            scores.items(),
+            key=lambda item: (item[1], _recency(item[0])),
+        )
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            for work_id, _ in top:
+                pipe.hmget(f"fanfic:metadata:{work_id}", *RESULT_FIELDS)
+            rows = await pipe.execute()
+        found["total"] = len(scores)
+        for (work_id, score), row in zip(top, rows):
+            item = {"work_id": work_id, "score": score}
+            item.update(
+                {
+                    field: value.decode()
+                    for field, value in zip(RESULT_FIELDS, row)
+                    if value is not None
+                }
+            )
+            found["results"].append(item)
+        QUERY_SECONDS.observe(time.perf_counter() - start)
+        return found
+
+    async def facet_values(self) -> Dict[str, List[str]]:
+        """Известные значения фильтров: {поле: [значение]}"""
+        await self.redis._ensure_connected()
+        values = {}
+        for field in FACET_FIELDS:
+            members = await self.redis.redis.smembers(
+                SEARCH_FACET_VALUES_KEY.format(field=field)
+            )
+            values[field] = sorted(member.decode() for member in members)
+        return values
+
+    async def rebuild(self, batch: int = 500) -> int:
+        """
+        Строит индекс заново по сохраненным метаданным
+
+        Старые ключи search:* удаляются, работы читаются по индексу fanfic:ids
+        порциями (на старых данных он сначала заполняется по ключам
+        метаданных). Пока индекс строится, поиск находит не все работы.
+
+        Returns:
+            Количество проиндексированных работ
+        """
+        await self.redis.ensure_fanfic_index()
+        redis = self.redis.redis
+        stale = []
+        async for key in redis.scan_iter(match="search:*", count=batch):
+            stale.append(key)
+            if len(stale) >= batch:
+                await redis.delete(*stale)
+                stale.clear()
+        if stale:
+            await redis.delete(*stale)
+
+        total = 0
+        work_ids = []
+
+        async def flush():
+            async with redis.pipeline(transaction=False) as pipe:
+                for work_id in work_ids:
+                    pipe.hgetall(f"fanfic:metadata:{work_id}")
+                rows = await pipe.execute()
+            async with redis.pipeline(transaction=False) as pipe:
+                for work_id, row in zip(work_ids, rows):
+                    if row:
+                        metadata = {k.decode(): v.decode() for k, v in row.items()}
+                        self.redis._index_work(pipe, work_id, None, metadata)
+                await pipe.execute()
+            work_ids.clear()
+
+        async for work_id in redis.sscan_iter(FANFIC_IDS_KEY, count=batch):
+            work_ids.append(work_id.decode() if isinstance(work_id, bytes) else work_id)
+            total += 1
+            if len(work_ids) >= batch:
+                await flush()
+        if work_ids:
+            await flush()
+        logger.info(f"Поисковый индекс построен: {total} работ")
+        return total
+
+
+def create_search(redis: RedisConnector) -> Optional[SearchIndex]:
+    """Создает поиск по настройкам Config или None, если он выключен"""
+    if not Config.SEARCH_ENABLED:
+        return None
+    return SearchIndex(redis)
@@ -0,0 +1,226 @@
+"""
+Разбор текста для поискового индекса работ
+
+Текст приводится к нижнему регистру (ё -> е), делится на слова, стоп-слова
+отбрасываются, русские слова сокращаются до основы стеммером Snowball
+(https://snowballstem.org/algorithms/russian/stemmer.html), у английских
+отбрасываются окончания множественного числа. Одна и та же функция
+разбирает и метаданные при индексации, и запрос, поэтому "фанфики"
+находят работу с "фанфик" в описании.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Поля метаданных, по которым ищется текст, и вес совпадения в каждом
+FIELD_WEIGHTS: Dict[str, int] = {
+    "title": 4,
+    "author": 3,
+    "fandom": 3,
+    "relationships": 3,
+    "characters": 3,
+    "additional_tags": 2,
+    "summary": 1,
+}
+
+# Поля для фильтров (значения через запятую)
+FACET_FIELDS = ("rating", "language")
+
+WORD_RE = re.compile(r"[^\W_]+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за
+    бы по только ее мне было вот от меня еще нет о из ему теперь когда даже ну
+    ли если уже или ни быть был него до вас нибудь опять уж вам ведь там потом
+    себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам
+    чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому
+    этого какой совсем ним здесь этом один почти мой тем чтобы нее были куда
+    зачем всех никогда можно при наконец два об другой хоть после над больше
+    тот через эти нас про всего них какая много разве три эту моя впрочем
+    хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда
+    конечно всю между
+    a an and are as at be but by for from has have he her his i in is it its
+    of on or she that the their they this to was were will with you
+    """.split())
+
+_VOWELS = "аеиоуыэюя"
+
+
+def _suffixes(words: str) -> Tuple[str, ...]:
+    """Окончания, длинные первыми (Snowball выбирает самое длинное)"""
+    return tuple(sorted(words.split(), key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND_1 = _suffixes("в вши вшись")
+_PERFECTIVE_GERUND_2 = _suffixes("ив ивши ившись ыв ывши ывшись")
+_ADJECTIVE = _suffixes(
+    "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя "
+    "ою ею"
+)
+_PARTICIPLE_1 = _suffixes("ем нн вш ющ щ")
+_PARTICIPLE_2 = _suffixes("ивш ывш ующ")
+_REFLEXIVE = _suffixes("ся сь")
+_VERB_1 = _suffixes("ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно")
+_VERB_2 = _suffixes(
+    "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует уют "
+    "ит ыт ены ить ыть ишь ую ю"
+)
+_NOUN = _suffixes(
+    "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у ах "
+    "иях ях ы ь ию ью ю ия ья я"
+)
+_SUPERLATIVE = _suffixes("ейш ейше")
+_DERIVATIONAL = _suffixes("ост ость")
+
+
+def _strip(word: str, suffixes: Tuple[str, ...]) -> Optional[str]:
+    for suffix in suffixes:
+        if word.endswith(suffix):
+            return word[: -len(suffix)]
+    return None
+
+
+def _strip_grouped(
+    word: str, group_1: Tuple[str, ...], group_2: Tuple[str, ...]
+) -> Optional[str]:
+    """
+    Убирает самое длинное окончание из двух групп; окончания первой группы -
+    только после "а" или "я", которые остаются в слове
+    """
+    best = None
+    for suffix in group_1:
+        if word.endswith(suffix) and word[: -len(suffix)].endswith(("а", "я")):
+            best = suffix
+            break
+    for suffix in group_2:
+        if word.endswith(suffix):
+            if best is None or len(suffix) > len(best):
+                best = suffix
+            break
+    return word[: -len(best)] if best else None
+
+
+def _region_after_vowel(word: str, start: int = 0) -> int:
+    """Начало области после первого сочетания гласная + согласная"""
+    for index in range(start + 1, len(word)):
+        if word[index] not in _VOWELS and word[index - 1] in _VOWELS:
+            return index + 1
+    return len(word)
+
+
+def stem_russian(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball"""
+    rv_start = next(
+        (index + 1 for index, char in enumerate(word) if char in _VOWELS), len(word)
+    )
+    r1 = _region_after_vowel(word)
+    r2 = _region_after_vowel(word, r1)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    stripped = _strip_grouped(rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stripped is not None:
+        rv = stripped
+    else:
+        stripped = _strip(rv, _REFLEXIVE)
+        if stripped is not None:
+            rv = stripped
+        stripped = _strip(rv, _ADJECTIVE)
+        if stripped is not None:
+            rv = _strip_grouped(stripped, _PARTICIPLE_1, _PARTICIPLE_2)
+            if rv is None:
+                rv = stripped
+        else:
+            stripped = _strip_grouped(rv, _VERB_1, _VERB_2)
+            if stripped is None:
+                stripped = _strip(rv, _NOUN)
+            if stripped is not None:
+                rv = stripped
+
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание убирается только в R2
+    r2_in_rv = max(r2 - rv_start, 0)
+    for suffix in _DERIVATIONAL:
+        if rv.endswith(suffix) and len(rv) - len(suffix) >= r2_in_rv:
+            rv = rv[: -len(suffix)]
+            break
+
+    # Шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        stripped = _strip(rv, _SUPERLATIVE)
+        if stripped is not None:
+            rv = stripped[:-1] if stripped.endswith("нн") else stripped
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def stem_english(word: str) -> str:
+    """Английское слово без окончания множественного числа"""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Основы слов текста без стоп-слов"""
+    terms = []
+    for word in WORD_RE.findall(text.casefold().replace("ё", "е")):
+        if (len(word) < 2 and not word.isdigit()) or word in STOP_WORDS:
+            continue
+        if CYRILLIC_RE.search(word):
+            terms.append(stem_russian(word))
+        else:
+            terms.append(stem_english(word))
+    return terms
+
+
+def document_terms(metadata: Dict) -> Dict[str, int]:
+    """
+    Термы работы с весами: вес терма - сумма весов полей, где он встречается
+    (повторы внутри поля не учитываются, чтобы длинное описание не
+    перевешивало название)
+    """
+    weights: Dict[str, int] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = metadata.get(field)
+        if not value:
+            continue
+        for term in set(tokenize(str(value))):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def facet_value(value: str) -> str:
+    """Значение фильтра в индексе: без регистра и лишних пробелов"""
+    return re.sub(r"\s+", " ", value).strip().casefold()
+
+
+def document_facets(metadata: Dict) -> Dict[str, List[str]]:
+    """Значения фильтров работы: {поле: [значение]}"""
+    return {
+        field: [
+            facet_value(item)
+            for item in (metadata.get(field) or "").split(",")
+            if item.strip()
+        ]
+        for field in FACET_FIELDS
+    }
+
+
+def document_words(metadata: Dict) -> Optional[int]:
+    """Количество слов работы или None, если оно неизвестно"""
+    words = str(metadata.get("words") or "").replace(",", "").strip()
+    return int(words) if words.isdigit() else None
@@ -0,0 +1,218 @@
+"""
+Подписки пользователей на фандомы, пейринги и персонажей
+
+Подписки хранятся в Redis как обратный индекс: для каждого тега - множество
+подписчиков (subs:tag:<вид>:<тег>). Работа сопоставляется с подписками одним
+pipeline из SMEMBERS по своим тегам, поэтому время сопоставления зависит от
+числа тегов работы и найденных подписчиков, а не от общего числа подписок.
+
+Найденным подписчикам работа ставится в личные очереди (subs:queue:<id>,
+sorted set по времени постановки: ожидающая работа второй раз не ставится),
+а id пользователей с непустой очередью - в subs:pending, откуда их забирает
+отправка личных сообщений в боте.
+"""
+
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import Config
+from utils.metrics import metrics
+from utils.redis_connector import RedisConnector
+
+logger = logging.getLogger(__name__)
+
+# Вид подписки -> поле метаданных работы со списком тегов через запятую
+KINDS: Dict[str, str] = {
+    "fandom": "fandom",
+    "relationship": "relationships",
+    "character": "characters",
+}
+
+TAG_KEY = "subs:tag:{kind}:{tag}"
+USER_KEY = "subs:user:{user_id}"
+USER_QUEUE_KEY = "subs:queue:{user_id}"
+PENDING_USERS_KEY = "subs:pending"
+
+MATCH_SECONDS = metrics.histogram(
+    "subscriptions_match_duration_seconds",
+    "Сопоставление работы с подписками",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+FANOUT_TOTAL = metrics.counter(
+    "subscriptions_fanout_total", "Работы, поставленные в личные очереди"
+)
+
+
+def normalize_tag(tag: str) -> str:
+    """Ключ тега в индексе: без регистра и лишних пробелов"""
+    return re.sub(r"\s+", " ", tag).strip().casefold()
+
+
+def work_tags(metadata: Dict) -> List[Tuple[str, str]]:
+    """Теги работы, по которым на нее можно подписаться: [(вид, тег)]"""
+    tags = []
+    for kind, field in KINDS.items():
+        for tag in (metadata.get(field) or "").split(","):
+            tag = normalize_tag(tag)
+            if tag:
+                tags.append((kind, tag))
+    return tags
+
+
+class SubscriptionIndex:
+    """Подписки пользователей и личные очереди работ"""
+
+    def __init__(self, redis: RedisConnector, max_per_user: int = 50):
+        self.redis = redis
+        self.max_per_user = max_per_user
+
+    async def subscribe(self, user_id: str, kind: str, tag: str) -> bool:
+        """
+        Подписывает пользователя на тег
+
+        Returns:
+            False, если у пользователя уже максимум подписок
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный вид подписки: {kind}")
+        key = normalize_tag(tag)
+        if not key:
+            raise ValueError("Пустой тег")
+        await self.redis._ensure_connected()
+        user_key = USER_KEY.format(user_id=user_id)
+        field = f"{kind}:{key}"
+        if not await self.redis.redis.hexists(user_key, field):
+            if await self.redis.redis.hlen(user_key) >= self.max_per_user:
+                return False
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(TAG_KEY.format(kind=kind, tag=key), user_id)
+            # Для списка подписок храним тег в написании пользователя
+            pipe.hset(user_key, field, tag.strip())
+            await pipe.execute()
+        return True
+
+    async def unsubscribe(self, user_id: str, kind: str, tag: str) -> bool:
+        """Отписывает пользователя от тега; False - подписки не было"""
+        key = normalize_tag(tag)
+        await self.redis._ensure_connected()
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(TAG_KEY.format(kind=kind, tag=key), user_id)
+            pipe.hdel(USER_KEY.format(user_id=user_id), f"{kind}:{key}")
+            removed, _ = await pipe.execute()
+        return bool(removed)
+
+    async def unsubscribe_all(self, user_id: str) -> int:
+        """Удаляет все подписки и личную очередь пользователя"""
+        await self.redis._ensure_connected()
+        user_key = USER_KEY.format(user_id=user_id)
+        fields = await self.redis.redis.hkeys(user_key)
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            for field in fields:
+                kind, key = field.decode().split(":", 1)
+                pipe.srem(TAG_KEY.format(kind=kind, tag=key), user_id)
+            pipe.delete(user_key, USER_QUEUE_KEY.format(user_id=user_id))
+            pipe.srem(PENDING_USERS_KEY, user_id)
+            await pipe.execute()
+        return len(fields)
+
+    async def list_subscriptions(self, user_id: str) -> List[Tuple[str, str]]:
+        """Подписки пользователя: [(вид, тег)]"""
+        await self.redis._ensure_connected()
+        fields = await self.redis.redis.hgetall(USER_KEY.format(user_id=user_id))
+        return sorted(
+            (field.decode().split(":", 1)[0], tag.decode())
+            for field, tag in fields.items()
+        )
+
+    async def match(self, metadata: Dict) -> Set[str]:
+        """Подписчики, которым подходит работа"""
+        tags = work_tags(metadata)
+        if not tags:
+            return set()
+        start = time.perf_counter()
+        await self.redis._ensure_connected()
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            for kind, tag in tags:
+                pipe.smembers(TAG_KEY.format(kind=kind, tag=tag))
+            results = await pipe.execute()
+        users = {
+            user.decode() if isinstance(user, bytes) else user
+            for members in results
+            for user in members
+        }
+        MATCH_SECONDS.observe(time.perf_counter() - start)
+        return users
+
+    async def fan_out(self, work_id: str, metadata: Dict) -> int:
+        """
+        Ставит работу в личные очереди подходящих подписчиков
+
+        Returns:
+            Количество подписчиков, которым работа поставлена
+        """
+        users = await self.match(metadata)
+        if not users:
+            return 0
+        now = time.time()
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            for user_id in users:
+                pipe.zadd(
+                    USER_QUEUE_KEY.format(user_id=user_id), {work_id: now}, nx=True
+                )
+            pipe.sadd(PENDING_USERS_KEY, *users)
+            await pipe.execute()
+        FANOUT_TOTAL.inc(len(users))
+        logger.debug("Work %s поставлен подписчикам: %s", work_id, len(users))
+        return len(users)
+
+    async def pending_users(self, limit: int) -> List[str]:
+        """Пользователи с непустой личной очередью (не больше limit)"""
+        await self.redis._ensure_connected()
+        users = await self.redis.redis.srandmember(PENDING_USERS_KEY, limit)
+        return [user.decode() for user in users or ()]
+
+    async def peek_user_item(self, user_id: str) -> Optional[str]:
+        """
+        Самая старая работа из личной очереди пользователя
+
+        Работа остается в очереди до ack_user_item, поэтому неудачная отправка
+        повторится в следующем проходе.
+        """
+        await self.redis._ensure_connected()
+        queue_key = USER_QUEUE_KEY.format(user_id=user_id)
+        items = await self.redis.redis.zrange(queue_key, 0, 0)
+        if not items:
+            await self._drop_pending(user_id)
+            return None
+        work_id = items[0]
+        return work_id.decode() if isinstance(work_id, bytes) else work_id
+
+    async def ack_user_item(self, user_id: str, work_id: str):
+        """Убирает отправленную работу из личной очереди пользователя"""
+        await self.redis._ensure_connected()
+        queue_key = USER_QUEUE_KEY.format(user_id=user_id)
+        async with self.redis.redis.pipeline(transaction=False) as pipe:
+            pipe.zrem(queue_key, work_id)
+            pipe.zcard(queue_key)
+            _, remaining = await pipe.execute()
+        if not remaining:
+            await self._drop_pending(user_id)
+
+    async def _drop_pending(self, user_id: str):
+        """Убирает пользователя с пустой очередью из subs:pending"""
+        # Пользователь снова попадет в список при следующей постановке.
+        # fan_out пишет очередь раньше списка, поэтому работа, поставленная
+        # между ZCARD и SREM, видна повторной проверке
+        queue_key = USER_QUEUE_KEY.format(user_id=user_id)
+        await self.redis.redis.srem(PENDING_USERS_KEY, user_id)
+        if await self.redis.redis.zcard(queue_key):
+            await self.redis.redis.sadd(PENDING_USERS_KEY, user_id)
+
+
+def create_subscriptions(redis: RedisConnector) -> Optional[SubscriptionIndex]:
+    """Создает индекс подписок по настройкам Config или None, если он выключен"""
+    if not Config.SUBSCRIPTIONS_ENABLED:
+        return None
+    return SubscriptionIndex(redis, max_per_user=Config.SUBSCRIPTIONS_MAX_PER_USER)
@@ -0,0 +1,291 @@
+"""
+Легковесная трассировка: спаны с контекстом в contextvars, пропагация через
+заголовок W3C traceparent и экспорт в JSONL файл или OTLP/HTTP (JSON) коллектор
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class SpanContext:
+    """Идентификаторы трассы и спана"""
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_traceparent(cls, traceparent: str) -> Optional["SpanContext"]:
+        try:
+            _, trace_id, span_id, _ = traceparent.split("-")
+            if len(trace_id) == 32 and len(span_id) == 16:
+                return cls(trace_id, span_id)
+        except (ValueError, AttributeError):
+            pass
+        return None
+
+
+class Span:
+    """Один спан трассы"""
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional[SpanContext]):
+        self.tracer = tracer
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.context = SpanContext(
+            parent.trace_id if parent else secrets.token_hex(16),
+            secrets.token_hex(8),
+        )
+        self.attributes: Dict = {}
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def start(self) -> "Span":
+        """
+        Начинает спан, не делая его текущим
+
+        Для работы, которая проходит через несколько задач (стадии конвейера
+        парсера): дочерние спаны получают parent=span.context явно.
+        """
+        self.start_ns = time.time_ns()
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        """Завершает спан, начатый start()"""
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        self.start()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Спан-заглушка, когда трассировка выключена"""
+
+    context = None
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def start(self) -> "_NoopSpan":
+        return self
+
+    def end(self, error: Optional[BaseException] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """Экспорт спанов построчно в JSONL файл"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Dict]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+
+class OTLPHttpSpanExporter:
+    """Экспорт спанов в OTLP/HTTP коллектор в JSON кодировке"""
+
+    def __init__(self, endpoint: str, service_name: str = "rmt-ao3-rss"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    @staticmethod
+    def _attribute(key: str, value) -> Dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def export(self, spans: List[Dict]):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            self._attribute("service.name", self.service_name)
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "rmt_ao3_rss"},
+                            "spans": [
+                                {
+                                    "traceId": span["trace_id"],
+                                    "spanId": span["span_id"],
+                                    "parentSpanId": span["parent_id"] or "",
+                                    "name": span["name"],
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span["start_ns"]),
+                                    "endTimeUnixNano": str(span["end_ns"]),
+                                    "attributes": [
+                                        self._attribute(key, value)
+                                        for key, value in span["attributes"].items()
+                                    ],
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
+class Tracer:
+    """Трассировщик с фоновой отправкой завершенных спанов"""
+
+    def __init__(self, exporter=None, batch_size: int = 256):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        if self.enabled:
+            self._thread = threading.Thread(
+                target=self._export_loop, name="span-exporter", daemon=True
+            )
+            self._thread.start()
+
+    def span(self, name: str, parent: Optional[SpanContext] = None, **attributes):
+        """
+        Создает спан (контекстный менеджер)
+
+        Args:
+            name: Имя стадии
+            parent: Явный родитель (например, из traceparent элемента очереди),
+                по умолчанию - текущий спан из контекста
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current else None
+        span = Span(self, name, parent)
+        span.attributes.update(attributes)
+        return span
+
+    def current_traceparent(self) -> Optional[str]:
+        """Возвращает traceparent текущего спана для передачи через очередь"""
+        current = _current_span.get()
+        return current.context.to_traceparent() if current else None
+
+    def _finish(self, span: Span):
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            # Экспорт не должен тормозить основной цикл - теряем спан
+            pass
+
+    def _export_loop(self):
+        while True:
+            batch = []
+            item = self._queue.get()
+            if item is None:
+                return
+            batch.append(item)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=1)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._export(batch)
+                    return
+                batch.append(item)
+            self._export(batch)
+
+    def _export(self, batch: List[Dict]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.error(f"Ошибка экспорта спанов: {e}")
+
+    def shutdown(self):
+        """Дожидается экспорта оставшихся спанов"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+
+def create_tracer() -> Tracer:
+    """Создает трассировщик по настройкам Config"""
+    if not Config.TRACING_ENABLED:
+        return Tracer()
+    if Config.TRACING_EXPORTER == "otlp":
+        return Tracer(OTLPHttpSpanExporter(Config.TRACING_OTLP_ENDPOINT))
+    return Tracer(FileSpanExporter(Config.TRACING_FILE))
+
+
+# Глобальный трассировщик приложения
+tracer = create_tracer()